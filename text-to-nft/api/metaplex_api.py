@@ -1,10 +1,25 @@
+import hashlib
+import hmac
 import json
+from collections import Counter
 from typing import Any, Optional
 from cryptography.fernet import Fernet
+from solana.rpc.commitment import Confirmed, Finalized
+from solders.address_lookup_table_account import AddressLookupTableAccount
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey as PublicKey
-from metaplex.transactions import deploy, topup, mint, send, burn, update_token_metadata
-from utils.execution_engine import execute
+from spl.token.instructions import get_associated_token_address
+from metaplex.bulk import BulkItem, MINT, TRANSFER, pack
+from metaplex.lookup_tables import (
+    LOOKUP_TABLE_ADDRESSES,
+    LOOKUP_TABLES_ENABLED,
+    STATIC_ADDRESSES,
+    get_lookup_tables,
+)
+from metaplex.transactions import deploy, topup, mint, create_and_mint, send, burn, update_token_metadata
+from utils.compute_budget import COMPUTE_BUDGET_ENABLED
+from utils.execution_engine import MAX_IN_FLIGHT, execute, execute_many
+from utils.rpc import get_rpc_client
 
 
 class MetaplexAPI:
@@ -15,6 +30,70 @@ class MetaplexAPI:
         self.private_key = self.keypair.to_bytes_array()
         self.cipher = Fernet(cfg["DECRYPTION_KEY"])
 
+    def _lookup_tables(self, api_endpoint: str) -> Optional[list[AddressLookupTableAccount]]:
+        """
+        The SOLANA_LOOKUP_TABLE_ADDRESSES tables for a single transaction. Without any it goes
+        out as a legacy one; single transactions never create or scan for tables.
+        """
+        if not LOOKUP_TABLE_ADDRESSES:
+            return None
+        try:
+            return get_lookup_tables(api_endpoint, self.keypair).configured() or None
+        except Exception as e:
+            print(f"Lookup tables unavailable, sending legacy transactions: {e}")
+            return None
+
+    def _bulk_lookup_tables(
+        self, api_endpoint: str, addresses: list[PublicKey]
+    ) -> Optional[list[AddressLookupTableAccount]]:
+        """
+        With SOLANA_LOOKUP_TABLES set, this wallet's lookup tables, extended with `addresses` and the
+        program accounts every transaction uses. Without them transactions go out as legacy ones.
+        """
+        if not LOOKUP_TABLES_ENABLED:
+            return None
+        try:
+            return get_lookup_tables(api_endpoint, self.keypair).ensure(STATIC_ADDRESSES + addresses)
+        except Exception as e:
+            print(f"Lookup tables unavailable, sending legacy transactions: {e}")
+            return None
+
+    def release_lookup_tables(self, api_endpoint: str) -> str:
+        """
+        Deactivate this wallet's lookup tables and close those deactivated long enough ago,
+        reclaiming their rent. Call again after the cooldown to close the rest.
+        """
+        try:
+            deactivated, closed = get_lookup_tables(api_endpoint, self.keypair).release()
+            return json.dumps(
+                {"deactivated": [str(t) for t in deactivated], "closed": [str(t) for t in closed], "status": 200}
+            )
+        except:
+            return json.dumps({"status": 400})
+
+    def mint_keypair(self, idempotency_key: str) -> Keypair:
+        """
+        The mint account for one idempotency key, derived from this wallet's secret. Every retry
+        of a job builds the same mint address, so at most one of its transactions can create it.
+        """
+        seed = hmac.new(self.keypair.secret(), f"mint:{idempotency_key}".encode(), hashlib.sha256).digest()
+        return Keypair.from_seed(seed)
+
+    def _existing_mint(self, api_endpoint: str, mint_account: Optional[Keypair], finalized: bool) -> Optional[str]:
+        """
+        The create_and_mint response for a mint account that already exists, with the signature of
+        the transaction that created it. None if there is no such account (yet).
+        """
+        if mint_account is None:
+            return None
+        client = get_rpc_client(api_endpoint, Finalized if finalized else Confirmed)
+        if client.get_account_info(mint_account.pubkey()).value is None:
+            return None
+        # Newest first; a mint created by create_and_mint has only a handful
+        signatures = client.get_signatures_for_address(mint_account.pubkey()).value
+        signature = str(signatures[-1].signature) if signatures else None
+        return json.dumps({"contract": str(mint_account.pubkey()), "result": signature, "status": 200})
+
     def wallet(self):
         """Generate a wallet and return the address and private key."""
         keypair = Keypair()
@@ -52,6 +131,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
             if resp is None:
                 raise Exception("Failed to deploy")
@@ -84,6 +164,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
             if resp is None:
                 raise Exception("Failed to topup")
@@ -122,6 +203,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
             if resp is None:
                 return json.dumps({"status": 400})
@@ -131,6 +213,123 @@ class MetaplexAPI:
         except:
             return json.dumps({"status": 400})
 
+    def create_and_mint(
+        self,
+        api_endpoint: str,
+        name: str,
+        symbol: str,
+        fees: int,
+        dest_key: str,
+        link: str,
+        max_retries: int = 3,
+        skip_confirmation: bool = False,
+        max_timeout: int = 60,
+        target: int = 20,
+        finalized: bool = True,
+        supply: int = 1,
+        idempotency_key: Optional[str] = None,
+    ) -> str:
+        """
+        Deploy a contract with its final metadata and mint the NFT to `dest_key` in a single transaction.
+        With `idempotency_key` the mint account is derived from it (see mint_keypair), and a retry
+        whose mint already exists returns the transaction that created it instead of minting again.
+        Returns status code of success or fail, the contract address, and the native transaction data.
+        """
+        mint_account = self.mint_keypair(idempotency_key) if idempotency_key else None
+        try:
+            existing = self._existing_mint(api_endpoint, mint_account, finalized)
+            if existing is not None:
+                return existing
+            tx, signers, contract = create_and_mint(
+                api_endpoint, self.keypair, name, symbol, fees, dest_key, link, supply=supply, mint_account=mint_account
+            )
+            resp = execute(
+                api_endpoint,
+                tx,
+                signers,
+                max_retries=max_retries,
+                skip_confirmation=skip_confirmation,
+                max_timeout=max_timeout,
+                target=target,
+                finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
+            )
+            if resp is None:
+                raise Exception("Failed to create and mint")
+            result: dict[str, Any] = json.loads(resp.to_json())
+            result["contract"] = contract
+            result["status"] = 200
+            return json.dumps(result)
+        except:
+            try:
+                # An earlier attempt may have landed after all, failing this one on the existing mint account
+                return self._existing_mint(api_endpoint, mint_account, finalized) or json.dumps({"status": 400})
+            except:
+                return json.dumps({"status": 400})
+
+    def bulk(
+        self,
+        api_endpoint: str,
+        items: list[BulkItem],
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_retries: int = 3,
+        skip_confirmation: bool = False,
+        max_timeout: int = 60,
+        target: int = 20,
+        finalized: bool = True,
+    ) -> str:
+        """
+        Mint or transfer one token to each receiver, packing the items into as few transactions as fit
+        and submitting them in parallel. Returns a status per item, with the signature of the
+        transaction that carried it.
+        """
+        try:
+            # The collection's mints (and our token accounts, for transfers) repeat across receivers.
+            # Only those that do are worth the rent of a table slot.
+            collection: Counter[PublicKey] = Counter()
+            for item in items:
+                contract = PublicKey.from_string(item.contract)
+                collection[contract] += 1
+                if item.mode == TRANSFER:
+                    collection[get_associated_token_address(self.keypair.pubkey(), contract)] += 1
+            repeated = [address for address, count in collection.items() if count >= 2]
+            lookup_tables = self._bulk_lookup_tables(api_endpoint, repeated)
+            batches = pack(
+                self.keypair, items, reserve_compute_budget=COMPUTE_BUDGET_ENABLED, lookup_tables=lookup_tables
+            )
+            responses = execute_many(
+                api_endpoint,
+                [(tx, [self.keypair]) for tx, _ in batches],
+                max_in_flight=max_in_flight,
+                max_retries=max_retries,
+                skip_confirmation=skip_confirmation,
+                max_timeout=max_timeout,
+                target=target,
+                finalized=finalized,
+                lookup_tables=lookup_tables,
+            )
+            results = []
+            for (_, batch), resp in zip(batches, responses):
+                for item in batch:
+                    result: dict[str, Any] = {"contract": item.contract, "receiver": item.receiver}
+                    if resp is None:
+                        result["status"] = 400
+                    else:
+                        result["result"] = str(resp.value)
+                        result["status"] = 200
+                    results.append(result)
+            return json.dumps({"results": results, "transactions": len(batches), "status": 200})
+        except:
+            return json.dumps({"status": 400})
+
+    def bulk_mint(self, api_endpoint: str, items: list[tuple[str, str]], **kwargs) -> str:
+        """Mint 1 of each contract (minted by this wallet) to its receiver, for a list of (contract, receiver)."""
+        return self.bulk(api_endpoint, [BulkItem(contract, receiver, MINT) for contract, receiver in items], **kwargs)
+
+    def bulk_transfer(self, api_endpoint: str, items: list[tuple[str, str]], **kwargs) -> str:
+        """Airdrop this wallet's token of each contract to its receiver, for a list of (contract, receiver)."""
+        return self.bulk(api_endpoint, [BulkItem(contract, receiver, TRANSFER) for contract, receiver in items], **kwargs)
+
     def update_token_metadata(
         self,
         api_endpoint: str,
@@ -171,6 +370,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
 
             if resp is None:
@@ -218,6 +418,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
             if resp is None:
                 raise Exception("Failed to send")
@@ -256,6 +457,7 @@ class MetaplexAPI:
                 max_timeout=max_timeout,
                 target=target,
                 finalized=finalized,
+                lookup_tables=self._lookup_tables(api_endpoint),
             )
             if resp is None:
                 raise Exception("Failed to burn")
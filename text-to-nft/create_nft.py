@@ -1,11 +1,21 @@
 import os
 import json
+from typing import Optional
 from cryptography.fernet import Fernet
 from api.metaplex_api import MetaplexAPI
 from get_api_key import get_api_key
 
+# One RPC URL, or several separated by commas to spread requests over an endpoint pool
+api_endpoint = os.getenv("SOLANA_RPC_URLS", "https://api.testnet.solana.com/")
 
-def create_nft(name, symbol, receiver_public_key: str, link: str) -> None:
+_metaplex_api: Optional[MetaplexAPI] = None
+
+
+def metaplex_api() -> MetaplexAPI:
+    """Process-wide MetaplexAPI for the configured wallet, built on first use."""
+    global _metaplex_api
+    if _metaplex_api is not None:
+        return _metaplex_api
     PRIVATE_KEY = get_api_key("text_to_nft/private_key") # os.getenv("PRIVATE_KEY")
     PUBLIC_KEY = get_api_key("text_to_nft/public_key") # os.getenv("PUBLIC_KEY")
 
@@ -14,38 +24,35 @@ def create_nft(name, symbol, receiver_public_key: str, link: str) -> None:
         "PUBLIC_KEY": PUBLIC_KEY,
         "DECRYPTION_KEY": Fernet.generate_key().decode("ascii"),
     }
-    api_endpoint = "https://api.testnet.solana.com/"
-
-    # Create API
-    metaplex_api = MetaplexAPI(cfg)
-
-    # Deploy
-    print("About to deploy")
-    deploy_response = json.loads(metaplex_api.deploy(api_endpoint, name, symbol, 0))
-    print(f"Deploy response: {deploy_response}")
-    if deploy_response["status"] != 200:
-        raise Exception("Non-200 response: " + str(deploy_response))
-    contract = deploy_response.get("contract")
-    if not contract:
-        raise Exception("No contract in response")
-
-    # Mint
-    print("About to mint")
+    _metaplex_api = MetaplexAPI(cfg)
+    return _metaplex_api
+
+
+def mint_address(idempotency_key: str) -> str:
+    """The mint (contract) address create_and_mint_nft uses for `idempotency_key`."""
+    return str(metaplex_api().mint_keypair(idempotency_key).pubkey())
+
+
+def create_and_mint_nft(
+    name: str, symbol: str, receiver_public_key: str, link: str, idempotency_key: Optional[str] = None
+) -> tuple[str, Optional[str]]:
     """
-    contract_key: (str) The base58 encoded public key of the mint address
-    dest_key: (str) The base58 encoded public key of the destinaion address (where the contract will be minted)
-    link: (str) The link to the content of the the NFT
+    Deploy and mint in one transaction, with `link` written at creation. Retries with the same
+    `idempotency_key` reuse one mint address and never mint twice.
+    Returns the mint (contract) address and the transaction signature.
     """
-    mint_response = json.loads(
-        metaplex_api.mint(
-            api_endpoint,
-            contract,
-            receiver_public_key,
-            link,
+    print("About to deploy and mint")
+    response = json.loads(
+        metaplex_api().create_and_mint(
+            api_endpoint, name, symbol, 0, receiver_public_key, link, idempotency_key=idempotency_key
         )
     )
-    print(f"Mint response: {mint_response}")
-    if mint_response["status"] != 200:
-        raise Exception("Non-200 response: " + str(mint_response))
+    print(f"Create and mint response: {response}")
+    if response["status"] != 200:
+        raise Exception("Non-200 response: " + str(response))
+    return response["contract"], response.get("result")
 
+
+def create_nft(name, symbol, receiver_public_key: str, link: str) -> None:
+    create_and_mint_nft(name, symbol, receiver_public_key, link)
     print("Success!")
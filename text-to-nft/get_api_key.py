@@ -1,28 +1,166 @@
 import json
+import os
+import threading
+import time
+from typing import Any, Optional
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+from utils.metrics import metrics
 
 key_map = {
     "text_to_nft/stability_api_key": "STABILITY_API_KEY",
     "text_to_nft/nft_storage_api_key": "NFT_STORAGE_API_KEY"
 }
 
+REGION_NAME = "us-west-1"
+SECRET_PREFIX = "text_to_nft/"
 
-def get_api_key(secret_name: str) -> str:
-    region_name = "us-west-1"
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
+class SecretStore:
+    """
+    Process-wide cache of the text_to_nft/* secrets.
+    All secrets under the prefix are fetched with one BatchGetSecretValue call and kept for `ttl` seconds.
+    Once a cached value is older than `refresh_after` seconds it is still served, but a background refresh is started.
+    If the batch call is refused (e.g. a role with only secretsmanager:GetSecretValue), secrets are fetched one by one.
+    `client` may be any object with the Secrets Manager `batch_get_secret_value`/`get_secret_value` methods.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        prefix: str = SECRET_PREFIX,
+        ttl: float = 3600,
+        refresh_after: Optional[float] = None,
+        region_name: str = REGION_NAME,
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.refresh_after = ttl * 0.8 if refresh_after is None else refresh_after
+        self.region_name = region_name
+        self._client = client
+        self._secrets: dict[str, str] = {}
+        # Secrets outside the prefix, fetched one by one: name -> (value, fetched_at)
+        self._fallback: dict[str, tuple[str, float]] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # Held while an expired cache is fetched again, so concurrent get()s wait for one fetch
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def client(self) -> Any:
+        # Create the Secrets Manager client once and reuse it for every fetch
+        if self._client is None:
+            session = boto3.session.Session()
+            self._client = session.client(
+                service_name="secretsmanager", region_name=self.region_name
+            )
+        return self._client
+
+    def refresh(self) -> None:
+        """Fetch every secret under the prefix in one batched request (following NextToken pages)."""
+        secrets: dict[str, str] = {}
+        kwargs: dict[str, Any] = {
+            "Filters": [{"Key": "name", "Values": [self.prefix]}],
+            "MaxResults": 20,
+        }
+        with metrics.timer("secrets_fetch"):
+            while True:
+                response = self.client.batch_get_secret_value(**kwargs)
+                for secret in response.get("SecretValues", []):
+                    if "SecretString" in secret:
+                        secrets[secret["Name"]] = secret["SecretString"]
+                for error in response.get("Errors", []):
+                    print(f"Failed to fetch secret {error.get('SecretId')}: {error.get('Message')}")
+                next_token = response.get("NextToken")
+                if not next_token:
+                    break
+                kwargs["NextToken"] = next_token
+        with self._lock:
+            self._secrets.update(secrets)
+            self._fetched_at = time.monotonic()
+
+    def prefetch(self) -> None:
+        """Warm the cache during Lambda init. Failures are deferred to the first get()."""
+        try:
+            self.refresh()
+        except (BotoCoreError, ClientError) as e:
+            print(f"Failed to prefetch secrets: {e}")
+
+    def _age(self) -> Optional[float]:
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def _refresh_expired(self) -> None:
+        with self._refresh_lock:
+            age = self._age()
+            if age is not None and age < self.ttl:
+                # Another thread refreshed while we waited
+                return
+            try:
+                self.refresh()
+            except ClientError as e:
+                # Not allowed to batch: get() looks secrets up one by one until the ttl runs out
+                print(f"Batched secret fetch failed, fetching secrets one by one: {e}")
+                with self._lock:
+                    self._fetched_at = time.monotonic()
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run() -> None:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Background secret refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
 
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, secret_name: str) -> str:
+        """Return the SecretString for `secret_name`, fetching or refreshing the cache as needed."""
+        age = self._age()
+        if age is None or age >= self.ttl:
+            self._refresh_expired()
+        elif age >= self.refresh_after:
+            self._refresh_in_background()
+
+        with self._lock:
+            secret_string = self._secrets.get(secret_name)
+            fallback = self._fallback.get(secret_name)
+        if secret_string is not None:
+            return secret_string
+        if fallback is not None and time.monotonic() - fallback[1] < self.ttl:
+            return fallback[0]
+
+        # Not covered by the batch (outside the prefix, or the batch call was refused): fall
+        # back to a single lookup, kept for `ttl` like the batch
         # For a list of exceptions thrown, see
         # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        raise e
+        get_secret_value_response = self.client.get_secret_value(SecretId=secret_name)
+        secret_string = get_secret_value_response["SecretString"]
+        with self._lock:
+            self._fallback[secret_name] = (secret_string, time.monotonic())
+        return secret_string
+
+    def clear(self) -> None:
+        with self._lock:
+            self._secrets.clear()
+            self._fallback.clear()
+            self._fetched_at = None
 
+
+secret_store = SecretStore(ttl=float(os.getenv("SECRET_CACHE_TTL", "3600")))
+
+
+def get_api_key(secret_name: str) -> str:
     # Decrypts secret using the associated KMS key.
-    secret = json.loads(get_secret_value_response["SecretString"])
+    secret = json.loads(secret_store.get(secret_name))
     key_name = key_map.get(secret_name, "key")
     return secret[key_name]
@@ -1,10 +1,46 @@
-from create_nft import create_nft
-from text2img import text2img
-from get_nftstorage_cid import get_nftstorage_cid
-from upload_json_nftstorage import upload_json_nftstorage
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, NamedTuple, Optional
+from text2img import text2img_buffer
+from upload_bundle_nftstorage import pack_bundle, upload_bundle
+from get_api_key import secret_store
+from storage.backends import get_backend
+from storage.car import Bundle
+from storage.jobs import SUCCEEDED, get_job_store
+from utils.metrics import metrics
+from utils.pipeline import Pipeline
 
+# Deploy and mint on chain as part of the handler (off until minting is switched on)
+MINT_ENABLED = os.getenv("MINT_ENABLED", "").lower() in ("1", "true", "yes")
 
-def lambda_handler(event, context):
+# The solana/solders/spl stack is most of the import time, so it is only loaded when minting
+if MINT_ENABLED:
+    from create_nft import create_and_mint_nft, mint_address
+
+# Fetch all text_to_nft/* secrets and build the storage backend once during Lambda init
+secret_store.prefetch()
+get_backend()
+
+# How many records of an SQS batch are worked on at once, and how many of them may be
+# inside each stage at the same time. mint is bounded by the chain submission limit.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+STAGE_LIMITS = {
+    "generate": threading.BoundedSemaphore(int(os.getenv("GENERATE_CONCURRENCY", "4"))),
+    "upload": threading.BoundedSemaphore(int(os.getenv("UPLOAD_CONCURRENCY", "8"))),
+    "mint": threading.BoundedSemaphore(int(os.getenv("CHAIN_CONCURRENCY", "4"))),
+}
+
+
+class Job(NamedTuple):
+    text: str
+    name: str
+    symbol: str
+    receiver_public_key: str
+
+
+def parse_job(event: dict[str, Any]) -> Job:
     text = event.get("text")
     if not text:
         raise Exception("text not found in event")
@@ -17,17 +53,181 @@ def lambda_handler(event, context):
     receiver_public_key = event.get("receiver_public_key")
     if not receiver_public_key:
         raise Exception("receiver_public_key not found in event")
+    return Job(text, name, symbol, receiver_public_key)
+
+
+def _checkpoint(name: str, result: Any) -> Optional[dict[str, Any]]:
+    """
+    What a retry needs from each finished stage. generate and pack are cheap to redo from the
+    image cache, but pack records its root CID so a retry can check it rebuilt the same CAR.
+    """
+    if name in ("pack", "upload"):
+        return {
+            "root_cid": result.root_cid,
+            "imgURI": result.image_uris[0],
+            "metadataURI": result.metadata_uris[0],
+        }
+    if name == "mint":
+        contract, signature = result
+        return {"contract": contract, "signature": signature}
+    return None
+
+
+def _restore(stages: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """Turn stored checkpoints back into stage results for Pipeline.run(completed=...)."""
+    completed: dict[str, Any] = {}
+    if "upload" in stages:
+        upload = stages["upload"]
+        # Already uploaded: mint only needs the URIs, so no CAR is kept
+        bundle = Bundle(upload["root_cid"], None, [upload["imgURI"]], [upload["metadataURI"]])
+        completed["pack"] = completed["upload"] = bundle
+    if "mint" in stages and not stages["mint"].get("pending"):
+        completed["mint"] = (stages["mint"]["contract"], stages["mint"]["signature"])
+    return completed
+
+
+def run_job(
+    job: Job,
+    limits: Optional[dict[str, threading.Semaphore]] = None,
+    idempotency_key: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Run one job through the stage graph. With an idempotency key the job is claimed in the
+    job store first: a key that already succeeded returns its stored result, and a retry of
+    a failed job resumes after its last checkpointed stage.
+    """
+    completed: dict[str, Any] = {}
+    stages: dict[str, dict[str, Any]] = {}
+    store = get_job_store() if idempotency_key else None
+    if store is not None:
+        item = store.claim(idempotency_key, job._asdict())
+        if item["status"] == SUCCEEDED:
+            print(f"Job {idempotency_key} already succeeded")
+            return item["result"]
+        stages = item["stages"]
+        completed = _restore(stages)
+        if completed:
+            print(f"Resuming job {idempotency_key} after {sorted(completed)}")
+
+    def on_result(name: str, result: Any) -> None:
+        output = _checkpoint(name, result)
+        if store is not None and output is not None:
+            store.checkpoint(idempotency_key, name, output)
 
-    generated_image_path = text2img(text)
-    # generated_image_path = "./tmp/txt2img_zen temple.png"
-    print(f"generated_image_path: {generated_image_path}")
-    cid = get_nftstorage_cid(generated_image_path)
-    imgURI = f"https://ipfs.io/ipfs/{cid}"
-    description = f"Created by Stability AI using the text: {text}"
+    description = f"Created by Stability AI using the text: {job.text}"
+
+    def pack(generate):
+        # The CIDs and URIs are computed locally, so minting can start before the upload finishes
+        with generate as image:
+            bundle = pack_bundle(image, job.name, description, job.symbol)
+        packed = stages.get("pack")
+        if packed is not None and bundle.root_cid != packed["root_cid"]:
+            # The cached image was evicted and regenerated differently. That is only a
+            # problem if something on chain may already point at the first bundle.
+            if "mint" in stages:
+                bundle.car.close()
+                raise Exception(f"Rebuilt bundle {bundle.root_cid} does not match minted {packed['root_cid']}")
+            print(f"Rebuilt bundle {bundle.root_cid} replaces {packed['root_cid']}")
+        return bundle
+
+    def mint(pack):
+        if store is not None:
+            # Recorded before submitting: a retry checks this mint account before building another
+            contract = mint_address(idempotency_key)
+            store.checkpoint(idempotency_key, "mint", {"contract": contract, "pending": True})
+        return create_and_mint_nft(
+            job.name, job.symbol, job.receiver_public_key, pack.metadata_uris[0], idempotency_key=idempotency_key
+        )
+
+    # generate -> pack, then upload and mint (one create-and-mint transaction) side by side:
+    # pack computes the metadata JSON's URI locally, so the token can point at it before the
+    # upload finishes. The job only succeeds once both are done, and the pack checkpoint makes
+    # a retry upload exactly the bundle an earlier mint points at.
+    pipeline = Pipeline(limits=limits)
+    pipeline.add("generate", lambda: text2img_buffer(job.text))
+    pipeline.add("pack", pack, deps=("generate",))
+    pipeline.add("upload", lambda pack: upload_bundle(pack), deps=("pack",))
+    if MINT_ENABLED:
+        pipeline.add("mint", mint, deps=("pack",))
+    try:
+        results = pipeline.run(completed, on_result=on_result)
+    except Exception as e:
+        if store is not None:
+            store.fail(idempotency_key, str(e))
+        raise
+
+    bundle = results["upload"]
+    imgURI, metadataURI = bundle.image_uris[0], bundle.metadata_uris[0]
     print(f"imgURI: {imgURI}")
-    upload_json_nftstorage(name, description, symbol, imgURI)
+    print(f"metadataURI: {metadataURI}")
+    contract, signature = results.get("mint", (None, None))
+    result = {
+        "imgURI": imgURI,
+        "metadataURI": metadataURI,
+        "contract": contract,
+        "signature": signature,
+    }
+    if store is not None:
+        store.complete(idempotency_key, result)
+    return result
+
+
+def _set_request_id(context) -> None:
+    request_id = getattr(context, "aws_request_id", None)
+    if request_id is not None:
+        metrics.set_property("requestId", request_id)
+
+
+def lambda_handler(event, context):
+    _set_request_id(context)
+    try:
+        with metrics.timer("job"):
+            return run_job(parse_job(event), idempotency_key=event.get("idempotency_key"))
+    finally:
+        metrics.flush()
+
+
+def batch_handler(event, context):
+    """
+    SQS entry point (with ReportBatchItemFailures enabled). Every record body is one
+    lambda_handler event. Records are validated up front and then processed concurrently,
+    bounded per stage by STAGE_LIMITS. Only the records that failed, including ones that
+    failed validation, are reported back so SQS retries them (or moves them to the DLQ).
+    """
+    _set_request_id(context)
+    records = event.get("Records", [])
+    failures: list[str] = []
+    try:
+        jobs: dict[str, tuple[Job, str]] = {}
+        for record in records:
+            message_id = record["messageId"]
+            try:
+                body = json.loads(record["body"])
+                # SQS redelivers a message with the same id, so it doubles as the idempotency key
+                jobs[message_id] = (parse_job(body), body.get("idempotency_key") or message_id)
+            except Exception as e:
+                print(f"Invalid record {message_id}: {e}")
+                failures.append(message_id)
+
+        with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(run_job, job, STAGE_LIMITS, idempotency_key): message_id
+                for message_id, (job, idempotency_key) in jobs.items()
+            }
+            for future in as_completed(futures):
+                message_id = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Record {message_id} failed: {e}")
+                    failures.append(message_id)
 
-    # create_nft(name, symbol, receiver_public_key, imgURI)
+        print(f"Processed {len(records) - len(failures)} of {len(records)} records")
+        metrics.count("records_processed", len(records) - len(failures))
+        metrics.count("records_failed", len(failures))
+    finally:
+        metrics.flush()
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
 
 
 if __name__ == "__main__":
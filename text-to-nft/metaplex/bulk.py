@@ -0,0 +1,143 @@
+from typing import NamedTuple, Optional
+from solana.transaction import Transaction
+from solders.address_lookup_table_account import AddressLookupTableAccount
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import Message, MessageV0, to_bytes_versioned
+from solders.pubkey import Pubkey as PublicKey
+from spl.token.instructions import (
+    get_associated_token_address,
+    mint_to,
+    MintToParams,
+    transfer as spl_transfer,
+    TransferParams as SPLTransferParams,
+)
+from metaplex.metadata import create_associated_token_account_instruction, TOKEN_PROGRAM_ID
+
+# Largest serialized transaction a validator accepts (IPv6 MTU minus headers)
+PACKET_DATA_SIZE = 1232
+# Accounts a transaction may lock
+MAX_ACCOUNTS = 64
+# Per-transaction compute ceiling, and a conservative cost of one item
+# (idempotent ATA create plus mint_to or transfer)
+MAX_COMPUTE_UNITS = 1_400_000
+ITEM_COMPUTE_UNITS = 40_000
+
+MINT = "mint"
+TRANSFER = "transfer"
+
+
+class BulkItem(NamedTuple):
+    """
+    One token for one receiver. MINT mints 1 of `contract` (whose mint authority is the
+    source account); TRANSFER sends the source account's token of `contract`.
+    """
+
+    contract: str
+    receiver: str
+    mode: str = MINT
+
+
+def item_instructions(source_account: Keypair, item: BulkItem) -> list[Instruction]:
+    mint_account = PublicKey.from_string(item.contract)
+    user_account = PublicKey.from_string(item.receiver)
+    associated_token_account = get_associated_token_address(user_account, mint_account)
+    # The instruction is CreateIdempotent, so no lookup is needed to know whether the account exists
+    instructions = [
+        create_associated_token_account_instruction(
+            associated_token_account=associated_token_account,
+            payer=source_account.pubkey(),
+            wallet_address=user_account,
+            token_mint_address=mint_account,
+        )
+    ]
+    if item.mode == MINT:
+        instructions.append(
+            mint_to(
+                MintToParams(
+                    program_id=TOKEN_PROGRAM_ID,
+                    mint=mint_account,
+                    dest=associated_token_account,
+                    mint_authority=source_account.pubkey(),
+                    amount=1,
+                    signers=[source_account.pubkey()],
+                )
+            )
+        )
+    elif item.mode == TRANSFER:
+        instructions.append(
+            spl_transfer(
+                SPLTransferParams(
+                    program_id=TOKEN_PROGRAM_ID,
+                    source=get_associated_token_address(source_account.pubkey(), mint_account),
+                    dest=associated_token_account,
+                    owner=source_account.pubkey(),
+                    signers=[],
+                    amount=1,
+                )
+            )
+        )
+    else:
+        raise Exception(f"Unknown bulk mode: {item.mode}")
+    return instructions
+
+
+def transaction_size(
+    instructions: list[Instruction],
+    payer: PublicKey,
+    lookup_tables: Optional[list[AddressLookupTableAccount]] = None,
+) -> tuple[int, int]:
+    """
+    Exact serialized size of a transaction with these instructions, and how many accounts it
+    locks. Legacy, or v0 loading what it can from `lookup_tables`.
+    """
+    if lookup_tables:
+        message = MessageV0.try_compile(payer, instructions, lookup_tables, Hash.default())
+        size = len(to_bytes_versioned(message))
+        loaded = sum(
+            len(lookup.writable_indexes) + len(lookup.readonly_indexes) for lookup in message.address_table_lookups
+        )
+    else:
+        message = Message.new_with_blockhash(instructions, payer, Hash.default())
+        size, loaded = len(bytes(message)), 0
+    signatures = message.header.num_required_signatures
+    # Fewer than 128 signatures: the compact-u16 length prefix is one byte
+    return 1 + 64 * signatures + size, len(message.account_keys) + loaded
+
+
+def pack(
+    source_account: Keypair,
+    items: list[BulkItem],
+    reserve_compute_budget: bool = False,
+    max_size: int = PACKET_DATA_SIZE,
+    lookup_tables: Optional[list[AddressLookupTableAccount]] = None,
+) -> list[tuple[Transaction, list[BulkItem]]]:
+    """
+    Greedily pack the items' instructions into as few transactions as fit the packet size,
+    account lock and compute limits, keeping items in order. With `reserve_compute_budget`,
+    room is left for the SetComputeUnitLimit/Price instructions execute() may add. With
+    `lookup_tables`, sizes are those of the v0 transactions execute() sends with them.
+    """
+    payer = source_account.pubkey()
+    budget = [set_compute_unit_limit(0), set_compute_unit_price(0)] if reserve_compute_budget else []
+    batches: list[tuple[list[Instruction], list[BulkItem]]] = []
+    instructions: list[Instruction] = []
+    packed: list[BulkItem] = []
+    for item in items:
+        candidate = instructions + item_instructions(source_account, item)
+        size, accounts = transaction_size(budget + candidate, payer, lookup_tables)
+        fits = (
+            size <= max_size
+            and accounts <= MAX_ACCOUNTS
+            and (len(packed) + 1) * ITEM_COMPUTE_UNITS <= MAX_COMPUTE_UNITS
+        )
+        if fits or not packed:
+            instructions, packed = candidate, packed + [item]
+            continue
+        batches.append((instructions, packed))
+        instructions, packed = item_instructions(source_account, item), [item]
+    if packed:
+        batches.append((instructions, packed))
+    return [(Transaction(fee_payer=payer, instructions=ixs), batch) for ixs, batch in batches]
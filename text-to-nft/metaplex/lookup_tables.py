@@ -0,0 +1,361 @@
+import os
+import struct
+import threading
+import time
+from enum import IntEnum
+from typing import Any, Callable, Optional
+from solana.rpc.commitment import Confirmed, Finalized
+from solana.rpc.types import MemcmpOpts
+from solana.transaction import AccountMeta, Transaction
+from solders.address_lookup_table_account import AddressLookupTableAccount
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.pubkey import Pubkey as PublicKey
+from metaplex.metadata import (
+    ASSOCIATED_TOKEN_ACCOUNT_PROGRAM_ID,
+    METADATA_PROGRAM_ID,
+    SYSTEM_PROGRAM_ID,
+    SYSVAR_RENT_PUBKEY,
+    TOKEN_PROGRAM_ID,
+)
+from utils.execution_engine import execute_many
+from utils.rpc import get_rpc_client
+
+# Send bulk transactions as v0 ones loading repeated accounts from address lookup tables owned
+# by the payer. Opt-in: creating and extending tables costs rent.
+LOOKUP_TABLES_ENABLED = os.getenv("SOLANA_LOOKUP_TABLES", "").lower() in ("1", "true", "yes")
+# Existing tables single transactions (deploy, mint, send, ...) are sent with. Without any they
+# stay legacy; they never create tables or scan for them.
+LOOKUP_TABLE_ADDRESSES = [
+    PublicKey.from_string(address.strip())
+    for address in os.getenv("SOLANA_LOOKUP_TABLE_ADDRESSES", "").split(",")
+    if address.strip()
+]
+# Seconds before a failed table lookup is tried again; until then callers get an error right away.
+# Many hosted RPCs refuse getProgramAccounts, which would otherwise be retried on every bulk call.
+LOOKUP_TABLE_RETRY_INTERVAL = float(os.getenv("SOLANA_LOOKUP_TABLE_RETRY_INTERVAL", "300"))
+
+ADDRESS_LOOKUP_TABLE_PROGRAM_ID = PublicKey.from_string("AddressLookupTab1e1111111111111111111111111")
+# Table account layout: 56-byte LookupTableMeta followed by the addresses. The meta holds the
+# deactivation slot at offset 4 and the authority (an Option<Pubkey>) at offset 21.
+LOOKUP_TABLE_META_SIZE = 56
+LOOKUP_TABLE_AUTHORITY_OFFSET = 22
+# Deactivation slot of a table that is still active
+ACTIVE_DEACTIVATION_SLOT = 2**64 - 1
+# A deactivated table can only be closed once its deactivation slot left the SlotHashes sysvar
+DEACTIVATION_COOLDOWN_SLOTS = 513
+MAX_TABLE_ADDRESSES = 256
+# Addresses per extend transaction, well inside the packet size
+MAX_EXTEND_ADDRESSES = 20
+# Deactivate or close instructions per transaction
+MAX_RELEASE_TABLES = 10
+
+# Accounts almost every transaction we build passes around
+STATIC_ADDRESSES = [
+    SYSTEM_PROGRAM_ID,
+    SYSVAR_RENT_PUBKEY,
+    TOKEN_PROGRAM_ID,
+    METADATA_PROGRAM_ID,
+    ASSOCIATED_TOKEN_ACCOUNT_PROGRAM_ID,
+]
+
+
+class InstructionType(IntEnum):
+    CREATE_LOOKUP_TABLE = 0
+    EXTEND_LOOKUP_TABLE = 2
+    DEACTIVATE_LOOKUP_TABLE = 3
+    CLOSE_LOOKUP_TABLE = 4
+
+
+def derive_lookup_table_address(authority: PublicKey, recent_slot: int) -> tuple[PublicKey, int]:
+    return PublicKey.find_program_address(
+        [bytes(authority), struct.pack("<Q", recent_slot)],
+        ADDRESS_LOOKUP_TABLE_PROGRAM_ID,
+    )
+
+
+def create_lookup_table_instruction(
+    authority: PublicKey, payer: PublicKey, recent_slot: int
+) -> tuple[Instruction, PublicKey]:
+    lookup_table, bump_seed = derive_lookup_table_address(authority, recent_slot)
+    data = struct.pack("<IQB", InstructionType.CREATE_LOOKUP_TABLE, recent_slot, bump_seed)
+    keys = [
+        AccountMeta(pubkey=lookup_table, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=authority, is_signer=True, is_writable=False),
+        AccountMeta(pubkey=payer, is_signer=True, is_writable=True),
+        AccountMeta(pubkey=SYSTEM_PROGRAM_ID, is_signer=False, is_writable=False),
+    ]
+    return Instruction(ADDRESS_LOOKUP_TABLE_PROGRAM_ID, data, keys), lookup_table
+
+
+def extend_lookup_table_instruction(
+    lookup_table: PublicKey, authority: PublicKey, payer: PublicKey, new_addresses: list[PublicKey]
+) -> Instruction:
+    data = struct.pack("<IQ", InstructionType.EXTEND_LOOKUP_TABLE, len(new_addresses))
+    data += b"".join(bytes(address) for address in new_addresses)
+    keys = [
+        AccountMeta(pubkey=lookup_table, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=authority, is_signer=True, is_writable=False),
+        AccountMeta(pubkey=payer, is_signer=True, is_writable=True),
+        AccountMeta(pubkey=SYSTEM_PROGRAM_ID, is_signer=False, is_writable=False),
+    ]
+    return Instruction(ADDRESS_LOOKUP_TABLE_PROGRAM_ID, data, keys)
+
+
+def deactivate_lookup_table_instruction(lookup_table: PublicKey, authority: PublicKey) -> Instruction:
+    data = struct.pack("<I", InstructionType.DEACTIVATE_LOOKUP_TABLE)
+    keys = [
+        AccountMeta(pubkey=lookup_table, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=authority, is_signer=True, is_writable=False),
+    ]
+    return Instruction(ADDRESS_LOOKUP_TABLE_PROGRAM_ID, data, keys)
+
+
+def close_lookup_table_instruction(
+    lookup_table: PublicKey, authority: PublicKey, recipient: PublicKey
+) -> Instruction:
+    data = struct.pack("<I", InstructionType.CLOSE_LOOKUP_TABLE)
+    keys = [
+        AccountMeta(pubkey=lookup_table, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=authority, is_signer=True, is_writable=False),
+        AccountMeta(pubkey=recipient, is_signer=False, is_writable=True),
+    ]
+    return Instruction(ADDRESS_LOOKUP_TABLE_PROGRAM_ID, data, keys)
+
+
+def unpack_lookup_table_addresses(data: bytes) -> list[PublicKey]:
+    assert struct.unpack_from("<I", data)[0] == 1
+    return [
+        PublicKey.from_bytes(data[i : i + 32])
+        for i in range(LOOKUP_TABLE_META_SIZE, len(data) - 31, 32)
+    ]
+
+
+def unpack_deactivation_slot(data: bytes) -> int:
+    return struct.unpack_from("<Q", data, 4)[0]
+
+
+class LookupTableManager:
+    """
+    Address lookup tables owned by `authority` on one endpoint. The active ones are found on
+    chain (every table of the program whose authority is ours), so nothing has to survive the
+    process. ensure() looks for tables created elsewhere before creating and extending tables
+    until they hold the requested addresses, then reads the tables back so indexes match the
+    chain. configured() reads the LOOKUP_TABLE_ADDRESSES tables without scanning. A failed
+    lookup is not repeated for LOOKUP_TABLE_RETRY_INTERVAL seconds. release() deactivates the
+    tables (except configured ones) and, once they have cooled down, closes them to get their
+    rent back.
+    """
+
+    def __init__(self, api_endpoint: str, authority: Keypair):
+        self.api_endpoint = api_endpoint
+        self.authority = authority
+        self._tables: dict[PublicKey, list[PublicKey]] = {}
+        self._discovered = False
+        self._configured: Optional[list[AddressLookupTableAccount]] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _lookup(self, what: str, fn: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise Exception(f"{what} failed recently, retrying in {self._retry_at - now:.0f}s")
+        try:
+            return fn()
+        except Exception:
+            self._retry_at = now + LOOKUP_TABLE_RETRY_INTERVAL
+            raise
+
+    def _owned(self) -> dict[PublicKey, tuple[int, list[PublicKey]]]:
+        """Every table `authority` owns on chain: its deactivation slot and addresses."""
+        filters = [MemcmpOpts(offset=LOOKUP_TABLE_AUTHORITY_OFFSET, bytes=str(self.authority.pubkey()))]
+        accounts = (
+            get_rpc_client(self.api_endpoint)
+            .get_program_accounts(ADDRESS_LOOKUP_TABLE_PROGRAM_ID, commitment=Confirmed, filters=filters)
+            .value
+        )
+        owned = {}
+        for keyed in accounts:
+            data = bytes(keyed.account.data)
+            owned[keyed.pubkey] = (unpack_deactivation_slot(data), unpack_lookup_table_addresses(data))
+        return owned
+
+    def _discover(self) -> None:
+        owned = self._lookup("Lookup table discovery", self._owned)
+        self._tables = {
+            table: addresses
+            for table, (deactivation_slot, addresses) in owned.items()
+            if deactivation_slot == ACTIVE_DEACTIVATION_SLOT
+        }
+        self._discovered = True
+
+    def _refresh(self, tables: list[PublicKey]) -> None:
+        client = get_rpc_client(self.api_endpoint)
+        for i in range(0, len(tables), 100):
+            chunk = tables[i : i + 100]
+            accounts = client.get_multiple_accounts(chunk, commitment=Confirmed).value
+            for table, account in zip(chunk, accounts):
+                if account is None:
+                    raise Exception(f"Lookup table {table} not found")
+                self._tables[table] = unpack_lookup_table_addresses(bytes(account.data))
+
+    def _accounts(self) -> list[AddressLookupTableAccount]:
+        return [AddressLookupTableAccount(table, addresses) for table, addresses in self._tables.items()]
+
+    def _missing(self, addresses: list[PublicKey]) -> list[PublicKey]:
+        known = {address for table in self._tables.values() for address in table}
+        return list(dict.fromkeys(address for address in addresses if address not in known))
+
+    def tables(self) -> list[AddressLookupTableAccount]:
+        """The active tables, found on chain on first use."""
+        with self._lock:
+            if not self._discovered:
+                self._discover()
+            return self._accounts()
+
+    def _read_configured(self) -> list[AddressLookupTableAccount]:
+        client = get_rpc_client(self.api_endpoint)
+        accounts = client.get_multiple_accounts(LOOKUP_TABLE_ADDRESSES, commitment=Confirmed).value
+        tables = []
+        for table, account in zip(LOOKUP_TABLE_ADDRESSES, accounts):
+            if account is None:
+                print(f"Lookup table {table} not found")
+                continue
+            data = bytes(account.data)
+            if unpack_deactivation_slot(data) != ACTIVE_DEACTIVATION_SLOT:
+                print(f"Lookup table {table} is deactivated")
+                continue
+            tables.append(AddressLookupTableAccount(table, unpack_lookup_table_addresses(data)))
+        return tables
+
+    def configured(self) -> list[AddressLookupTableAccount]:
+        """The active LOOKUP_TABLE_ADDRESSES tables, read once."""
+        if not LOOKUP_TABLE_ADDRESSES:
+            return []
+        with self._lock:
+            if self._configured is None:
+                self._configured = self._lookup("Reading lookup tables", self._read_configured)
+            return self._configured
+
+    def _send(self, transactions: list[Transaction]) -> None:
+        # Confirmed is enough: the table is only read back, and used, in later slots
+        responses = execute_many(
+            self.api_endpoint,
+            [(tx, [self.authority]) for tx in transactions],
+            max_retries=3,
+            finalized=False,
+            target=1,
+        )
+        if any(response is None for response in responses):
+            raise Exception("Failed to update lookup tables")
+
+    def ensure(self, addresses: list[PublicKey]) -> list[AddressLookupTableAccount]:
+        """Tables holding every address in `addresses`, creating and extending them as needed."""
+        with self._lock:
+            if self._discovered and not self._missing(addresses):
+                return self._accounts()
+            # Another process may have added them (or new tables) since we last looked
+            self._discover()
+            missing = self._missing(addresses)
+            if not missing:
+                return self._accounts()
+            payer = self.authority.pubkey()
+            client = get_rpc_client(self.api_endpoint)
+            extends: list[Transaction] = []
+            touched: list[PublicKey] = []
+            # Fill the room left in existing tables first
+            for table, table_addresses in self._tables.items():
+                room = MAX_TABLE_ADDRESSES - len(table_addresses)
+                if room > 0 and missing:
+                    extends += self._extends(table, missing[:room])
+                    touched.append(table)
+                    missing = missing[room:]
+            try:
+                # Each new table needs its own recent slot, so they are created one at a time
+                # (with their first addresses) and filled in parallel afterwards
+                while missing:
+                    slot = client.get_slot(Finalized).value
+                    create_ix, table = create_lookup_table_instruction(payer, payer, slot)
+                    first = missing[:MAX_EXTEND_ADDRESSES]
+                    tx = Transaction(fee_payer=payer).add(create_ix)
+                    tx.add(extend_lookup_table_instruction(table, payer, payer, first))
+                    self._send([tx])
+                    print(f"Created lookup table {table}")
+                    extends += self._extends(table, missing[len(first) : MAX_TABLE_ADDRESSES])
+                    touched.append(table)
+                    missing = missing[MAX_TABLE_ADDRESSES:]
+                if extends:
+                    self._send(extends)
+            finally:
+                # Read back whatever landed, so a failed extend isn't retried into duplicates
+                if touched:
+                    self._refresh(touched)
+            return self._accounts()
+
+    def _extends(self, table: PublicKey, addresses: list[PublicKey]) -> list[Transaction]:
+        payer = self.authority.pubkey()
+        return [
+            Transaction(fee_payer=payer).add(
+                extend_lookup_table_instruction(table, payer, payer, addresses[i : i + MAX_EXTEND_ADDRESSES])
+            )
+            for i in range(0, len(addresses), MAX_EXTEND_ADDRESSES)
+        ]
+
+    def _release(self, instructions: list[Instruction]) -> None:
+        payer = self.authority.pubkey()
+        transactions = []
+        for i in range(0, len(instructions), MAX_RELEASE_TABLES):
+            tx = Transaction(fee_payer=payer)
+            for ix in instructions[i : i + MAX_RELEASE_TABLES]:
+                tx.add(ix)
+            transactions.append(tx)
+        self._send(transactions)
+
+    def release(self) -> tuple[list[PublicKey], list[PublicKey]]:
+        """
+        Deactivate every active table and close the deactivated ones whose cooldown is over,
+        returning their rent to the authority. Deactivated tables are no longer handed out, and
+        the next ensure() starts new ones. LOOKUP_TABLE_ADDRESSES tables are left alone.
+        Returns the (deactivated, closed) tables.
+        """
+        with self._lock:
+            payer = self.authority.pubkey()
+            owned = {
+                table: entry for table, entry in self._owned().items() if table not in LOOKUP_TABLE_ADDRESSES
+            }
+            slot = get_rpc_client(self.api_endpoint).get_slot(Confirmed).value
+            active = [
+                table
+                for table, (deactivation_slot, _) in owned.items()
+                if deactivation_slot == ACTIVE_DEACTIVATION_SLOT
+            ]
+            closable = [
+                table
+                for table, (deactivation_slot, _) in owned.items()
+                if deactivation_slot != ACTIVE_DEACTIVATION_SLOT
+                and slot > deactivation_slot + DEACTIVATION_COOLDOWN_SLOTS
+            ]
+            self._tables = {table: self._tables[table] for table in LOOKUP_TABLE_ADDRESSES if table in self._tables}
+            self._release(
+                [deactivate_lookup_table_instruction(table, payer) for table in active]
+                + [close_lookup_table_instruction(table, payer, payer) for table in closable]
+            )
+            for table in active:
+                print(f"Deactivated lookup table {table}")
+            for table in closable:
+                print(f"Closed lookup table {table}")
+            return active, closable
+
+
+_managers: dict[tuple[str, str], LookupTableManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_lookup_tables(api_endpoint: str, authority: Keypair) -> LookupTableManager:
+    """Process-wide lookup table manager for `authority` on `api_endpoint`."""
+    key = (api_endpoint, str(authority.pubkey()))
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = LookupTableManager(api_endpoint, authority)
+        return manager
@@ -118,8 +118,9 @@ def _get_data_buffer(name: str, symbol: str, uri: str, fee: int, creators: list[
     return buffer
 
 
-def create_metadata_instruction_data(name: str, symbol: str, fee: int, creators: list[bytes]) -> bytes:
-    _data = _get_data_buffer(name, symbol, " " * 64, fee, creators)
+def create_metadata_instruction_data(name: str, symbol: str, fee: int, creators: list[bytes], uri: Optional[str] = None) -> bytes:
+    # Without a URI, a placeholder leaves room for update_metadata to write the real one later
+    _data = _get_data_buffer(name, symbol, " " * 64 if uri is None else uri, fee, creators)
     metadata_args_layout = cStruct(
         "data" / Bytes(len(_data)),
         "is_mutable" / Flag,
@@ -4,7 +4,7 @@ from typing import Optional
 from solders.pubkey import Pubkey as PublicKey
 from solana.transaction import Transaction
 from solders.keypair import Keypair
-from solana.rpc.api import Client
+from utils.rpc import get_rpc_client
 from solders.system_program import (
     transfer,
     TransferParams,
@@ -36,12 +36,22 @@ from metaplex.metadata import (
 
 
 def deploy(
-    api_endpoint: str, source_account: Keypair, name: str, symbol: str, fees: int
+    api_endpoint: str,
+    source_account: Keypair,
+    name: str,
+    symbol: str,
+    fees: int,
+    uri: Optional[str] = None,
+    mint_account: Optional[Keypair] = None,
 ) -> tuple[Transaction, list[Keypair], str]:
+    """
+    Create a mint account and its metadata. Without `uri` the metadata gets a placeholder
+    URI that mint() replaces. Without `mint_account` a new keypair is generated.
+    """
     # Initalize Client
-    client = Client(api_endpoint)
+    client = get_rpc_client(api_endpoint)
     # List non-derived accounts
-    mint_account = Keypair()
+    mint_account = mint_account or Keypair()
     token_account = TOKEN_PROGRAM_ID
     # List signers
     signers = [source_account, mint_account]
@@ -78,7 +88,7 @@ def deploy(
     # Create Token Metadata
     create_metadata_ix = create_metadata_instruction(
         data=create_metadata_instruction_data(
-            name, symbol, fees, [str(source_account.pubkey()).encode()]
+            name, symbol, fees, [str(source_account.pubkey()).encode()], uri
         ),
         update_authority=source_account.pubkey(),
         mint_key=mint_account.pubkey(),
@@ -104,7 +114,7 @@ def topup(
     Send a small amount of native currency to the specified wallet to handle gas fees. Return a status flag of success or fail and the native transaction data.
     """
     # Connect to the api_endpoint
-    client = Client(api_endpoint)
+    client = get_rpc_client(api_endpoint)
     # List accounts
     dest_account = PublicKey.from_string(to)
     # List signers
@@ -186,7 +196,7 @@ def mint(
     Return a status flag of success or fail and the native transaction data.
     """
     # Initialize Client
-    client = Client(api_endpoint)
+    client = get_rpc_client(api_endpoint)
     # List non-derived accounts
     mint_account = PublicKey.from_string(contract_key)
     user_account = PublicKey.from_string(dest_key)
@@ -252,6 +262,60 @@ def mint(
     return tx, signers
 
 
+def create_and_mint(
+    api_endpoint: str,
+    source_account: Keypair,
+    name: str,
+    symbol: str,
+    fees: int,
+    dest_key: str,
+    link: str,
+    supply: int = 1,
+    mint_account: Optional[Keypair] = None,
+) -> tuple[Transaction, list[Keypair], str]:
+    """
+    deploy() and mint() as a single transaction: the metadata is created with its final URI,
+    so there is no metadata read or update, and the NFT lands in one confirmation.
+    Signed by the payer and the new mint account.
+    """
+    tx, signers, contract = deploy(
+        api_endpoint, source_account, name, symbol, fees, uri=link, mint_account=mint_account
+    )
+    # List non-derived accounts
+    mint_account = PublicKey.from_string(contract)
+    user_account = PublicKey.from_string(dest_key)
+    # The mint is new, so its associated token account can't exist yet
+    associated_token_account = get_associated_token_address(user_account, mint_account)
+    associated_token_account_ix = create_associated_token_account_instruction(
+        associated_token_account=associated_token_account,
+        payer=source_account.pubkey(),  # signer
+        wallet_address=user_account,
+        token_mint_address=mint_account,
+    )
+    tx = tx.add(associated_token_account_ix)
+    # Mint NFT to the newly create associated token account
+    mint_to_ix = mint_to(
+        MintToParams(
+            program_id=TOKEN_PROGRAM_ID,
+            mint=mint_account,
+            dest=associated_token_account,
+            mint_authority=source_account.pubkey(),
+            amount=1,
+            signers=[source_account.pubkey()],
+        )
+    )
+    tx = tx.add(mint_to_ix)
+    create_master_edition_ix = create_master_edition_instruction(
+        mint=mint_account,
+        update_authority=source_account.pubkey(),
+        mint_authority=source_account.pubkey(),
+        payer=source_account.pubkey(),
+        supply=supply,
+    )
+    tx = tx.add(create_master_edition_ix)
+    return tx, signers, contract
+
+
 def send(
     api_endpoint: str,
     source_account: Keypair,
@@ -266,7 +330,7 @@ def send(
     Return a status flag of success or fail and the native transaction data.
     """
     # Initialize Client
-    client = Client(api_endpoint)
+    client = get_rpc_client(api_endpoint)
     # List non-derived accounts
     owner_account = Keypair.from_bytes(private_key)  # Owner of contract
     sender_account = PublicKey.from_string(sender_key)  # Public key of `owner_account`
@@ -324,7 +388,7 @@ def burn(
     Return a status flag of success or fail and the native transaction data.
     """
     # Initialize Client
-    client = Client(api_endpoint)
+    client = get_rpc_client(api_endpoint)
     # List accounts
     owner_account = PublicKey.from_string(owner_key)
     token_account = TOKEN_PROGRAM_ID
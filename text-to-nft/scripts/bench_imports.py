@@ -0,0 +1,80 @@
+"""
+Cold-start import cost, measured with `python -X importtime` in a fresh interpreter per module.
+
+    python scripts/bench_imports.py                          # the Lambda handler
+    python scripts/bench_imports.py create_nft text2img_async --top 20
+    MINT_ENABLED=1 python scripts/bench_imports.py --json    # handler with the chain stack
+
+Reports each entry module's total import time (including module init such as the secrets
+prefetch) and the heaviest top-level packages it pulls in, by cumulative time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """(imported module, self us, cumulative us) for every import made by `import module`."""
+    env = {**os.environ, "AWS_EC2_METADATA_DISABLED": "true"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise Exception(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def summarize(module: str, top: int) -> dict:
+    times = import_times(module)
+    total = next(cumulative for name, _, cumulative in times if name == module)
+    packages: dict[str, int] = {}
+    for name, _, cumulative in times:
+        # Nested imports are already counted in their parent's cumulative time
+        if "." not in name and name != module:
+            packages[name] = max(packages.get(name, 0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": total / 1000,
+        "modules_imported": len(times),
+        "packages_ms": {name: us / 1000 for name, us in heaviest},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("modules", nargs="*", default=["lambda_function_text2nft"])
+    ap.add_argument("--top", type=int, default=10, help="heaviest packages to list per module")
+    ap.add_argument("--json", action="store_true", help="print one JSON object per module")
+    args = ap.parse_args()
+
+    for module in args.modules:
+        result = summarize(module, args.top)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(
+            f"{result['module']}: {result['total_ms']:.1f} ms, "
+            f"{result['modules_imported']} modules"
+        )
+        for name, ms in result["packages_ms"].items():
+            print(f"    {name:<28} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
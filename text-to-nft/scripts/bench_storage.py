@@ -0,0 +1,86 @@
+"""
+Upload throughput and latency percentiles per storage backend.
+
+    python scripts/bench_storage.py                      # local filesystem store only, no network
+    python scripts/bench_storage.py --backend local --backend ipfs --iterations 50
+
+Every iteration uploads fresh random bytes so no backend can short-circuit on a known CID.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.backends import BACKENDS, LocalFSBackend, StorageBackend  # noqa: E402
+from storage.car import build_bundle  # noqa: E402
+
+SIZES = {
+    "json": 512,
+    "image": 1536 * 1024,
+}
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench(backend: StorageBackend, kind: str, size: int, iterations: int) -> dict:
+    latencies = []
+    total_bytes = 0
+    for _ in range(iterations):
+        if kind == "bundle":
+            bundle = build_bundle([(os.urandom(SIZES["image"]), {"name": "bench"})])
+            start = time.perf_counter()
+            with bundle.car:
+                result = backend.upload_car(bundle.car)
+        else:
+            body = os.urandom(size)
+            start = time.perf_counter()
+            result = backend.upload(body)
+        latencies.append(time.perf_counter() - start)
+        total_bytes += result.size
+    elapsed = sum(latencies)
+    return {
+        "backend": backend.name,
+        "kind": kind,
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_mb_s": total_bytes / elapsed / 1e6 if elapsed else 0,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", action="append", choices=sorted(BACKENDS))
+    ap.add_argument("--iterations", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="print one JSON object per result")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = []
+        for name in args.backend or [LocalFSBackend.name]:
+            backend = LocalFSBackend(directory) if name == LocalFSBackend.name else BACKENDS[name]()
+            for kind in ("json", "image", "bundle"):
+                results.append(bench(backend, kind, SIZES.get(kind, 0), args.iterations))
+
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{result['backend']:<11} {result['kind']:<7} "
+                f"p50 {result['p50_ms']:8.2f} ms  p90 {result['p90_ms']:8.2f} ms  "
+                f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_mb_s']:8.2f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
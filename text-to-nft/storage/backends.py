@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional, Union
+import requests
+from storage.car import (
+    CAR_CONTENT_TYPE,
+    IPFS_GATEWAY,
+    car_roots,
+    read_car_blocks,
+    read_car_header,
+)
+from storage.cid import (
+    CHUNK_SIZE,
+    RAW_CODEC,
+    UNIXFS_DIRECTORY,
+    cid_codec,
+    cid_from_str,
+    cid_to_str,
+    decode_dag_pb,
+    unixfs_file,
+    unixfs_type,
+)
+from storage.client import UploadResult, get_client
+from storage.index import get_upload_index
+
+# `{gateway}/{cid}` URIs of the local store are native ipfs://{cid} content addresses
+LOCAL_GATEWAY = "ipfs:/"
+
+
+class StorageBackend(ABC):
+    """Somewhere content-addressed files and CARs can be pinned and later fetched through `uri`."""
+
+    name = "base"
+
+    def __init__(self, gateway: str = IPFS_GATEWAY):
+        self.gateway = gateway
+
+    @abstractmethod
+    def upload(
+        self, body: Union[str, bytes, BinaryIO], content_type: str = "application/octet-stream"
+    ) -> UploadResult:
+        ...
+
+    @abstractmethod
+    def upload_car(self, car: BinaryIO) -> UploadResult:
+        ...
+
+    def has(self, cid: str) -> bool:
+        """Whether `cid` is known to be pinned already (False when the backend can't tell cheaply)."""
+        return False
+
+    def uri(self, cid: str, path: str = "") -> str:
+        return f"{self.gateway}/{cid}/{path}" if path else f"{self.gateway}/{cid}"
+
+
+class NFTStorageBackend(StorageBackend):
+    name = "nftstorage"
+
+    def __init__(self, client=None, gateway: str = IPFS_GATEWAY):
+        super().__init__(gateway)
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_client()
+
+    def upload(
+        self, body: Union[str, bytes, BinaryIO], content_type: str = "application/octet-stream"
+    ) -> UploadResult:
+        result = self.client.upload(body, content_type)
+        get_upload_index().add(result.cid, result.size)
+        return result
+
+    def upload_car(self, car: BinaryIO) -> UploadResult:
+        result = self.client.upload_car(car)
+        get_upload_index().add(result.cid, result.size)
+        return result
+
+    def has(self, cid: str) -> bool:
+        return cid in get_upload_index()
+
+
+class IPFSHTTPBackend(StorageBackend):
+    """
+    Any node speaking the Kubo-style IPFS HTTP API (`/api/v0/add`, `/api/v0/dag/import`),
+    e.g. a self-hosted node or a pinning provider exposing that API. Content is added with
+    CIDv1, raw leaves and 256 KiB chunks so CIDs match nft.storage and storage.cid.
+    """
+
+    name = "ipfs"
+
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        gateway: str = IPFS_GATEWAY,
+        headers: Optional[dict[str, str]] = None,
+        timeout: tuple[float, float] = (5, 120),
+    ):
+        super().__init__(gateway)
+        api_url = api_url or os.getenv("IPFS_API_URL", "http://127.0.0.1:5001")
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+
+    def upload(
+        self, body: Union[str, bytes, BinaryIO], content_type: str = "application/octet-stream"
+    ) -> UploadResult:
+        if isinstance(body, str):
+            with open(body, "rb") as f:
+                return self.upload(f, content_type)
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            body = io.BytesIO(body)
+        response = self.session.post(
+            f"{self.api_url}/api/v0/add",
+            params={
+                "cid-version": "1",
+                "raw-leaves": "true",
+                "chunker": f"size-{CHUNK_SIZE}",
+                "pin": "true",
+            },
+            files={"file": ("file", body, content_type)},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise Exception("Non-200 response: " + str(response.text))
+        data = response.json()
+        return UploadResult(data["Hash"], int(data["Size"]), 1)
+
+    def upload_car(self, car: BinaryIO) -> UploadResult:
+        start = car.tell()
+        response = self.session.post(
+            f"{self.api_url}/api/v0/dag/import",
+            params={"pin-roots": "true"},
+            files={"file": ("upload.car", car, CAR_CONTENT_TYPE)},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise Exception("Non-200 response: " + str(response.text))
+        # dag/import streams one JSON object per line; the root is reported in the first
+        root = response.text.splitlines()[0]
+        cid = json.loads(root)["Root"]["Cid"]["/"]
+        return UploadResult(cid, car.tell() - start, 1)
+
+
+class LocalFSBackend(StorageBackend):
+    """
+    Offline content-addressed store: every block is written to `{directory}/blocks/{cid}`.
+    CIDs are identical to what nft.storage would report, so it can stand in for the network.
+    Blocks are kept flat rather than as a file tree, so URIs are plain `ipfs://{cid}/{path}`
+    content addresses; cat() resolves them against the stored blocks.
+    """
+
+    name = "local"
+
+    def __init__(self, directory: Optional[str] = None, gateway: str = LOCAL_GATEWAY):
+        if directory is None:
+            directory = os.path.join(os.getenv("LAMBDA_WORK_DIR", "./tmp"), "ipfs")
+        self.directory = directory
+        self.blocks_dir = os.path.join(directory, "blocks")
+        super().__init__(gateway)
+
+    def _write_block(self, cid: bytes, data: bytes) -> None:
+        path = os.path.join(self.blocks_dir, cid_to_str(cid))
+        if os.path.exists(path):
+            return
+        os.makedirs(self.blocks_dir, exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def upload(
+        self, body: Union[str, bytes, BinaryIO], content_type: str = "application/octet-stream"
+    ) -> UploadResult:
+        if isinstance(body, str):
+            with open(body, "rb") as f:
+                return self.upload(f, content_type)
+        root = unixfs_file(body, emit=self._write_block)
+        return UploadResult(cid_to_str(root.cid), root.file_size, 1)
+
+    def upload_car(self, car: BinaryIO) -> UploadResult:
+        start = car.tell()
+        (root,) = car_roots(read_car_header(car))
+        car.seek(start)
+        for cid, data in read_car_blocks(car):
+            self._write_block(cid, data)
+        return UploadResult(cid_to_str(root), car.tell() - start, 1)
+
+    def has(self, cid: str) -> bool:
+        return os.path.exists(os.path.join(self.blocks_dir, cid))
+
+    def get_block(self, cid: str) -> bytes:
+        with open(os.path.join(self.blocks_dir, cid), "rb") as f:
+            return f.read()
+
+    def cat(self, uri: str) -> bytes:
+        """Contents of the file at a URI from uri() (or a bare `{cid}/{path}`), read from the blocks."""
+        address = uri.removeprefix(f"{self.gateway}/")
+        root, _, path = address.partition("/")
+        cid = cid_from_str(root)
+        for name in filter(None, path.split("/")):
+            _, links = decode_dag_pb(self.get_block(cid_to_str(cid)))
+            matches = [link_cid for link_name, link_cid, _ in links if link_name == name]
+            if not matches:
+                raise Exception(f"{name} not found in {address}")
+            cid = matches[0]
+        return self._read_file(cid)
+
+    def _read_file(self, cid: bytes) -> bytes:
+        block = self.get_block(cid_to_str(cid))
+        if cid_codec(cid) == RAW_CODEC:
+            return block
+        data, links = decode_dag_pb(block)
+        if unixfs_type(data) == UNIXFS_DIRECTORY:
+            raise Exception(f"{cid_to_str(cid)} is a directory")
+        return b"".join(self._read_file(link_cid) for _, link_cid, _ in links)
+
+
+BACKENDS = {
+    NFTStorageBackend.name: NFTStorageBackend,
+    IPFSHTTPBackend.name: IPFSHTTPBackend,
+    LocalFSBackend.name: LocalFSBackend,
+}
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """Process-wide backend selected by STORAGE_BACKEND (nftstorage, ipfs or local)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.getenv("STORAGE_BACKEND", NFTStorageBackend.name)
+            if name not in BACKENDS:
+                raise Exception(f"Unknown STORAGE_BACKEND: {name}")
+            _backend = BACKENDS[name]()
+        return _backend
@@ -0,0 +1,157 @@
+import tempfile
+from typing import Any, BinaryIO, Iterator, NamedTuple, Optional, Union
+from storage.cid import (
+    DagNode,
+    canonical_json,
+    cid_length,
+    cid_to_str,
+    encode_varint,
+    unixfs_directory,
+    unixfs_file,
+)
+
+IPFS_GATEWAY = "https://ipfs.io/ipfs"
+CAR_CONTENT_TYPE = "application/car"
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+
+def _cbor_head(major: int, value: int) -> bytes:
+    if value < 24:
+        return bytes([major << 5 | value])
+    for info, length in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if value < 1 << (8 * length):
+            return bytes([major << 5 | info]) + value.to_bytes(length, "big")
+    raise Exception(f"CBOR value too large: {value}")
+
+
+def car_header(roots: list[bytes]) -> bytes:
+    """dag-cbor {"roots": [CID...], "version": 1}; keys in dag-cbor canonical (length-first) order."""
+    out = _cbor_head(5, 2)
+    out += _cbor_head(3, 5) + b"roots" + _cbor_head(4, len(roots))
+    for cid in roots:
+        # CIDs are tag 42 over the identity-multibase (0x00) prefixed binary CID
+        out += b"\xd8\x2a" + _cbor_head(2, len(cid) + 1) + b"\x00" + cid
+    out += _cbor_head(3, 7) + b"version" + _cbor_head(0, 1)
+    return encode_varint(len(out)) + out
+
+
+def read_varint(f: BinaryIO) -> Optional[int]:
+    """Read one varint from a stream; None at a clean end of stream."""
+    value = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            if shift == 0:
+                return None
+            raise Exception("Truncated varint in CAR")
+        value |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            return value
+        shift += 7
+
+
+def read_car_header(car: BinaryIO) -> bytes:
+    """Read the header of a CARv1 and return it with its length prefix."""
+    length = read_varint(car)
+    if length is None:
+        raise Exception("Empty CAR")
+    return encode_varint(length) + car.read(length)
+
+
+def car_roots(header: bytes) -> list[bytes]:
+    """Root CIDs of a CARv1 header: every tag-42 byte string in it (the header holds no other CIDs)."""
+    roots = []
+    offset = header.find(b"\xd8\x2a")
+    while offset != -1:
+        info = header[offset + 2] & 0x1F
+        if info < 24:
+            length, start = info, offset + 3
+        else:
+            size = 1 << (info - 24)
+            length = int.from_bytes(header[offset + 3 : offset + 3 + size], "big")
+            start = offset + 3 + size
+        # Skip the identity multibase prefix
+        roots.append(header[start + 1 : start + length])
+        offset = header.find(b"\xd8\x2a", start + length)
+    return roots
+
+
+def read_car_blocks(car: BinaryIO) -> Iterator[tuple[bytes, bytes]]:
+    """Yield (cid, data) for every block of a CARv1, skipping its header."""
+    read_car_header(car)
+    while True:
+        length = read_varint(car)
+        if length is None:
+            return
+        block = car.read(length)
+        split = cid_length(block)
+        yield block[:split], block[split:]
+
+
+class CarBuilder:
+    """Collects IPLD blocks (de-duplicated by CID) and writes them out as a CARv1 file."""
+
+    def __init__(self, spool_max_size: int = SPOOL_MAX_SIZE):
+        self.spool_max_size = spool_max_size
+        self._body = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+        self._seen: set[bytes] = set()
+
+    def add_block(self, cid: bytes, data: bytes) -> None:
+        if cid in self._seen:
+            return
+        self._seen.add(cid)
+        self._body.write(encode_varint(len(cid) + len(data)))
+        self._body.write(cid)
+        self._body.write(data)
+
+    def add_file(self, source: Union[bytes, BinaryIO]) -> DagNode:
+        return unixfs_file(source, emit=self.add_block)
+
+    def add_directory(self, entries: dict[str, DagNode]) -> DagNode:
+        return unixfs_directory(entries, emit=self.add_block)
+
+    def finish(self, root: DagNode) -> BinaryIO:
+        """Return the complete CAR (header + blocks) as a readable file positioned at the start."""
+        car = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        car.write(car_header([root.cid]))
+        self._body.seek(0)
+        while True:
+            chunk = self._body.read(1024 * 1024)
+            if not chunk:
+                break
+            car.write(chunk)
+        self._body.close()
+        car.seek(0)
+        return car
+
+
+class Bundle(NamedTuple):
+    root_cid: str
+    car: BinaryIO
+    image_uris: list[str]
+    metadata_uris: list[str]
+
+
+def build_bundle(
+    items: list[tuple[Union[bytes, BinaryIO], dict[str, Any]]],
+    gateway: str = IPFS_GATEWAY,
+) -> Bundle:
+    """
+    Pack images and their metadata JSON into one directory DAG: `{i}.png` and `{i}.json` per item.
+    The `image` field of each metadata dict is filled in with the image's URI, which is known locally
+    before anything is uploaded. Metadata URIs point into the root directory.
+    """
+    builder = CarBuilder()
+    entries: dict[str, DagNode] = {}
+    image_uris = []
+    for i, (image, metadata) in enumerate(items):
+        image_node = builder.add_file(image)
+        entries[f"{i}.png"] = image_node
+        image_uri = f"{gateway}/{cid_to_str(image_node.cid)}"
+        image_uris.append(image_uri)
+        entries[f"{i}.json"] = builder.add_file(canonical_json({**metadata, "image": image_uri}))
+    root = builder.add_directory(entries)
+    root_cid = cid_to_str(root.cid)
+    metadata_uris = [f"{gateway}/{root_cid}/{i}.json" for i in range(len(items))]
+    return Bundle(root_cid, builder.finish(root), image_uris, metadata_uris)
@@ -0,0 +1,244 @@
+import base64
+import hashlib
+import io
+import json
+from typing import Any, BinaryIO, Callable, Iterator, NamedTuple, Optional, Union
+
+# Defaults of the ipfs-car packer that nft.storage uses for /upload and /store
+CHUNK_SIZE = 262144
+MAX_CHILDREN_PER_NODE = 174
+# Largest block IPFS nodes (and so nft.storage) will transfer
+MAX_BLOCK_SIZE = 1024 * 1024
+
+RAW_CODEC = 0x55
+DAG_PB_CODEC = 0x70
+SHA2_256 = 0x12
+
+# UnixFS Data.DataType values
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+
+BlockSink = Callable[[bytes, bytes], None]
+
+
+class DagNode(NamedTuple):
+    cid: bytes
+    # Cumulative encoded size of the DAG (the Tsize of a link to it)
+    tsize: int
+    # Number of file bytes under the node
+    file_size: int
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(buf: bytes, offset: int = 0) -> tuple[int, int]:
+    """Decode the varint at `offset`; returns (value, offset just past it)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def cid_length(buf: bytes) -> int:
+    """Length of the binary CIDv1 at the start of `buf`."""
+    _, offset = decode_varint(buf)  # version
+    _, offset = decode_varint(buf, offset)  # codec
+    _, offset = decode_varint(buf, offset)  # multihash function
+    digest_length, offset = decode_varint(buf, offset)
+    return offset + digest_length
+
+
+def make_cid(codec: int, data: bytes) -> bytes:
+    """Binary CIDv1 of `data` with a sha2-256 multihash."""
+    digest = hashlib.sha256(data).digest()
+    return encode_varint(1) + encode_varint(codec) + bytes([SHA2_256, len(digest)]) + digest
+
+
+def cid_to_str(cid: bytes) -> str:
+    """Multibase base32 (lowercase, unpadded) string form, e.g. bafy... / bafkrei..."""
+    return "b" + base64.b32encode(cid).decode("ascii").lower().rstrip("=")
+
+
+def cid_from_str(cid: str) -> bytes:
+    """Inverse of cid_to_str."""
+    if not cid.startswith("b"):
+        raise Exception(f"Unsupported CID encoding: {cid}")
+    encoded = cid[1:].upper()
+    return base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+
+
+def cid_codec(cid: bytes) -> int:
+    _, offset = decode_varint(cid)  # version
+    codec, _ = decode_varint(cid, offset)
+    return codec
+
+
+def canonical_json(document: Any) -> bytes:
+    """Sorted-key, compact UTF-8 JSON, so equal documents always hash to the same CID."""
+    return json.dumps(
+        document, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def _pb_field(number: int, wire_type: int) -> bytes:
+    return encode_varint(number << 3 | wire_type)
+
+
+def _pb_bytes(number: int, value: bytes) -> bytes:
+    return _pb_field(number, 2) + encode_varint(len(value)) + value
+
+
+def _pb_uint(number: int, value: int) -> bytes:
+    return _pb_field(number, 0) + encode_varint(value)
+
+
+def _pb_fields(buf: bytes) -> Iterator[tuple[int, Union[int, bytes]]]:
+    """(field number, value) pairs of a protobuf message using only varint and length-delimited fields."""
+    offset = 0
+    while offset < len(buf):
+        key, offset = decode_varint(buf, offset)
+        if key & 7 == 0:
+            value, offset = decode_varint(buf, offset)
+            yield key >> 3, value
+        elif key & 7 == 2:
+            length, offset = decode_varint(buf, offset)
+            yield key >> 3, buf[offset : offset + length]
+            offset += length
+        else:
+            raise Exception(f"Unsupported protobuf wire type {key & 7}")
+
+
+def unixfs_data(data_type: int, file_size: Optional[int] = None, block_sizes: Optional[list[int]] = None) -> bytes:
+    """Protobuf-encoded UnixFS Data message (default mode/mtime omitted, as ipfs-unixfs does)."""
+    out = _pb_uint(1, data_type)
+    if file_size:
+        out += _pb_uint(3, file_size)
+    for size in block_sizes or []:
+        out += _pb_uint(4, size)
+    return out
+
+
+def dag_pb_node(data: bytes, links: list[tuple[str, bytes, int]]) -> bytes:
+    """Canonical dag-pb PBNode: Links (Hash, Name, Tsize) first, then Data."""
+    out = b""
+    for name, cid, tsize in links:
+        link = _pb_bytes(1, cid) + _pb_bytes(2, name.encode("utf-8")) + _pb_uint(3, tsize)
+        out += _pb_bytes(2, link)
+    return out + _pb_bytes(1, data)
+
+
+def decode_dag_pb(node: bytes) -> tuple[bytes, list[tuple[str, bytes, int]]]:
+    """Inverse of dag_pb_node: (Data, [(Name, Hash, Tsize), ...])."""
+    data = b""
+    links = []
+    for number, value in _pb_fields(node):
+        if number == 1:
+            data = value
+        elif number == 2:
+            link = dict(_pb_fields(value))
+            links.append((link.get(2, b"").decode("utf-8"), link[1], link.get(3, 0)))
+    return data, links
+
+
+def unixfs_type(data: bytes) -> int:
+    """DataType of a protobuf-encoded UnixFS Data message."""
+    return dict(_pb_fields(data)).get(1, UNIXFS_FILE)
+
+
+def _iter_chunks(source: BinaryIO, chunk_size: int):
+    first = True
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            if first:
+                yield b""
+            return
+        first = False
+        yield chunk
+
+
+def unixfs_file(
+    source: Union[bytes, BinaryIO],
+    emit: Optional[BlockSink] = None,
+    chunk_size: int = CHUNK_SIZE,
+    max_children: int = MAX_CHILDREN_PER_NODE,
+) -> DagNode:
+    """
+    Chunk `source` into raw leaves and build a balanced UnixFS file DAG the way ipfs-car does.
+    A single-chunk file is just its raw leaf. Every block is passed to `emit(cid, data)` if given;
+    without it only hashes are kept, so memory stays constant in the file size.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    layer: list[DagNode] = []
+    for chunk in _iter_chunks(source, chunk_size):
+        cid = make_cid(RAW_CODEC, chunk)
+        if emit is not None:
+            emit(cid, chunk)
+        layer.append(DagNode(cid, len(chunk), len(chunk)))
+
+    while len(layer) > 1:
+        parents = []
+        for start in range(0, len(layer), max_children):
+            children = layer[start : start + max_children]
+            file_size = sum(child.file_size for child in children)
+            node = dag_pb_node(
+                unixfs_data(UNIXFS_FILE, file_size, [child.file_size for child in children]),
+                [("", child.cid, child.tsize) for child in children],
+            )
+            cid = make_cid(DAG_PB_CODEC, node)
+            if emit is not None:
+                emit(cid, node)
+            parents.append(
+                DagNode(cid, len(node) + sum(child.tsize for child in children), file_size)
+            )
+        layer = parents
+    return layer[0]
+
+
+def compute_cid(source: Union[str, bytes, BinaryIO]) -> str:
+    """
+    CID that nft.storage will report for this content, computed locally.
+    `source` is a path, bytes or a seekable binary file (rewound to where it started afterwards).
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return cid_to_str(unixfs_file(f).cid)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cid_to_str(unixfs_file(source).cid)
+    start = source.tell()
+    try:
+        return cid_to_str(unixfs_file(source).cid)
+    finally:
+        source.seek(start)
+
+
+def unixfs_directory(entries: dict[str, DagNode], emit: Optional[BlockSink] = None) -> DagNode:
+    """UnixFS directory whose links are sorted by name, as ipfs-car emits them."""
+    links = [(name, entries[name].cid, entries[name].tsize) for name in sorted(entries)]
+    node = dag_pb_node(unixfs_data(UNIXFS_DIRECTORY), links)
+    # A flat directory is a single block; past the limit it would need HAMT sharding
+    if len(node) > MAX_BLOCK_SIZE:
+        raise Exception(
+            f"Directory of {len(entries)} entries is {len(node)} bytes, over the {MAX_BLOCK_SIZE} byte block limit"
+        )
+    cid = make_cid(DAG_PB_CODEC, node)
+    if emit is not None:
+        emit(cid, node)
+    return DagNode(cid, len(node) + sum(tsize for _, _, tsize in links), 0)
@@ -0,0 +1,220 @@
+import io
+import os
+import random
+import threading
+import time
+from typing import Any, BinaryIO, Iterator, NamedTuple, Optional, Union
+import requests
+from requests.adapters import HTTPAdapter
+from get_api_key import get_api_key
+from storage.car import CAR_CONTENT_TYPE, read_car_header, read_varint
+from storage.cid import encode_varint
+from utils.metrics import metrics
+
+NFT_STORAGE_API = "https://api.nft.storage"
+CHUNK_SIZE = 256 * 1024
+# nft.storage rejects single requests above 100 MB; larger CARs go up in pieces
+MAX_CAR_CHUNK_SIZE = 50 * 1024 * 1024
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class UploadResult(NamedTuple):
+    cid: str
+    size: int
+    attempts: int
+
+
+class _BodyReader(io.RawIOBase):
+    """Streams `length` bytes of `source` from its current position in reads of at most `chunk_size`."""
+
+    def __init__(self, source: BinaryIO, length: int, chunk_size: int):
+        self.source = source
+        self.start = source.tell()
+        self.length = length
+        self.chunk_size = chunk_size
+        self.sent = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # requests derives Content-Length from len() minus tell()
+        return self.sent
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.sent
+        if size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self.source.read(min(size, remaining))
+        self.sent += len(chunk)
+        return chunk
+
+    def rewind(self) -> None:
+        self.source.seek(self.start)
+        self.sent = 0
+
+
+def _remaining_length(source: BinaryIO) -> int:
+    start = source.tell()
+    source.seek(0, io.SEEK_END)
+    length = source.tell() - start
+    source.seek(start)
+    return length
+
+
+class NFTStorageClient:
+    """
+    nft.storage client holding one keep-alive connection pool for the life of the process.
+    Bodies are streamed from files/buffers in fixed-size chunks and retried with jittered backoff;
+    CARs larger than MAX_CAR_CHUNK_SIZE are split and only the failed pieces are re-sent.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        api_host: str = NFT_STORAGE_API,
+        pool_size: int = 10,
+        chunk_size: int = CHUNK_SIZE,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10,
+        timeout: tuple[float, float] = (5, 120),
+    ):
+        self.api_host = api_host
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _post(self, path: str, body: _BodyReader, content_type: str) -> tuple[dict[str, Any], int]:
+        for attempt in range(1, self.max_retries + 2):
+            body.rewind()
+            try:
+                with metrics.timer("nftstorage_request"):
+                    response = self.session.post(
+                        f"{self.api_host}{path}",
+                        headers={"Content-Type": content_type, "Content-Length": str(len(body))},
+                        data=body,
+                        timeout=self.timeout,
+                    )
+                if response.status_code == 200:
+                    metrics.count("upload_bytes", len(body), unit="Bytes")
+                    return response.json(), attempt
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise Exception("Non-200 response: " + str(response.text))
+                error: Exception = Exception(
+                    f"Non-200 response: {response.status_code} {response.text}"
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt > self.max_retries:
+                raise error
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+            metrics.count("upload_retries")
+            print(f"Upload attempt {attempt} failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+        raise Exception("Unreachable")
+
+    def upload(
+        self,
+        body: Union[str, bytes, BinaryIO],
+        content_type: str = "application/octet-stream",
+    ) -> UploadResult:
+        """Upload a file (path, bytes or seekable binary file) via POST /upload."""
+        if isinstance(body, str):
+            with open(body, "rb") as f:
+                return self.upload(f, content_type)
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            body = io.BytesIO(body)
+        length = _remaining_length(body)
+        data, attempts = self._post("/upload", _BodyReader(body, length, self.chunk_size), content_type)
+        return UploadResult(data["value"]["cid"], length, attempts)
+
+    def upload_car(
+        self, car: BinaryIO, max_chunk_size: int = MAX_CAR_CHUNK_SIZE
+    ) -> UploadResult:
+        """Upload a CARv1, splitting it into several CARs with the same root when it is too big."""
+        length = _remaining_length(car)
+        if length <= max_chunk_size:
+            data, attempts = self._post(
+                "/upload", _BodyReader(car, length, self.chunk_size), CAR_CONTENT_TYPE
+            )
+            return UploadResult(data["value"]["cid"], length, attempts)
+
+        header = read_car_header(car)
+        cid = None
+        attempts = 0
+        for piece in _split_car(car, header, max_chunk_size):
+            with piece:
+                data, piece_attempts = self._post(
+                    "/upload",
+                    _BodyReader(piece, _remaining_length(piece), self.chunk_size),
+                    CAR_CONTENT_TYPE,
+                )
+            attempts += piece_attempts
+            cid = data["value"]["cid"]
+        return UploadResult(cid, length, attempts)
+
+    def list(self, page_size: int = 1000) -> Iterator[dict[str, Any]]:
+        """Iterate over every upload listed by `GET /`, newest first."""
+        params: dict[str, str] = {"limit": str(page_size)}
+        while True:
+            response = self.session.get(f"{self.api_host}/", params=params, timeout=self.timeout)
+            if response.status_code != 200:
+                raise Exception("Non-200 response: " + str(response.text))
+            uploads = response.json()["value"]
+            yield from uploads
+            if len(uploads) < page_size:
+                return
+            # Page backwards from the oldest upload we got
+            params["before"] = uploads[-1]["created"]
+
+
+def _split_car(car: BinaryIO, header: bytes, max_chunk_size: int) -> Iterator[BinaryIO]:
+    """Yield CARs that share `header` and together hold every block, each under `max_chunk_size`."""
+    piece = io.BytesIO()
+    piece.write(header)
+    while True:
+        length = read_varint(car)
+        if length is None:
+            break
+        block = encode_varint(length) + car.read(length)
+        if piece.tell() + len(block) > max_chunk_size and piece.tell() > len(header):
+            piece.seek(0)
+            yield piece
+            piece = io.BytesIO()
+            piece.write(header)
+        piece.write(block)
+    piece.seek(0)
+    yield piece
+
+
+_client: Optional[NFTStorageClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> NFTStorageClient:
+    """Process-wide client, created on first use so warm invocations reuse its connections."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            access_token = get_api_key(
+                "text_to_nft/nft_storage_api_key"
+            )  # os.getenv("NFT_STORAGE_API_KEY")
+            _client = NFTStorageClient(
+                access_token,
+                pool_size=int(os.getenv("NFT_STORAGE_POOL_SIZE", "10")),
+            )
+        return _client
@@ -0,0 +1,186 @@
+from typing import Any, NamedTuple, Optional
+from storage.backends import StorageBackend, get_backend
+from storage.car import CarBuilder
+from storage.cid import BlockSink, DagNode, canonical_json, cid_to_str, unixfs_directory, unixfs_file
+
+MAX_SELLER_FEE_BASIS_POINTS = 10000
+CATEGORIES = {"image", "video", "audio", "vr", "html"}
+# Same limits as metaplex.metadata; repeated here so the storage path doesn't import the solana stack
+MAX_NAME_LENGTH = 32
+MAX_SYMBOL_LENGTH = 10
+MAX_URI_LENGTH = 200
+
+
+def validate_metadata(document: dict[str, Any]) -> None:
+    """
+    Check a token metadata document against the Metaplex JSON standard, including the
+    name/symbol length limits of the on-chain metadata account. Raises on the first problem found.
+    """
+
+    def fail(message: str) -> None:
+        raise Exception(f"Invalid metadata {document.get('name')!r}: {message}")
+
+    for field in ("name", "image"):
+        if not isinstance(document.get(field), str) or not document[field]:
+            fail(f"{field} is required")
+    if len(document["name"].encode()) > MAX_NAME_LENGTH:
+        fail(f"name is longer than {MAX_NAME_LENGTH} bytes")
+    if len(document.get("symbol", "").encode()) > MAX_SYMBOL_LENGTH:
+        fail(f"symbol is longer than {MAX_SYMBOL_LENGTH} bytes")
+    for field in ("symbol", "description", "image", "animation_url", "external_url"):
+        if field in document and not isinstance(document[field], str):
+            fail(f"{field} must be a string")
+
+    fee = document.get("seller_fee_basis_points", 0)
+    if not isinstance(fee, int) or not 0 <= fee <= MAX_SELLER_FEE_BASIS_POINTS:
+        fail(f"seller_fee_basis_points must be an integer in [0, {MAX_SELLER_FEE_BASIS_POINTS}]")
+
+    attributes = document.get("attributes", [])
+    if not isinstance(attributes, list):
+        fail("attributes must be a list")
+    for attribute in attributes:
+        if not isinstance(attribute, dict) or "trait_type" not in attribute or "value" not in attribute:
+            fail("each attribute needs trait_type and value")
+
+    properties = document.get("properties", {})
+    if not isinstance(properties, dict):
+        fail("properties must be an object")
+    if "category" in properties and properties["category"] not in CATEGORIES:
+        fail(f"properties.category must be one of {sorted(CATEGORIES)}")
+    for file in properties.get("files", []):
+        if not isinstance(file, dict) or "uri" not in file or "type" not in file:
+            fail("each properties.files entry needs uri and type")
+    creators = properties.get("creators", [])
+    for creator in creators:
+        if not isinstance(creator, dict) or "address" not in creator or "share" not in creator:
+            fail("each creator needs address and share")
+        if not isinstance(creator["address"], str):
+            fail("creator address must be a string")
+        share = creator["share"]
+        if isinstance(share, bool) or not isinstance(share, int) or not 0 <= share <= 100:
+            fail("creator share must be an integer in [0, 100]")
+    if creators and sum(creator["share"] for creator in creators) != 100:
+        fail("creator shares must add up to 100")
+
+
+class CollectionBuilder:
+    """
+    Builds validated metadata documents for a whole drop. Item i becomes `{i}.json`, so the
+    on-chain URI of every item is `{base_uri}/{i}.json` as soon as the directory CID is known.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        seller_fee_basis_points: int = 0,
+        creators: Optional[list[dict[str, Any]]] = None,
+        collection: Optional[dict[str, str]] = None,
+        external_url: Optional[str] = None,
+    ):
+        self.symbol = symbol
+        self.seller_fee_basis_points = seller_fee_basis_points
+        self.creators = creators or []
+        self.collection = collection
+        self.external_url = external_url
+        self.documents: list[dict[str, Any]] = []
+        self._names: set[str] = set()
+
+    def add(
+        self,
+        name: str,
+        image: str,
+        description: str = "",
+        attributes: Optional[list[dict[str, Any]]] = None,
+        image_type: str = "image/png",
+        **extra: Any,
+    ) -> int:
+        """Add one item and return its index."""
+        if name in self._names:
+            raise Exception(f"Duplicate item name: {name}")
+        properties: dict[str, Any] = {
+            "category": "image",
+            "files": [{"uri": image, "type": image_type}],
+        }
+        if self.creators:
+            properties["creators"] = self.creators
+        document: dict[str, Any] = {
+            "name": name,
+            "symbol": self.symbol,
+            "description": description,
+            "seller_fee_basis_points": self.seller_fee_basis_points,
+            "image": image,
+            "attributes": attributes or [],
+            "properties": properties,
+            **extra,
+        }
+        if self.collection is not None:
+            document["collection"] = self.collection
+        if self.external_url is not None:
+            document["external_url"] = self.external_url
+        validate_metadata(document)
+        self._names.add(name)
+        self.documents.append(document)
+        return len(self.documents) - 1
+
+    def serialize(self) -> list[bytes]:
+        """Canonical JSON bytes of every document, in index order."""
+        return [canonical_json(document) for document in self.documents]
+
+
+class CollectionUpload(NamedTuple):
+    root_cid: str
+    base_uri: str
+    # item name -> metadata URI
+    uris: dict[str, str]
+
+
+def metadata_uri(base_uri: str, index: int) -> str:
+    return f"{base_uri}/{index}.json"
+
+
+def _collection_root(builder: CollectionBuilder, emit: Optional[BlockSink] = None) -> DagNode:
+    entries = {
+        f"{i}.json": unixfs_file(document, emit=emit)
+        for i, document in enumerate(builder.serialize())
+    }
+    return unixfs_directory(entries, emit=emit)
+
+
+def plan_collection(
+    builder: CollectionBuilder, backend: Optional[StorageBackend] = None
+) -> CollectionUpload:
+    """Compute the directory CID and every metadata URI locally, without uploading anything."""
+    return _collection_upload(builder, _collection_root(builder), backend or get_backend())
+
+
+def _collection_upload(
+    builder: CollectionBuilder, root: DagNode, backend: StorageBackend
+) -> CollectionUpload:
+    root_cid = cid_to_str(root.cid)
+    base_uri = backend.uri(root_cid)
+    uris = {
+        document["name"]: metadata_uri(base_uri, i)
+        for i, document in enumerate(builder.documents)
+    }
+    for uri in uris.values():
+        if len(uri) > MAX_URI_LENGTH:
+            raise Exception(f"Metadata URI longer than {MAX_URI_LENGTH} characters: {uri}")
+    return CollectionUpload(root_cid, base_uri, uris)
+
+
+def upload_collection_metadata(
+    builder: CollectionBuilder, backend: Optional[StorageBackend] = None
+) -> CollectionUpload:
+    """Upload `0.json..N.json` as one directory in a single request and return the name -> URI map."""
+    backend = backend or get_backend()
+    car = CarBuilder()
+    root = _collection_root(builder, emit=car.add_block)
+    result = _collection_upload(builder, root, backend)
+    with car.finish(root) as f:
+        if backend.has(result.root_cid):
+            print(f"Already pinned, skipping upload: {result.root_cid}")
+            return result
+        cid = backend.upload_car(f).cid
+    if cid != result.root_cid:
+        raise Exception(f"{backend.name} CID {cid} does not match local root {result.root_cid}")
+    return result
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+class UploadIndex:
+    """Persistent SQLite index of CIDs already pinned on nft.storage."""
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            work_dir = os.getenv("LAMBDA_WORK_DIR", "./tmp")
+            path = os.getenv("NFT_STORAGE_INDEX_PATH", f"{work_dir}/nftstorage_index.sqlite3")
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pins (cid TEXT PRIMARY KEY, size INTEGER, pinned_at REAL)"
+        )
+        self._conn.commit()
+
+    def __contains__(self, cid: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM pins WHERE cid = ?", (cid,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pins").fetchone()[0]
+
+    def add(self, cid: str, size: Optional[int] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pins (cid, size, pinned_at) VALUES (?, ?, ?)",
+                (cid, size, time.time()),
+            )
+            self._conn.commit()
+
+    def remove(self, cid: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pins WHERE cid = ?", (cid,))
+            self._conn.commit()
+
+    def sync(self, client: Any) -> int:
+        """Import every upload listed by the nft.storage `GET /` endpoint (via NFTStorageClient.list). Returns the number seen."""
+        seen = 0
+        for upload in client.list():
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO pins (cid, size, pinned_at) VALUES (?, ?, ?)",
+                    (upload["cid"], upload.get("size"), time.time()),
+                )
+            seen += 1
+        with self._lock:
+            self._conn.commit()
+        return seen
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_upload_index: Optional[UploadIndex] = None
+_upload_index_lock = threading.Lock()
+
+
+def get_upload_index() -> UploadIndex:
+    """Process-wide index shared by every uploader, opened on first use."""
+    global _upload_index
+    with _upload_index_lock:
+        if _upload_index is None:
+            _upload_index = UploadIndex()
+        return _upload_index
@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobInProgress(Exception):
+    """Another invocation holds the lease on this idempotency key."""
+
+
+class JobRequestMismatch(Exception):
+    """The idempotency key was already claimed for a different request."""
+
+
+def _check_request(item: dict[str, Any], request: dict[str, Any]) -> None:
+    if item["request"] != request:
+        raise JobRequestMismatch(f"Job {item['job_id']} was claimed for a different request")
+
+
+class JobStore(ABC):
+    """
+    Jobs keyed by a client-supplied idempotency key, shaped like one DynamoDB item:
+    {"job_id", "status", "request", "stages": {stage: output}, "result", "error",
+    "lease_until", "created_at", "updated_at"}. Completed stage outputs are checkpoints
+    a retry can resume from. A running job is leased for `lease_seconds` so duplicate
+    deliveries don't work on it concurrently; a crashed invocation's lease simply expires.
+    """
+
+    def __init__(self, lease_seconds: int = 900):
+        self.lease_seconds = lease_seconds
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def claim(self, job_id: str, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Create the job, or take over one that failed or whose lease ran out, and return it.
+        Succeeded jobs are returned as they are. Raises JobInProgress if it is leased and
+        JobRequestMismatch if the key was claimed for a different request.
+        """
+        ...
+
+    @abstractmethod
+    def checkpoint(self, job_id: str, stage: str, output: dict[str, Any]) -> None:
+        """Record a completed stage and extend the lease."""
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, result: dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str) -> None:
+        """Mark the job failed and release the lease so a retry can resume it immediately."""
+        ...
+
+
+def _new_item(job_id: str, request: dict[str, Any], lease_until: int) -> dict[str, Any]:
+    now = int(time.time())
+    return {
+        "job_id": job_id,
+        "status": RUNNING,
+        "request": request,
+        "stages": {},
+        "lease_until": lease_until,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Local stand-in for DynamoDBJobStore; items are stored as JSON documents. For local runs
+    only: in Lambda the file lives in one container's /tmp, so a retry delivered to another
+    container would start over.
+    """
+
+    def __init__(self, path: Optional[str] = None, lease_seconds: int = 900):
+        super().__init__(lease_seconds)
+        if path is None:
+            work_dir = os.getenv("LAMBDA_WORK_DIR", "./tmp")
+            path = os.getenv("JOB_STORE_PATH", f"{work_dir}/jobs.sqlite3")
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, item TEXT)")
+        self._conn.commit()
+
+    def _get(self, job_id: str) -> Optional[dict[str, Any]]:
+        row = self._conn.execute("SELECT item FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, item: dict[str, Any]) -> None:
+        item["updated_at"] = int(time.time())
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, item) VALUES (?, ?)",
+            (item["job_id"], json.dumps(item)),
+        )
+        self._conn.commit()
+
+    def _update(self, job_id: str, **fields: Any) -> dict[str, Any]:
+        item = self._get(job_id)
+        if item is None:
+            raise Exception(f"Unknown job: {job_id}")
+        item.update(fields)
+        self._put(item)
+        return item
+
+    def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            return self._get(job_id)
+
+    def claim(self, job_id: str, request: dict[str, Any]) -> dict[str, Any]:
+        now = int(time.time())
+        with self._lock:
+            item = self._get(job_id)
+            if item is None:
+                item = _new_item(job_id, request, now + self.lease_seconds)
+                self._put(item)
+                return item
+            _check_request(item, request)
+            if item["status"] == SUCCEEDED:
+                return item
+            if item["status"] == RUNNING and item["lease_until"] > now:
+                raise JobInProgress(f"Job {job_id} is already running")
+            return self._update(job_id, status=RUNNING, lease_until=now + self.lease_seconds)
+
+    def checkpoint(self, job_id: str, stage: str, output: dict[str, Any]) -> None:
+        with self._lock:
+            item = self._get(job_id)
+            if item is None:
+                raise Exception(f"Unknown job: {job_id}")
+            item["stages"][stage] = output
+            item["lease_until"] = int(time.time()) + self.lease_seconds
+            self._put(item)
+
+    def complete(self, job_id: str, result: dict[str, Any]) -> None:
+        with self._lock:
+            self._update(job_id, status=SUCCEEDED, result=result, lease_until=0)
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._update(job_id, status=FAILED, error=error, lease_until=0)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class DynamoDBJobStore(JobStore):
+    """
+    Jobs in a DynamoDB table with partition key `job_id` (string). Claims and takeovers are
+    conditional writes, so exactly one concurrent invocation wins a lease.
+    """
+
+    def __init__(self, table_name: Optional[str] = None, table: Any = None, lease_seconds: int = 900):
+        super().__init__(lease_seconds)
+        self.table_name = table_name or os.getenv("JOB_TABLE", "text_to_nft_jobs")
+        self._table = table
+
+    @property
+    def table(self) -> Any:
+        if self._table is None:
+            import boto3
+
+            self._table = boto3.resource("dynamodb").Table(self.table_name)
+        return self._table
+
+    def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        return self.table.get_item(Key={"job_id": job_id}, ConsistentRead=True).get("Item")
+
+    def claim(self, job_id: str, request: dict[str, Any]) -> dict[str, Any]:
+        from botocore.exceptions import ClientError
+
+        now = int(time.time())
+        item = _new_item(job_id, request, now + self.lease_seconds)
+        try:
+            self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(job_id)")
+            return item
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+        item = self.get(job_id)
+        if item is not None:
+            _check_request(item, request)
+        try:
+            return self.table.update_item(
+                Key={"job_id": job_id},
+                UpdateExpression="SET #status = :running, lease_until = :lease, updated_at = :now",
+                ConditionExpression="#status <> :succeeded AND lease_until < :now",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":running": RUNNING,
+                    ":succeeded": SUCCEEDED,
+                    ":lease": now + self.lease_seconds,
+                    ":now": now,
+                },
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+        item = self.get(job_id)
+        if item is not None and item["status"] == SUCCEEDED:
+            return item
+        raise JobInProgress(f"Job {job_id} is already running")
+
+    def _set(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = int(time.time())
+        names = {f"#{name}": name for name in fields}
+        self.table.update_item(
+            Key={"job_id": job_id},
+            UpdateExpression="SET " + ", ".join(f"#{name} = :{name}" for name in fields),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":{name}": value for name, value in fields.items()},
+        )
+
+    def checkpoint(self, job_id: str, stage: str, output: dict[str, Any]) -> None:
+        self.table.update_item(
+            Key={"job_id": job_id},
+            UpdateExpression="SET stages.#stage = :output, lease_until = :lease, updated_at = :now",
+            ExpressionAttributeNames={"#stage": stage},
+            ExpressionAttributeValues={
+                ":output": output,
+                ":lease": int(time.time()) + self.lease_seconds,
+                ":now": int(time.time()),
+            },
+        )
+
+    def complete(self, job_id: str, result: dict[str, Any]) -> None:
+        self._set(job_id, status=SUCCEEDED, result=result, lease_until=0)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._set(job_id, status=FAILED, error=error, lease_until=0)
+
+
+JOB_STORES = {
+    "sqlite": SQLiteJobStore,
+    "dynamodb": DynamoDBJobStore,
+}
+
+_job_store: Optional[JobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """
+    Process-wide job store selected by JOB_STORE (sqlite or dynamodb). Defaults to dynamodb
+    inside Lambda, where retries may land on any container, and to sqlite elsewhere.
+    """
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            default = "dynamodb" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "sqlite"
+            name = os.getenv("JOB_STORE", default)
+            if name not in JOB_STORES:
+                raise Exception(f"Unknown JOB_STORE: {name}")
+            _job_store = JOB_STORES[name](lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", "900")))
+        return _job_store
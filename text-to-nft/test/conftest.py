@@ -0,0 +1,19 @@
+import pytest
+from storage.backends import LocalFSBackend
+from storage.jobs import SQLiteJobStore
+from upload_bundle_nftstorage import pack_bundle, upload_bundle
+
+
+@pytest.fixture
+def local_handler(tmp_path, monkeypatch):
+    """The Lambda handler wired to a local block store and a SQLite job store under tmp_path."""
+    # Imported here so only the handler tests pay for its init (secret prefetch, backend)
+    import lambda_function_text2nft as handler
+
+    backend = LocalFSBackend(str(tmp_path / "ipfs"))
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(handler, "get_job_store", lambda: store)
+    monkeypatch.setattr(handler, "pack_bundle", lambda *args: pack_bundle(*args, backend=backend))
+    monkeypatch.setattr(handler, "upload_bundle", lambda bundle: upload_bundle(bundle, backend))
+    monkeypatch.setattr(handler, "mint_address", lambda idempotency_key: f"mint-{idempotency_key}", raising=False)
+    return backend, store
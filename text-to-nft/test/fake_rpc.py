@@ -0,0 +1,129 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+
+class FakeRPCError(Exception):
+    """Raise from a FakeRPC method to answer with a JSON-RPC error object."""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(message)
+        self.error = {"code": code, "message": message}
+        if data is not None:
+            self.error["data"] = data
+
+
+class FakeRPC:
+    """
+    Minimal Solana JSON-RPC server for tests. `methods` maps an RPC method name to a function
+    of the request params returning the `result` value. Records calls and TCP connections.
+    """
+
+    def __init__(self, methods: dict[str, Callable[[list], Any]]):
+        self.methods = methods
+        self.calls: list[str] = []
+        self.params: list[list] = []
+        self.connections = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; don't let Nagle delay the body
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                fake.connections += 1
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests = request if isinstance(request, list) else [request]
+                responses = []
+                for req in requests:
+                    fake.calls.append(req["method"])
+                    fake.params.append(req.get("params", []))
+                    try:
+                        result = fake.methods[req["method"]](req.get("params", []))
+                    except FakeRPCError as e:
+                        responses.append({"jsonrpc": "2.0", "error": e.error, "id": req["id"]})
+                        continue
+                    responses.append({"jsonrpc": "2.0", "result": result, "id": req["id"]})
+                payload = json.dumps(responses if isinstance(request, list) else responses[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeSignatureWS:
+    """
+    Websocket server answering signatureSubscribe: confirms each subscription, then sends its
+    signatureNotification (with `err`) `delay` seconds later. Any number of subscriptions may
+    share a connection; `connections` counts them.
+    """
+
+    def __init__(self, delay: float = 0.1, err: Any = None):
+        from websockets.sync.server import serve
+
+        self.subscriptions: list[list] = []
+        self.connections = 0
+
+        def handler(ws):
+            self.connections += 1
+            for raw in ws:
+                request = json.loads(raw)
+                if request["method"] != "signatureSubscribe":
+                    continue
+                subscription = len(self.subscriptions)
+                self.subscriptions.append(request["params"])
+                ws.send(json.dumps({"jsonrpc": "2.0", "result": subscription, "id": request["id"]}))
+                threading.Timer(delay, notify, args=(ws, subscription)).start()
+
+        def notify(ws, subscription):
+            notification = {
+                "jsonrpc": "2.0",
+                "method": "signatureNotification",
+                "params": {"result": {"context": {"slot": 5}, "value": {"err": err}}, "subscription": subscription},
+            }
+            try:
+                ws.send(json.dumps(notification))
+            except Exception:
+                pass
+
+        self.server = serve(handler, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.socket.getsockname()[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+def signature_status(confirmation_status: Any, confirmations: Any = None, err: Any = None) -> dict:
+    """getSignatureStatuses result for one signature (None while it is unknown)."""
+    if confirmation_status is None:
+        value = [None]
+    else:
+        value = [
+            {
+                "slot": 5,
+                "confirmations": confirmations,
+                "err": err,
+                "status": {"Ok": None} if err is None else {"Err": err},
+                "confirmationStatus": confirmation_status,
+            }
+        ]
+    return {"context": {"slot": 5}, "value": value}
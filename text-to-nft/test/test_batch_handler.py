@@ -0,0 +1,41 @@
+import io
+import json
+import threading
+import time
+import lambda_function_text2nft as handler
+
+
+def record(message_id, **event):
+    return {"messageId": message_id, "body": json.dumps(event)}
+
+
+def test_batch_reports_only_failed_records(local_handler, monkeypatch):
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def generate(text):
+        nonlocal in_flight, peak
+        if text == "explode":
+            raise Exception("generation failed")
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return io.BytesIO(text.encode())
+
+    monkeypatch.setattr(handler, "text2img_buffer", generate)
+    monkeypatch.setitem(handler.STAGE_LIMITS, "generate", threading.BoundedSemaphore(2))
+
+    job = {"name": "n", "symbol": "s", "receiver_public_key": "k"}
+    event = {
+        "Records": [record(str(i), text=f"prompt {i}", **job) for i in range(6)]
+        + [record("bad-json", **job), record("boom", text="explode", **job)]
+    }
+    event["Records"][-2]["body"] = "{"
+
+    result = handler.batch_handler(event, None)
+    assert sorted(f["itemIdentifier"] for f in result["batchItemFailures"]) == ["bad-json", "boom"]
+    assert peak == 2
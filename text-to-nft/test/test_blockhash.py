@@ -0,0 +1,63 @@
+import time
+from solders.hash import Hash
+from fake_rpc import FakeRPC
+from utils.blockhash import BlockhashProvider
+from utils.rpc import RPCRegistry
+
+
+def latest_blockhash(params):
+    return {
+        "context": {"slot": 1},
+        "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": 150},
+    }
+
+
+def test_get_is_served_from_cache():
+    rpc = FakeRPC({"getLatestBlockhash": latest_blockhash})
+    registry = RPCRegistry()
+    try:
+        provider = BlockhashProvider(registry.client(rpc.url), interval=60)
+        first = provider.get()
+        assert first.last_valid_block_height == 150
+        assert all(provider.get() == first for _ in range(50))
+        assert rpc.calls == ["getLatestBlockhash"]
+        # A rejected blockhash is replaced on the spot
+        assert provider.get(exclude=first.blockhash).blockhash != first.blockhash
+        assert len(rpc.calls) == 2
+    finally:
+        registry.close()
+        rpc.close()
+
+
+def test_background_refresh_and_idle_stop():
+    rpc = FakeRPC({"getLatestBlockhash": latest_blockhash})
+    registry = RPCRegistry()
+    try:
+        provider = BlockhashProvider(registry.client(rpc.url), interval=0.05, idle_timeout=0.3)
+        first = provider.get()
+        time.sleep(0.2)
+        # Refreshed without anyone waiting on it
+        assert provider.get() != first
+        assert len(rpc.calls) >= 3
+        time.sleep(0.6)
+        assert provider._thread is None
+        calls = len(rpc.calls)
+        time.sleep(0.2)
+        assert len(rpc.calls) == calls
+    finally:
+        registry.close()
+        rpc.close()
+
+
+def test_stale_blockhash_is_refetched():
+    rpc = FakeRPC({"getLatestBlockhash": latest_blockhash})
+    registry = RPCRegistry()
+    try:
+        provider = BlockhashProvider(registry.client(rpc.url), interval=60, max_age=0.1)
+        first = provider.get()
+        time.sleep(0.15)
+        assert provider.get() != first
+        assert len(rpc.calls) == 2
+    finally:
+        registry.close()
+        rpc.close()
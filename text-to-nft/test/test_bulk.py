@@ -0,0 +1,80 @@
+import base64
+import json
+from cryptography.fernet import Fernet
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.transaction import Transaction as SoldersTransaction
+from fake_rpc import FakeRPC, signature_status
+from api.metaplex_api import MetaplexAPI
+from metaplex.bulk import MINT, PACKET_DATA_SIZE, TRANSFER, BulkItem, pack, transaction_size
+from utils.blockhash import get_blockhash_provider
+from utils.confirmation import get_tracker
+
+SOURCE = Keypair()
+
+
+def items(count: int, mode: str = MINT) -> list[BulkItem]:
+    return [BulkItem(str(Keypair().pubkey()), str(Keypair().pubkey()), mode) for _ in range(count)]
+
+
+def test_pack_fills_transactions_up_to_packet_size():
+    bulk = items(40) + items(10, TRANSFER)
+    batches = pack(SOURCE, bulk)
+    assert [item for _, batch in batches for item in batch] == bulk
+    assert len(batches) < len(bulk) / 5
+    for tx, batch in batches:
+        tx.recent_blockhash = Hash.new_unique()
+        tx.sign(SOURCE)
+        size = len(tx.serialize())
+        # The estimate is exact
+        assert size == transaction_size(list(tx.instructions), SOURCE.pubkey())[0]
+        assert size <= PACKET_DATA_SIZE
+    # Greedy: no transaction could have taken the next item
+    for (tx, batch), (_, following) in zip(batches, batches[1:]):
+        assert len(pack(SOURCE, batch + following[:1])) == 2
+
+
+def test_pack_leaves_room_for_compute_budget():
+    for tx, _ in pack(SOURCE, items(30), reserve_compute_budget=True):
+        instructions = [set_compute_unit_limit(200_000), set_compute_unit_price(1000), *tx.instructions]
+        assert transaction_size(instructions, SOURCE.pubkey())[0] <= PACKET_DATA_SIZE
+
+
+def test_bulk_mint_reports_every_item(monkeypatch):
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    sent: list[str] = []
+
+    def send(params):
+        sent.append(params[0])
+        return str(SoldersTransaction.from_bytes(base64.b64decode(params[0])).signatures[0])
+
+    rpc = FakeRPC(
+        {
+            "getLatestBlockhash": lambda params: {
+                "context": {"slot": 1},
+                "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": 1000},
+            },
+            "sendTransaction": send,
+            "getSignatureStatuses": lambda params: {
+                "context": {"slot": 5},
+                "value": [signature_status("finalized")["value"][0] for _ in params[0]],
+            },
+        }
+    )
+    get_tracker(rpc.url).interval = 0.05
+    get_blockhash_provider(rpc.url).interval = 60
+    api = MetaplexAPI(
+        {"PRIVATE_KEY": str(SOURCE), "PUBLIC_KEY": str(SOURCE.pubkey()), "DECRYPTION_KEY": Fernet.generate_key()}
+    )
+    try:
+        pairs = [(item.contract, item.receiver) for item in items(60)]
+        response = json.loads(api.bulk_mint(rpc.url, pairs, max_in_flight=4, max_timeout=5))
+        assert response["status"] == 200
+        assert [(r["contract"], r["receiver"]) for r in response["results"]] == pairs
+        assert all(r["status"] == 200 for r in response["results"])
+        assert len(sent) == response["transactions"] < len(pairs) / 5
+        # Items carried by one transaction share its signature
+        assert len({r["result"] for r in response["results"]}) == response["transactions"]
+    finally:
+        rpc.close()
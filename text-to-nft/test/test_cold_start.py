@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_handler_does_not_load_chain_stack_unless_minting():
+    code = (
+        "import sys, lambda_function_text2nft, storage.collection; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} & {'solana', 'solders', 'spl', 'construct'}))"
+    )
+    env = {**os.environ, "MINT_ENABLED": "", "STORAGE_BACKEND": "local", "AWS_EC2_METADATA_DISABLED": "true"}
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert out.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,103 @@
+import json
+import pytest
+import storage.cid
+from storage.backends import LocalFSBackend
+from storage.cid import canonical_json, cid_to_str, compute_cid, decode_dag_pb
+from storage.collection import (
+    CollectionBuilder,
+    plan_collection,
+    upload_collection_metadata,
+    validate_metadata,
+)
+
+CREATORS = [{"address": "creator-a", "share": 60}, {"address": "creator-b", "share": 40}]
+
+
+def drop(count: int, **kwargs) -> CollectionBuilder:
+    builder = CollectionBuilder("DROP", seller_fee_basis_points=500, creators=CREATORS, **kwargs)
+    for i in range(count):
+        builder.add(f"Item {i}", f"ipfs://image{i}", attributes=[{"trait_type": "n", "value": i}])
+    return builder
+
+
+def test_collection_upload_matches_plan_and_layout(tmp_path):
+    backend = LocalFSBackend(str(tmp_path))
+    builder = drop(12)
+    plan = plan_collection(builder, backend)
+    result = upload_collection_metadata(builder, backend)
+    assert result == plan
+    assert plan.uris["Item 10"] == f"ipfs://{plan.root_cid}/10.json" == f"{plan.base_uri}/10.json"
+
+    # One link per item, sorted by name, each the canonical JSON of its document
+    _, links = decode_dag_pb(backend.get_block(plan.root_cid))
+    assert [name for name, _, _ in links] == sorted(f"{i}.json" for i in range(12))
+    link_cids = {name: cid_to_str(cid) for name, cid, _ in links}
+    for i, document in enumerate(builder.documents):
+        serialized = backend.cat(plan.uris[document["name"]])
+        assert serialized == canonical_json(document) and json.loads(serialized) == document
+        assert compute_cid(serialized) == link_cids[f"{i}.json"]
+
+    # Key order doesn't change the CIDs; content does
+    reordered = CollectionBuilder("DROP", seller_fee_basis_points=500, creators=CREATORS)
+    for document in builder.documents:
+        reordered.documents.append(dict(reversed(list(document.items()))))
+    assert plan_collection(reordered, backend).root_cid == plan.root_cid
+    assert plan_collection(drop(11), backend).root_cid != plan.root_cid
+
+
+def test_collection_reupload_is_skipped(tmp_path):
+    class CountingBackend(LocalFSBackend):
+        cars = 0
+
+        def upload_car(self, car):
+            CountingBackend.cars += 1
+            return super().upload_car(car)
+
+    backend = CountingBackend(str(tmp_path))
+    upload_collection_metadata(drop(3), backend)
+    upload_collection_metadata(drop(3), backend)
+    assert CountingBackend.cars == 1
+
+
+@pytest.mark.parametrize(
+    "change, message",
+    [
+        ({"name": ""}, "name is required"),
+        ({"name": "n" * 33}, "name is longer"),
+        ({"symbol": "SYMBOL-TOO-LONG"}, "symbol is longer"),
+        ({"seller_fee_basis_points": 10001}, "seller_fee_basis_points"),
+        ({"attributes": [{"value": 1}]}, "trait_type"),
+        ({"properties": {"category": "book"}}, "category"),
+        ({"properties": {"files": [{"uri": "u"}]}}, "uri and type"),
+        ({"properties": {"creators": [{"address": "a", "share": 50}]}}, "add up to 100"),
+        ({"properties": {"creators": [{"address": "a", "share": "100"}]}}, "integer"),
+        ({"properties": {"creators": [{"address": "a", "share": 100.0}]}}, "integer"),
+        ({"properties": {"creators": [{"address": "a"}]}}, "address and share"),
+    ],
+)
+def test_validate_metadata_rejects(change, message):
+    document = {"name": "n", "symbol": "S", "image": "ipfs://image", **change}
+    with pytest.raises(Exception, match=message):
+        validate_metadata(document)
+
+
+def test_builder_rejects_duplicates_and_invalid_items():
+    builder = drop(1)
+    with pytest.raises(Exception, match="Duplicate"):
+        builder.add("Item 0", "ipfs://other")
+    with pytest.raises(Exception, match="image is required"):
+        builder.add("Item 1", "")
+    assert len(builder.documents) == 1
+
+
+def test_large_drop_is_refused_before_the_directory_block_outgrows_the_limit(tmp_path, monkeypatch):
+    backend = LocalFSBackend(str(tmp_path))
+    builder = drop(50)
+    plan_collection(builder, backend)
+    # About 53 bytes per link: the real 1 MiB limit is reached near 20k items
+    monkeypatch.setattr(storage.cid, "MAX_BLOCK_SIZE", 40 * 53)
+    with pytest.raises(Exception, match="block limit"):
+        plan_collection(builder, backend)
+    with pytest.raises(Exception, match="block limit"):
+        upload_collection_metadata(builder, backend)
+    assert not (tmp_path / "blocks").exists()
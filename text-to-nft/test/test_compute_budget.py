@@ -0,0 +1,133 @@
+import base64
+import pytest
+from solana.transaction import Transaction
+from solders.address_lookup_table_account import AddressLookupTableAccount
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.system_program import TransferParams, transfer
+from solders.transaction import VersionedTransaction
+from fake_rpc import FakeRPC
+from utils.compute_budget import ComputeBudgetTuner
+from utils.rpc import RPCRegistry
+
+PAYER = Keypair()
+RECEIVER = Keypair().pubkey()
+
+
+def simulation(units: int, err=None) -> dict:
+    return {
+        "context": {"slot": 1},
+        "value": {"err": err, "logs": [], "accounts": None, "unitsConsumed": units, "returnData": None},
+    }
+
+
+def transfer_tx(lamports: int = 1) -> Transaction:
+    return Transaction().add(
+        transfer(TransferParams(from_pubkey=PAYER.pubkey(), to_pubkey=RECEIVER, lamports=lamports))
+    )
+
+
+def tuner_for(registry: RPCRegistry, url: str, **kwargs) -> ComputeBudgetTuner:
+    return ComputeBudgetTuner(registry.client(url), registry.provider(url), **kwargs)
+
+
+@pytest.fixture
+def registry():
+    registry = RPCRegistry()
+    yield registry
+    registry.close()
+
+
+def test_tune_prepends_limit_and_capped_percentile_price(registry):
+    fees = [{"slot": slot, "prioritizationFee": fee} for slot, fee in enumerate([0, 0, 10, 20, 30, 40, 500, 9000])]
+    rpc = FakeRPC(
+        {
+            "simulateTransaction": lambda params: simulation(1000),
+            "getRecentPrioritizationFees": lambda params: fees,
+        }
+    )
+    try:
+        tuner = tuner_for(registry, rpc.url, percentile=75, cap=400)
+        tuned = tuner.tune(transfer_tx(), PAYER.pubkey(), Hash.new_unique())
+        assert tuned.instructions[0] == set_compute_unit_limit(1400)
+        # The 75th percentile (500) is over the cap
+        assert tuned.instructions[1] == set_compute_unit_price(400)
+        assert tuned.instructions[2:] == transfer_tx().instructions
+        # Only the writable accounts are asked about
+        assert rpc.params[-1] == [[str(PAYER.pubkey()), str(RECEIVER)]]
+
+        # Tuning it again reuses both estimates and doesn't stack budget instructions
+        again = tuner.tune(tuned, PAYER.pubkey(), Hash.new_unique())
+        assert again.instructions == tuned.instructions
+        assert rpc.calls == ["simulateTransaction", "getRecentPrioritizationFees"]
+        # The fee request goes through the registry's pooled provider like every other call
+        assert registry.calls()["getRecentPrioritizationFees"] == 1
+    finally:
+        rpc.close()
+
+
+def test_units_are_cached_per_instruction_data(registry):
+    simulations = []
+
+    def simulate(params):
+        simulations.append(params)
+        return simulation(1000 * len(simulations))
+
+    rpc = FakeRPC({"simulateTransaction": simulate, "getRecentPrioritizationFees": lambda params: []})
+    try:
+        tuner = tuner_for(registry, rpc.url)
+        first = tuner.tune(transfer_tx(1), PAYER.pubkey(), Hash.new_unique())
+        assert tuner.tune(transfer_tx(1), PAYER.pubkey(), Hash.new_unique()).instructions == first.instructions
+        # Same accounts and data length, different data: simulated on its own
+        other = tuner.tune(transfer_tx(2), PAYER.pubkey(), Hash.new_unique())
+        assert len(simulations) == 2 and other.instructions[0] == set_compute_unit_limit(2500)
+    finally:
+        rpc.close()
+
+
+def test_units_for_lookup_table_transactions_are_simulated_as_v0(registry):
+    receivers = [Keypair().pubkey() for _ in range(40)]
+    table = AddressLookupTableAccount(Keypair().pubkey(), receivers)
+    tx = Transaction()
+    for receiver in receivers:
+        tx.add(transfer(TransferParams(from_pubkey=PAYER.pubkey(), to_pubkey=receiver, lamports=1)))
+    simulated = []
+    rpc = FakeRPC(
+        {
+            "simulateTransaction": lambda params: simulated.append(params[0]) or simulation(6000),
+            "getRecentPrioritizationFees": lambda params: [],
+        }
+    )
+    try:
+        # Forty receivers don't fit a legacy transaction, only a v0 one loading them from the table
+        tuned = tuner_for(registry, rpc.url).tune(tx, PAYER.pubkey(), Hash.new_unique(), [table])
+        assert tuned.instructions[0] == set_compute_unit_limit(6900)
+        sent = VersionedTransaction.from_bytes(base64.b64decode(simulated[0]))
+        assert sent.message.address_table_lookups[0].account_key == table.key
+    finally:
+        rpc.close()
+
+
+def test_tune_without_fee_data_sets_only_the_limit(registry):
+    rpc = FakeRPC(
+        {
+            "simulateTransaction": lambda params: simulation(150),
+            "getRecentPrioritizationFees": lambda params: [],
+        }
+    )
+    try:
+        tuned = tuner_for(registry, rpc.url).tune(transfer_tx(), PAYER.pubkey(), Hash.new_unique())
+        assert tuned.instructions[0] == set_compute_unit_limit(465)
+        assert tuned.instructions[1:] == transfer_tx().instructions
+    finally:
+        rpc.close()
+
+
+def test_failing_simulation_is_raised(registry):
+    rpc = FakeRPC({"simulateTransaction": lambda params: simulation(150, err={"InstructionError": [0, {"Custom": 1}]})})
+    try:
+        with pytest.raises(Exception, match="simulation failed"):
+            tuner_for(registry, rpc.url).tune(transfer_tx(), PAYER.pubkey(), Hash.new_unique())
+    finally:
+        rpc.close()
@@ -0,0 +1,131 @@
+import time
+import pytest
+from solders.signature import Signature
+from fake_rpc import FakeRPC, FakeSignatureWS, signature_status
+from utils.confirmation import (
+    ConfirmationTracker,
+    TransactionFailed,
+    confirm_async,
+    confirm_transaction,
+    get_subscriber,
+    ws_endpoint,
+)
+from utils.rpc import RPCRegistry
+
+SIGNATURE = Signature.default()
+
+
+def test_ws_endpoint():
+    assert ws_endpoint("https://api.testnet.solana.com/") == "wss://api.testnet.solana.com/"
+    assert ws_endpoint("http://127.0.0.1:8899") == "ws://127.0.0.1:8900"
+    # Providers that serve both on one explicit port keep it
+    assert ws_endpoint("https://rpc.example.com:443/key") == "wss://rpc.example.com:443/key"
+    assert ws_endpoint("http://10.0.0.5:8080") == "ws://10.0.0.5:8080"
+
+
+def test_websocket_notification_resolves_confirmation(monkeypatch):
+    rpc = FakeRPC({"getSignatureStatuses": lambda params: signature_status(None)})
+    ws = FakeSignatureWS(delay=0.1)
+    monkeypatch.setenv("SOLANA_WS_URL", ws.url)
+    try:
+        start = time.monotonic()
+        assert confirm_transaction(rpc.url, SIGNATURE, max_timeout=5)
+        assert time.monotonic() - start < 1
+        assert ws.subscriptions == [[str(SIGNATURE), {"commitment": "finalized"}]]
+        # Only the one status check made right after subscribing
+        assert rpc.calls == ["getSignatureStatuses"]
+    finally:
+        ws.close()
+        rpc.close()
+
+
+def test_websocket_subscriptions_share_one_connection(monkeypatch):
+    rpc = FakeRPC({"getSignatureStatuses": lambda params: signature_status(None)})
+    ws = FakeSignatureWS(delay=0.3)
+    monkeypatch.setenv("SOLANA_WS_URL", ws.url)
+    try:
+        signatures = [Signature.new_unique() for _ in range(50)]
+        futures = [confirm_async(rpc.url, signature, max_timeout=5) for signature in signatures]
+        assert all(future.result(timeout=5) for future in futures)
+        assert ws.connections == 1 and len(ws.subscriptions) == 50
+        # The "already landed?" checks were batched by the tracker, not one query each
+        assert len(rpc.calls) < 10
+        # Closed once idle; the next confirmation opens a new connection
+        time.sleep(0.6)
+        assert get_subscriber(rpc.url)._socket.closed
+        assert confirm_async(rpc.url, SIGNATURE, max_timeout=5).result(timeout=5)
+        assert ws.connections == 2
+    finally:
+        ws.close()
+        rpc.close()
+
+
+def test_websocket_reports_failed_transaction(monkeypatch):
+    rpc = FakeRPC({"getSignatureStatuses": lambda params: signature_status(None)})
+    ws = FakeSignatureWS(delay=0, err={"InstructionError": [0, "InvalidArgument"]})
+    monkeypatch.setenv("SOLANA_WS_URL", ws.url)
+    try:
+        with pytest.raises(TransactionFailed):
+            confirm_transaction(rpc.url, SIGNATURE, max_timeout=5)
+    finally:
+        ws.close()
+        rpc.close()
+
+
+def test_falls_back_to_tracker_polling(monkeypatch):
+    statuses = iter([None, "processed", "confirmed"])
+    rpc = FakeRPC(
+        {"getSignatureStatuses": lambda params: signature_status(next(statuses, "finalized"))}
+    )
+    # Nothing listens on the websocket port
+    monkeypatch.setenv("SOLANA_WS_URL", "ws://127.0.0.1:1")
+    try:
+        start = time.monotonic()
+        assert confirm_transaction(rpc.url, SIGNATURE, max_timeout=5)
+        # Three 0.4 s tracker ticks
+        assert time.monotonic() - start < 2
+        assert rpc.calls == ["getSignatureStatuses"] * 4
+    finally:
+        rpc.close()
+
+
+def test_polling_times_out(monkeypatch):
+    rpc = FakeRPC({"getSignatureStatuses": lambda params: signature_status("confirmed", 3)})
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    try:
+        assert not confirm_transaction(rpc.url, SIGNATURE, max_timeout=0.5)
+        assert confirm_transaction(rpc.url, SIGNATURE, max_timeout=0.5, target=3, finalized=False)
+    finally:
+        rpc.close()
+
+
+def test_tracker_batches_all_pending_signatures():
+    polls = []
+
+    def statuses(params):
+        signatures = params[0]
+        polls.append(len(signatures))
+        # Nothing has landed for the first few calls; then everything is finalized and signature 0 failed
+        if len(polls) <= 3:
+            return {"context": {"slot": 5}, "value": [None] * len(signatures)}
+        value = [signature_status("finalized")["value"][0] for _ in signatures]
+        if str(Signature.default()) in signatures:
+            value[signatures.index(str(Signature.default()))]["err"] = {"InsufficientFundsForRent": {"account_index": 0}}
+        return {"context": {"slot": 5}, "value": value}
+
+    rpc = FakeRPC({"getSignatureStatuses": statuses})
+    registry = RPCRegistry()
+    tracker = ConfirmationTracker(registry.client(rpc.url), interval=0.05)
+    try:
+        signatures = [Signature.default()] + [Signature.new_unique() for _ in range(599)]
+        called = []
+        futures = [tracker.track(signature, callback=called.append) for signature in signatures]
+        with pytest.raises(TransactionFailed):
+            futures[0].result(timeout=5)
+        assert all(future.result(timeout=5) for future in futures[1:])
+        assert len(called) == 600 and tracker.pending() == 0
+        # A handful of batched calls (ticks may start while signatures are still being added)
+        assert max(polls) == 256 and len(polls) <= 8
+    finally:
+        registry.close()
+        rpc.close()
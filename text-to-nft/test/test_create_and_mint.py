@@ -0,0 +1,102 @@
+import base64
+import json
+from cryptography.fernet import Fernet
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.transaction import Transaction as SoldersTransaction
+from fake_rpc import FakeRPC, FakeRPCError, signature_status
+from api.metaplex_api import MetaplexAPI
+from metaplex.metadata import METADATA_PROGRAM_ID, TOKEN_PROGRAM_ID
+from metaplex.transactions import create_and_mint
+from utils.blockhash import get_blockhash_provider
+from utils.confirmation import get_tracker
+
+PACKET_DATA_SIZE = 1232
+
+
+def test_create_and_mint_is_one_transaction_with_final_uri():
+    rpc = FakeRPC({"getMinimumBalanceForRentExemption": lambda params: 1461600})
+    payer = Keypair()
+    link = "https://" + "a" * 192
+    try:
+        tx, signers, contract = create_and_mint(
+            rpc.url, payer, "A" * 32, "A" * 10, 0, str(Keypair().pubkey()), link
+        )
+        # Rent is the only lookup: no metadata read, no ATA check for a brand new mint
+        assert rpc.calls == ["getMinimumBalanceForRentExemption"]
+        assert [str(signer.pubkey()) for signer in signers] == [str(payer.pubkey()), contract]
+        create_metadata = next(ix for ix in tx.instructions if ix.program_id == METADATA_PROGRAM_ID)
+        assert link.encode() in bytes(create_metadata.data)
+
+        tx.recent_blockhash = Hash.new_unique()
+        tx.sign(*signers)
+        # Fits a packet even with the longest name, symbol and URI
+        assert len(tx.serialize()) <= PACKET_DATA_SIZE
+    finally:
+        rpc.close()
+
+
+def test_retries_with_one_idempotency_key_mint_once(monkeypatch):
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    created: dict[str, str] = {}
+    sent: list[str] = []
+
+    def send(params):
+        tx = SoldersTransaction.from_bytes(base64.b64decode(params[0]))
+        signature = str(tx.signatures[0])
+        sent.append(signature)
+        # Every account that signed (the payer and the new mint) exists once it lands
+        for key in tx.message.account_keys[: tx.message.header.num_required_signatures]:
+            created[str(key)] = signature
+        if len(sent) > 1:
+            raise FakeRPCError(-32002, "Transaction simulation failed")
+        return signature
+
+    def account_info(params):
+        if params[0] not in created:
+            return {"context": {"slot": 5}, "value": None}
+        account = {
+            "data": ["", "base64"],
+            "executable": False,
+            "lamports": 1461600,
+            "owner": str(TOKEN_PROGRAM_ID),
+            "rentEpoch": 0,
+        }
+        return {"context": {"slot": 5}, "value": account}
+
+    signature_info = {"slot": 5, "err": None, "memo": None, "blockTime": None, "confirmationStatus": "finalized"}
+    rpc = FakeRPC(
+        {
+            "getMinimumBalanceForRentExemption": lambda params: 1461600,
+            "getLatestBlockhash": lambda params: {
+                "context": {"slot": 1},
+                "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": 1000},
+            },
+            "sendTransaction": send,
+            "getSignatureStatuses": lambda params: signature_status("finalized"),
+            "getAccountInfo": account_info,
+            "getSignaturesForAddress": lambda params: [{**signature_info, "signature": created[params[0]]}],
+        }
+    )
+    get_tracker(rpc.url).interval = 0.05
+    get_blockhash_provider(rpc.url).interval = 60
+    payer = Keypair()
+    api = MetaplexAPI(
+        {"PRIVATE_KEY": str(payer), "PUBLIC_KEY": str(payer.pubkey()), "DECRYPTION_KEY": Fernet.generate_key()}
+    )
+    receiver = str(Keypair().pubkey())
+    try:
+        mint = str(api.mint_keypair("key").pubkey())
+        assert mint == str(api.mint_keypair("key").pubkey()) != str(api.mint_keypair("other").pubkey())
+        first = json.loads(api.create_and_mint(rpc.url, "N", "S", 0, receiver, "ipfs://x", idempotency_key="key"))
+        assert first["status"] == 200 and first["contract"] == mint and first["result"] == sent[0]
+
+        # The retry finds the mint and returns the transaction that created it
+        again = json.loads(api.create_and_mint(rpc.url, "N", "S", 0, receiver, "ipfs://x", idempotency_key="key"))
+        assert again == {"contract": mint, "result": sent[0], "status": 200} and len(sent) == 1
+
+        # A send that fails although the transaction landed is reported as the mint it created
+        other = json.loads(api.create_and_mint(rpc.url, "N", "S", 0, receiver, "ipfs://x", idempotency_key="other"))
+        assert other == {"contract": str(api.mint_keypair("other").pubkey()), "result": sent[1], "status": 200}
+    finally:
+        rpc.close()
@@ -0,0 +1,85 @@
+import time
+from solders.pubkey import Pubkey
+from fake_rpc import FakeRPC, FakeRPCError
+from utils import rpc as rpc_module
+from utils.rpc import RPCRegistry
+
+SIGNATURE = "1111111111111111111111111111111111111111111111111111111111111111"
+
+
+def block_height(delay: float = 0):
+    return lambda params: time.sleep(delay) or 100
+
+
+def account_info(delay: float = 0):
+    return lambda params: time.sleep(delay) or {"context": {"slot": 1}, "value": None}
+
+
+def test_reads_go_to_fastest_endpoint():
+    slow = FakeRPC({"getBlockHeight": block_height(0.05)})
+    fast = FakeRPC({"getBlockHeight": block_height()})
+    registry = RPCRegistry()
+    try:
+        client = registry.client(f"{slow.url},{fast.url}")
+        for _ in range(20):
+            assert client.get_block_height().value == 100
+        assert len(slow.calls) <= 2
+        assert len(fast.calls) >= 18
+    finally:
+        registry.close()
+        slow.close()
+        fast.close()
+
+
+def test_slow_read_is_hedged(monkeypatch):
+    monkeypatch.setattr(rpc_module, "HEDGE_DEFAULT_DELAY", 0.05)
+    stalled = FakeRPC({"getAccountInfo": account_info(1)})
+    healthy = FakeRPC({"getAccountInfo": account_info()})
+    registry = RPCRegistry()
+    try:
+        client = registry.client(f"{stalled.url},{healthy.url}")
+        start = time.monotonic()
+        assert client.get_account_info(Pubkey.default()).value is None
+        assert time.monotonic() - start < 0.5
+        assert stalled.calls == ["getAccountInfo"] and healthy.calls == ["getAccountInfo"]
+    finally:
+        registry.close()
+        stalled.close()
+        healthy.close()
+
+
+def test_fails_over_from_unreachable_endpoint():
+    healthy = FakeRPC({"getBlockHeight": block_height()})
+    registry = RPCRegistry()
+    try:
+        # Nothing listens on port 1
+        client = registry.client(f"http://127.0.0.1:1,{healthy.url}")
+        for _ in range(5):
+            assert client.get_block_height().value == 100
+        pool = registry._pools[f"http://127.0.0.1:1,{healthy.url}"]
+        assert pool.ranked()[0].endpoint_uri == healthy.url
+        assert len(healthy.calls) == 5
+    finally:
+        registry.close()
+        healthy.close()
+
+
+def test_send_fans_out_and_first_acceptance_wins():
+    def reject(params):
+        raise FakeRPCError(-32005, "Node is behind")
+
+    nodes = [
+        FakeRPC({"sendTransaction": reject}),
+        FakeRPC({"sendTransaction": lambda params: SIGNATURE}),
+        FakeRPC({"sendTransaction": lambda params: time.sleep(0.1) or SIGNATURE}),
+    ]
+    registry = RPCRegistry()
+    try:
+        client = registry.client(",".join(node.url for node in nodes))
+        assert str(client.send_raw_transaction(b"\x00" * 64).value) == SIGNATURE
+        time.sleep(0.2)
+        assert [node.calls for node in nodes] == [["sendTransaction"]] * 3
+    finally:
+        registry.close()
+        for node in nodes:
+            node.close()
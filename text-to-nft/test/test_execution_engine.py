@@ -0,0 +1,163 @@
+import base64
+import pytest
+from solana.transaction import Transaction
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.system_program import TransferParams, transfer
+from solders.transaction import Transaction as SoldersTransaction
+from fake_rpc import FakeRPC, FakeRPCError, signature_status
+from utils import execution_engine
+from utils.blockhash import get_blockhash_provider
+from utils.confirmation import TransactionFailed, get_tracker
+from utils.execution_engine import FATAL, PROCESSED, RESIGN, RETRY, classify_error, execute
+
+PAYER = Keypair()
+
+
+def transfer_tx() -> Transaction:
+    return Transaction().add(
+        transfer(TransferParams(from_pubkey=PAYER.pubkey(), to_pubkey=Keypair().pubkey(), lamports=1))
+    )
+
+
+def blockhash(last_valid_block_height: int) -> dict:
+    return {
+        "context": {"slot": 1},
+        "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": last_valid_block_height},
+    }
+
+
+def signature_of(params: list) -> str:
+    return str(SoldersTransaction.from_bytes(base64.b64decode(params[0])).signatures[0])
+
+
+@pytest.fixture(autouse=True)
+def fast_landing(monkeypatch):
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    monkeypatch.setattr(execution_engine, "REBROADCAST_INTERVAL", 0.1)
+
+
+def serve(methods: dict) -> FakeRPC:
+    rpc = FakeRPC(methods)
+    get_tracker(rpc.url).interval = 0.05
+    # Only the fetches execute() asks for
+    get_blockhash_provider(rpc.url).interval = 60
+    return rpc
+
+
+def test_classify_error():
+    assert classify_error(Exception("Blockhash not found")) == RESIGN
+    assert classify_error(Exception("AlreadyProcessed")) == PROCESSED
+    assert classify_error(Exception("Attempt to debit an account but found no record of a prior credit; insufficient funds")) == FATAL
+    assert classify_error(TransactionFailed("InstructionError")) == FATAL
+    assert classify_error(Exception("Connection reset by peer")) == RETRY
+
+
+def test_rebroadcasts_same_bytes_until_confirmed():
+    sent: list[str] = []
+    rpc = serve(
+        {
+            "getLatestBlockhash": lambda params: blockhash(1000),
+            "getBlockHeight": lambda params: 10,
+            "sendTransaction": lambda params: sent.append(params[0]) or signature_of(params),
+            "getSignatureStatuses": lambda params: signature_status("finalized" if len(sent) >= 3 else None),
+        }
+    )
+    try:
+        response = execute(rpc.url, transfer_tx(), [PAYER], max_timeout=5)
+        assert response is not None and str(response.value) == signature_of([sent[0]])
+        assert len(sent) >= 3 and len(set(sent)) == 1
+        assert rpc.calls.count("getLatestBlockhash") == 1
+    finally:
+        rpc.close()
+
+
+def test_resigns_only_after_blockhash_expires():
+    heights = iter([10, 30])
+    sent: list[str] = []
+    rpc = serve(
+        {
+            "getLatestBlockhash": lambda params: blockhash(next(heights)),
+            # Past the first blockhash's lastValidBlockHeight, within the second's
+            "getBlockHeight": lambda params: 20,
+            "sendTransaction": lambda params: sent.append(params[0]) or signature_of(params),
+            "getSignatureStatuses": lambda params: signature_status(
+                "finalized" if params[0][0] == signature_of([sent[-1]]) and len(set(sent)) == 2 else None
+            ),
+        }
+    )
+    try:
+        response = execute(rpc.url, transfer_tx(), [PAYER], max_retries=2, max_timeout=5)
+        assert response is not None
+        assert rpc.calls.count("getLatestBlockhash") == 2
+        assert len(set(sent)) == 2
+    finally:
+        rpc.close()
+
+
+def test_unaccepted_attempt_is_retried_with_the_same_bytes():
+    sent: list[str] = []
+
+    def send(params):
+        sent.append(params[0])
+        # Any node may still have forwarded the ones it refused
+        if len(sent) < 5:
+            raise FakeRPCError(-32005, "Node is unhealthy")
+        return signature_of(params)
+
+    rpc = serve(
+        {
+            "getLatestBlockhash": lambda params: blockhash(1000),
+            "getBlockHeight": lambda params: 10,
+            "sendTransaction": send,
+            "getSignatureStatuses": lambda params: signature_status("finalized" if len(sent) >= 5 else None),
+        }
+    )
+    # A newer blockhash on every get: signing again would make a different transaction
+    get_blockhash_provider(rpc.url).max_age = 0
+    try:
+        response = execute(rpc.url, transfer_tx(), [PAYER], max_retries=3, max_timeout=0.3)
+        assert response is not None and len(sent) >= 5
+        # The blockhash never expired, so no second version was signed that could also land
+        assert len(set(sent)) == 1 and rpc.calls.count("getLatestBlockhash") == 1
+    finally:
+        rpc.close()
+
+
+def test_fatal_error_is_not_retried():
+    def reject(params):
+        # Not a code solders models; it must still surface as a classifiable error
+        raise FakeRPCError(-32000, "Transaction results in an account with insufficient funds for rent")
+
+    rpc = serve({"getLatestBlockhash": lambda params: blockhash(1000), "sendTransaction": reject})
+    try:
+        assert execute(rpc.url, transfer_tx(), [PAYER], max_retries=3, max_timeout=5) is None
+        assert rpc.calls == ["getLatestBlockhash", "sendTransaction"]
+    finally:
+        rpc.close()
+
+
+def test_compute_budget_is_added_when_enabled(monkeypatch):
+    monkeypatch.setattr(execution_engine, "COMPUTE_BUDGET_ENABLED", True)
+    sent: list[str] = []
+    rpc = serve(
+        {
+            "getLatestBlockhash": lambda params: blockhash(1000),
+            "simulateTransaction": lambda params: {
+                "context": {"slot": 1},
+                "value": {"err": None, "logs": [], "accounts": None, "unitsConsumed": 150, "returnData": None},
+            },
+            "getRecentPrioritizationFees": lambda params: [{"slot": 1, "prioritizationFee": 7}],
+            "sendTransaction": lambda params: sent.append(params[0]) or signature_of(params),
+            "getSignatureStatuses": lambda params: signature_status("finalized"),
+        }
+    )
+    try:
+        assert execute(rpc.url, transfer_tx(), [PAYER], max_timeout=5) is not None
+        landed = SoldersTransaction.from_bytes(base64.b64decode(sent[0]))
+        assert landed.verify() is None
+        assert landed.message.instructions[0].data == bytes(set_compute_unit_limit(465).data)
+        assert landed.message.instructions[1].data == bytes(set_compute_unit_price(7).data)
+    finally:
+        rpc.close()
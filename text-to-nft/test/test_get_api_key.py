@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+from botocore.exceptions import ClientError, NoCredentialsError
+from get_api_key import SecretStore, get_api_key, secret_store
+
+
+class StubSecretsManager:
+    def __init__(self, secrets: dict[str, dict[str, str]]):
+        self.secrets = secrets
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    def batch_get_secret_value(self, Filters, MaxResults, NextToken=None):
+        self.batch_calls += 1
+        prefix = Filters[0]["Values"][0]
+        names = sorted(name for name in self.secrets if name.startswith(prefix))
+        start = int(NextToken or 0)
+        page = names[start : start + MaxResults]
+        response = {
+            "SecretValues": [
+                {"Name": name, "SecretString": json.dumps(self.secrets[name])}
+                for name in page
+            ],
+            "Errors": [],
+        }
+        if start + MaxResults < len(names):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def get_secret_value(self, SecretId):
+        self.single_calls += 1
+        return {"SecretString": json.dumps(self.secrets[SecretId])}
+
+
+def test_secret_store_batches_and_caches():
+    stub = StubSecretsManager(
+        {
+            "text_to_nft/stability_api_key": {"STABILITY_API_KEY": "sk-1"},
+            "text_to_nft/nft_storage_api_key": {"NFT_STORAGE_API_KEY": "nft-1"},
+            "text_to_nft/private_key": {"key": "pk"},
+            "other/secret": {"key": "other"},
+        }
+    )
+    store = SecretStore(client=stub, ttl=60)
+    store.prefetch()
+    for _ in range(3):
+        assert json.loads(store.get("text_to_nft/private_key")) == {"key": "pk"}
+        assert "sk-1" in store.get("text_to_nft/stability_api_key")
+    assert stub.batch_calls == 1
+    assert stub.single_calls == 0
+
+    # Secrets outside the prefix fall back to one GetSecretValue and are then cached
+    store.get("other/secret")
+    store.get("other/secret")
+    assert stub.single_calls == 1
+
+
+def test_secret_store_paginates_and_expires():
+    stub = StubSecretsManager(
+        {f"text_to_nft/key{i}": {"key": str(i)} for i in range(45)}
+    )
+    store = SecretStore(client=stub, ttl=0)
+    assert json.loads(store.get("text_to_nft/key44")) == {"key": "44"}
+    assert stub.batch_calls == 3
+    store.get("text_to_nft/key0")
+    assert stub.batch_calls == 6
+
+    # Secrets from the single-lookup fallback expire too
+    stub.secrets["other/secret"] = {"key": "other"}
+    store.get("other/secret")
+    store.get("other/secret")
+    assert stub.single_calls == 2
+
+
+def test_prefetch_tolerates_missing_credentials():
+    class NoCredentials(StubSecretsManager):
+        def batch_get_secret_value(self, **kwargs):
+            raise NoCredentialsError()
+
+    store = SecretStore(client=NoCredentials({}), ttl=60)
+    store.prefetch()
+    assert store._age() is None
+
+
+def test_refused_batch_falls_back_to_single_lookups():
+    class NoBatchPermission(StubSecretsManager):
+        def batch_get_secret_value(self, **kwargs):
+            self.batch_calls += 1
+            error = {"Error": {"Code": "AccessDeniedException", "Message": "not authorized"}}
+            raise ClientError(error, "BatchGetSecretValue")
+
+    stub = NoBatchPermission({"text_to_nft/private_key": {"key": "pk"}})
+    store = SecretStore(client=stub, ttl=60)
+    store.prefetch()
+    for _ in range(3):
+        assert json.loads(store.get("text_to_nft/private_key")) == {"key": "pk"}
+    # The refused batch isn't retried on every get(), and each secret is fetched once
+    assert stub.batch_calls == 2
+    assert stub.single_calls == 1
+
+
+def test_expired_cache_is_refreshed_once_for_concurrent_gets():
+    class SlowBatch(StubSecretsManager):
+        def batch_get_secret_value(self, **kwargs):
+            time.sleep(0.1)
+            return super().batch_get_secret_value(**kwargs)
+
+    stub = SlowBatch({"text_to_nft/private_key": {"key": "pk"}})
+    store = SecretStore(client=stub, ttl=60)
+    threads = [threading.Thread(target=store.get, args=("text_to_nft/private_key",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub.batch_calls == 1
+
+
+def test_get_api_key_uses_key_map():
+    stub = StubSecretsManager(
+        {"text_to_nft/nft_storage_api_key": {"NFT_STORAGE_API_KEY": "nft-1"}}
+    )
+    secret_store._client = stub
+    secret_store.clear()
+    try:
+        assert get_api_key("text_to_nft/nft_storage_api_key") == "nft-1"
+    finally:
+        secret_store._client = None
+        secret_store.clear()
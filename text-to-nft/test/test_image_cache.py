@@ -0,0 +1,73 @@
+import io
+import os
+import time
+import pytest
+from utils.image_cache import (
+    ImageCache,
+    ImageStore,
+    LocalDiskStore,
+    LocalS3Client,
+    S3ImageStore,
+    image_cache_key,
+)
+
+
+def test_image_cache_key_is_stable_and_path_safe():
+    key = image_cache_key("engine", "../../etc/passwd", {"seed": 1, "steps": 30})
+    assert key == image_cache_key("engine", "../../etc/passwd", {"steps": 30, "seed": 1})
+    assert key != image_cache_key("engine", "../../etc/passwd", {"seed": 2, "steps": 30})
+    assert key.isalnum() and len(key) == 64
+
+
+def test_disk_cache_lru_eviction(tmp_path):
+    cache = ImageCache(LocalDiskStore(str(tmp_path)), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, io.BytesIO(b"x" * 100))
+    assert cache.open("a").read() == b"x" * 100  # "a" is now most recently used
+    cache.put("c", io.BytesIO(b"y" * 100))
+    assert cache.open("b") is None
+    assert cache.local_path("a") == str(tmp_path / "txt2img_a.png")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+    assert stats["bytes"] == 200
+
+    # A fresh cache over the same directory rebuilds its index from disk
+    assert ImageCache(LocalDiskStore(str(tmp_path))).stats()["entries"] == 2
+
+
+def test_disk_cache_expires_by_creation_time_after_reload(tmp_path):
+    cache = ImageCache(LocalDiskStore(str(tmp_path)), max_age=60)
+    cache.put("a", io.BytesIO(b"png"))
+    path = tmp_path / "txt2img_a.png"
+    created = time.time() - 120
+    with open(f"{path}.created", "w") as f:
+        f.write(repr(created))
+    # A read after a cold start bumps the last use, but not the age
+    reloaded = ImageCache(LocalDiskStore(str(tmp_path)), max_age=3600)
+    reloaded.open("a").close()
+    assert os.path.getmtime(path) > created
+    assert ImageCache(LocalDiskStore(str(tmp_path)), max_age=60).open("a") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_s3_cache_expires_old_entries():
+    store = S3ImageStore(LocalS3Client(), "bucket")
+    cache = ImageCache(store, max_age=-1)
+    cache.put("a", io.BytesIO(b"png"))
+    assert cache.open("a") is None
+    assert store.entries() == []
+
+
+def test_incomplete_store_fails_at_construction():
+    class NoDelete(ImageStore):
+        def open(self, key):
+            return None
+
+        def write(self, key, fileobj):
+            return 0
+
+        def entries(self):
+            return []
+
+    with pytest.raises(TypeError):
+        NoDelete()
@@ -0,0 +1,173 @@
+import io
+import threading
+import pytest
+import lambda_function_text2nft as handler
+import storage.jobs
+from storage.jobs import (
+    FAILED,
+    SUCCEEDED,
+    DynamoDBJobStore,
+    JobInProgress,
+    JobRequestMismatch,
+    JobStore,
+    SQLiteJobStore,
+    get_job_store,
+)
+from upload_bundle_nftstorage import upload_bundle
+
+
+def test_claim_lease_and_takeover(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    item = store.claim("key", {"text": "a"})
+    assert item["stages"] == {}
+    with pytest.raises(JobInProgress):
+        store.claim("key", {"text": "a"})
+
+    store.checkpoint("key", "deploy", {"contract": "mint"})
+    store.fail("key", "boom")
+    item = store.claim("key", {"text": "a"})
+    assert item["stages"] == {"deploy": {"contract": "mint"}}
+
+    store.complete("key", {"contract": "mint"})
+    assert store.claim("key", {"text": "a"})["status"] == SUCCEEDED
+    # A reused key never hands out (or resumes) another request's job
+    with pytest.raises(JobRequestMismatch):
+        store.claim("key", {"text": "b"})
+
+
+def test_incomplete_store_fails_at_construction():
+    class NoFail(JobStore):
+        def get(self, job_id):
+            return None
+
+        def claim(self, job_id, request):
+            return {}
+
+        def checkpoint(self, job_id, stage, output):
+            pass
+
+        def complete(self, job_id, result):
+            pass
+
+    with pytest.raises(TypeError):
+        NoFail()
+
+
+def test_lambda_defaults_to_dynamodb(tmp_path, monkeypatch):
+    monkeypatch.delenv("JOB_STORE", raising=False)
+    monkeypatch.setenv("LAMBDA_WORK_DIR", str(tmp_path))
+    monkeypatch.setattr(storage.jobs, "_job_store", None)
+    assert isinstance(get_job_store(), SQLiteJobStore)
+
+    # A retry may land on another container, which can't see this one's /tmp
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "text-to-nft")
+    monkeypatch.setattr(storage.jobs, "_job_store", None)
+    assert isinstance(get_job_store(), DynamoDBJobStore)
+
+
+def test_retry_resumes_from_checkpoints(local_handler, monkeypatch):
+    _, store = local_handler
+    calls = []
+
+    def generate(text):
+        calls.append("generate")
+        return io.BytesIO(text.encode())
+
+    def create_and_mint_nft(name, symbol, receiver_public_key, link, idempotency_key=None):
+        calls.append("mint")
+        # The mint account is recorded before anything is submitted
+        assert store.get("key")["stages"]["mint"] == {"contract": "mint-key", "pending": True}
+        assert idempotency_key == "key"
+        if calls.count("mint") == 1:
+            raise Exception("blockhash expired")
+        return "mint-key", "signature"
+
+    monkeypatch.setattr(handler, "MINT_ENABLED", True)
+    monkeypatch.setattr(handler, "create_and_mint_nft", create_and_mint_nft, raising=False)
+    monkeypatch.setattr(handler, "text2img_buffer", generate)
+
+    job = handler.Job("a cat", "Cat", "CAT", "receiver")
+    with pytest.raises(Exception, match="blockhash expired"):
+        handler.run_job(job, idempotency_key="key")
+    assert store.get("key")["status"] == FAILED
+    stages = store.get("key")["stages"]
+    assert sorted(stages) == ["mint", "pack", "upload"] and stages["pack"] == stages["upload"]
+
+    # A pending mint is not a finished one: mint runs again (and looks for its account first)
+    result = handler.run_job(job, idempotency_key="key")
+    assert result["contract"] == "mint-key" and result["signature"] == "signature"
+    assert store.get("key")["stages"]["mint"] == {"contract": "mint-key", "signature": "signature"}
+    # Only the failed mint ran again; no second generation or upload
+    assert sorted(calls) == ["generate", "mint", "mint"]
+    assert handler.run_job(job, idempotency_key="key") == result
+    assert calls.count("mint") == 2
+
+
+def test_mint_overlaps_upload_and_uses_metadata_uri(local_handler, monkeypatch):
+    backend, store = local_handler
+    # Both stages have to be running at once to get past the barrier
+    overlap = threading.Barrier(2, timeout=5)
+    image = b"first"
+    links = []
+    uploads = []
+
+    def create_and_mint_nft(name, symbol, receiver_public_key, link, idempotency_key=None):
+        overlap.wait()
+        links.append(link)
+        return "mint-key", "signature"
+
+    def upload(bundle):
+        if not uploads:
+            overlap.wait()
+        uploads.append(bundle.root_cid)
+        if len(uploads) == 1:
+            raise Exception("upload failed")
+        return upload_bundle(bundle, backend)
+
+    monkeypatch.setattr(handler, "MINT_ENABLED", True)
+    monkeypatch.setattr(handler, "create_and_mint_nft", create_and_mint_nft, raising=False)
+    monkeypatch.setattr(handler, "text2img_buffer", lambda text: io.BytesIO(image))
+    monkeypatch.setattr(handler, "upload_bundle", upload)
+
+    job = handler.Job("a cat", "Cat", "CAT", "receiver")
+    with pytest.raises(Exception, match="upload failed"):
+        handler.run_job(job, idempotency_key="key")
+    # Minted, but the job isn't done until the content it points at is stored
+    item = store.get("key")
+    assert item["status"] == FAILED and item["stages"]["mint"] == {"contract": "mint-key", "signature": "signature"}
+
+    # A retry has to store exactly what was minted
+    image = b"second"
+    with pytest.raises(Exception, match="does not match minted"):
+        handler.run_job(job, idempotency_key="key")
+    assert len(uploads) == 1
+
+    image = b"first"
+    result = handler.run_job(job, idempotency_key="key")
+    assert uploads == [uploads[0]] * 2 and backend.has(uploads[0])
+    assert links == [result["metadataURI"]] and result["metadataURI"].endswith("/0.json")
+    assert backend.cat(links[0]).startswith(b"{")
+    assert result["contract"] == "mint-key" and result["signature"] == "signature"
+
+
+def test_retry_checks_the_rebuilt_bundle(local_handler, monkeypatch):
+    backend, store = local_handler
+    images = iter([b"first", b"second"])
+    uploads = []
+
+    def upload(bundle):
+        uploads.append(bundle.root_cid)
+        if len(uploads) == 1:
+            raise Exception("upload failed")
+        return upload_bundle(bundle, backend)
+
+    monkeypatch.setattr(handler, "text2img_buffer", lambda text: io.BytesIO(next(images)))
+    monkeypatch.setattr(handler, "upload_bundle", upload)
+
+    job = handler.Job("a cat", "Cat", "CAT", "receiver")
+    with pytest.raises(Exception, match="upload failed"):
+        handler.run_job(job, idempotency_key="key")
+    first = store.get("key")["stages"]["pack"]["root_cid"]
+    # Nothing was minted from the first bundle, so a regenerated image may replace it
+    result = handler.run_job(job, idempotency_key="key")
+    assert uploads[1] != first and result["metadataURI"].startswith(backend.gateway)
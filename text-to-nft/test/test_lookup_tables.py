@@ -0,0 +1,295 @@
+import base64
+import json
+import struct
+import time
+import pytest
+from cryptography.fernet import Fernet
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.pubkey import Pubkey
+from solders.transaction import VersionedTransaction
+from fake_rpc import FakeRPC, FakeRPCError
+import api.metaplex_api as api_module
+import metaplex.lookup_tables as lookup_tables_module
+from api.metaplex_api import MetaplexAPI
+from metaplex.bulk import MINT, PACKET_DATA_SIZE, TRANSFER, BulkItem, pack, transaction_size
+from metaplex.lookup_tables import (
+    ACTIVE_DEACTIVATION_SLOT,
+    ADDRESS_LOOKUP_TABLE_PROGRAM_ID,
+    DEACTIVATION_COOLDOWN_SLOTS,
+    LOOKUP_TABLE_AUTHORITY_OFFSET,
+    LOOKUP_TABLE_META_SIZE,
+    STATIC_ADDRESSES,
+    InstructionType,
+    LookupTableManager,
+    get_lookup_tables,
+)
+from utils.blockhash import get_blockhash_provider
+from utils.confirmation import get_tracker
+from utils.execution_engine import execute
+
+SOURCE = Keypair()
+
+
+def table_data(addresses: list[Pubkey], authority: Pubkey, deactivation_slot: int = ACTIVE_DEACTIVATION_SLOT) -> str:
+    meta = struct.pack("<IQQBB", 1, deactivation_slot, 0, 0, 1) + bytes(authority)
+    meta = meta.ljust(LOOKUP_TABLE_META_SIZE, b"\0")
+    return base64.b64encode(meta + b"".join(bytes(a) for a in addresses)).decode()
+
+
+class FakeChain:
+    """FakeRPC that applies lookup table instructions and lands everything."""
+
+    def __init__(self):
+        self.slot = 100
+        self.tables: dict[str, list[Pubkey]] = {}
+        self.authorities: dict[str, Pubkey] = {}
+        self.deactivated: dict[str, int] = {}
+        self.sent: list[bytes] = []
+        self.rpc = FakeRPC(
+            {
+                "getSlot": lambda params: self.slot + len(self.sent),
+                "getLatestBlockhash": lambda params: {
+                    "context": {"slot": 1},
+                    "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": 1000},
+                },
+                "sendTransaction": self.send,
+                "getSignatureStatuses": lambda params: {
+                    "context": {"slot": 5},
+                    "value": [
+                        {
+                            "slot": 5,
+                            "confirmations": None,
+                            "err": None,
+                            "status": {"Ok": None},
+                            "confirmationStatus": "finalized",
+                        }
+                        for _ in params[0]
+                    ],
+                },
+                "getMultipleAccounts": lambda params: {
+                    "context": {"slot": 5},
+                    "value": [self.account(address) for address in params[0]],
+                },
+                "getProgramAccounts": self.program_accounts,
+            }
+        )
+        get_tracker(self.rpc.url).interval = 0.05
+        get_blockhash_provider(self.rpc.url).interval = 60
+
+    def account(self, address: str):
+        if address not in self.tables:
+            return None
+        data = table_data(
+            self.tables[address],
+            self.authorities[address],
+            self.deactivated.get(address, ACTIVE_DEACTIVATION_SLOT),
+        )
+        return {
+            "data": [data, "base64"],
+            "executable": False,
+            "lamports": 1_000_000,
+            "owner": str(ADDRESS_LOOKUP_TABLE_PROGRAM_ID),
+            "rentEpoch": 0,
+        }
+
+    def program_accounts(self, params):
+        assert params[0] == str(ADDRESS_LOOKUP_TABLE_PROGRAM_ID)
+        [memcmp] = [f["memcmp"] for f in params[1]["filters"]]
+        assert memcmp["offset"] == LOOKUP_TABLE_AUTHORITY_OFFSET
+        return [
+            {"pubkey": table, "account": self.account(table)}
+            for table, authority in self.authorities.items()
+            if table in self.tables and str(authority) == memcmp["bytes"]
+        ]
+
+    def send(self, params):
+        raw = base64.b64decode(params[0])
+        self.sent.append(raw)
+        tx = VersionedTransaction.from_bytes(raw)
+        keys = tx.message.account_keys
+        for ix in tx.message.instructions:
+            if keys[ix.program_id_index] != ADDRESS_LOOKUP_TABLE_PROGRAM_ID:
+                continue
+            table = str(keys[ix.accounts[0]])
+            kind = struct.unpack_from("<I", ix.data)[0]
+            if kind == InstructionType.CREATE_LOOKUP_TABLE:
+                self.tables[table] = []
+                self.authorities[table] = keys[ix.accounts[1]]
+            elif kind == InstructionType.EXTEND_LOOKUP_TABLE:
+                assert table not in self.deactivated
+                count = struct.unpack_from("<Q", ix.data, 4)[0]
+                self.tables[table] += [Pubkey.from_bytes(ix.data[12 + 32 * i : 44 + 32 * i]) for i in range(count)]
+            elif kind == InstructionType.DEACTIVATE_LOOKUP_TABLE:
+                self.deactivated[table] = self.slot + len(self.sent)
+            elif kind == InstructionType.CLOSE_LOOKUP_TABLE:
+                assert self.slot + len(self.sent) > self.deactivated[table] + DEACTIVATION_COOLDOWN_SLOTS
+                del self.tables[table]
+        return str(tx.signatures[0])
+
+    def close(self) -> None:
+        self.rpc.close()
+
+
+def test_ensure_creates_tables_and_finds_them_on_chain():
+    chain = FakeChain()
+    try:
+        mints = [Keypair().pubkey() for _ in range(300)]
+        # Started before the tables exist, like a second warm container
+        other = LookupTableManager(chain.rpc.url, SOURCE)
+        manager = LookupTableManager(chain.rpc.url, SOURCE)
+        tables = manager.ensure(STATIC_ADDRESSES + mints)
+        # 305 addresses: one full table and a second one
+        assert len(tables) == len(chain.tables) == 2
+        loaded = [address for table in tables for address in table.addresses]
+        assert sorted(map(str, loaded)) == sorted(map(str, STATIC_ADDRESSES + mints))
+        assert {str(table.key): list(table.addresses) for table in tables} == chain.tables
+        # Known addresses cost nothing, whether this manager or another process created them
+        sent = len(chain.sent)
+        assert len(manager.ensure(mints[:10])) == 2
+        assert len(other.ensure(STATIC_ADDRESSES + mints)) == 2
+        assert len(LookupTableManager(chain.rpc.url, SOURCE).tables()) == 2
+        assert len(chain.sent) == sent
+        # Tables of another authority are not ours to use
+        assert LookupTableManager(chain.rpc.url, Keypair()).tables() == []
+        # New addresses go into the room left in the second table
+        extra = Keypair().pubkey()
+        manager.ensure([extra])
+        assert len(chain.tables) == 2 and extra in chain.tables[str(tables[1].key)]
+    finally:
+        chain.close()
+
+
+def test_failed_discovery_backs_off(monkeypatch):
+    monkeypatch.setattr(lookup_tables_module, "LOOKUP_TABLE_RETRY_INTERVAL", 0.5)
+    chain = FakeChain()
+    scan = chain.rpc.methods["getProgramAccounts"]
+
+    def refused(params):
+        raise FakeRPCError(-32010, "excluded from account secondary indexes")
+
+    chain.rpc.methods["getProgramAccounts"] = refused
+    try:
+        manager = get_lookup_tables(chain.rpc.url, SOURCE)
+        for _ in range(3):
+            with pytest.raises(Exception):
+                manager.ensure(STATIC_ADDRESSES)
+        # Kept despite the failure, and the refused scan isn't sent again until the backoff is over
+        assert get_lookup_tables(chain.rpc.url, SOURCE) is manager
+        assert chain.rpc.calls.count("getProgramAccounts") == 1
+        chain.rpc.methods["getProgramAccounts"] = scan
+        time.sleep(0.5)
+        assert len(manager.ensure(STATIC_ADDRESSES)) == 1
+    finally:
+        chain.close()
+
+
+def test_single_transactions_only_use_configured_tables(monkeypatch):
+    monkeypatch.setattr("api.metaplex_api.LOOKUP_TABLES_ENABLED", True)
+    chain = FakeChain()
+    api = MetaplexAPI(
+        {"PRIVATE_KEY": str(SOURCE), "PUBLIC_KEY": str(SOURCE.pubkey()), "DECRYPTION_KEY": Fernet.generate_key()}
+    )
+    try:
+        # Nothing configured: legacy, without creating or scanning for tables
+        assert api._lookup_tables(chain.rpc.url) is None
+        assert chain.rpc.calls == []
+
+        [table] = LookupTableManager(chain.rpc.url, SOURCE).ensure(STATIC_ADDRESSES)
+        calls = len(chain.rpc.calls)
+        monkeypatch.setattr(api_module, "LOOKUP_TABLE_ADDRESSES", [table.key])
+        monkeypatch.setattr(lookup_tables_module, "LOOKUP_TABLE_ADDRESSES", [table.key])
+        for _ in range(2):
+            [configured] = api._lookup_tables(chain.rpc.url)
+            assert configured.key == table.key and list(configured.addresses) == list(table.addresses)
+        # Read once, by address
+        assert chain.rpc.calls[calls:] == ["getMultipleAccounts"]
+        # and left alone by release()
+        assert get_lookup_tables(chain.rpc.url, SOURCE).release() == ([], [])
+    finally:
+        chain.close()
+
+
+def test_release_deactivates_then_closes_tables():
+    chain = FakeChain()
+    try:
+        manager = LookupTableManager(chain.rpc.url, SOURCE)
+        tables = [str(table.key) for table in manager.ensure(STATIC_ADDRESSES)]
+        deactivated, closed = manager.release()
+        assert list(map(str, deactivated)) == tables and closed == []
+        assert set(chain.deactivated) == set(tables) and set(chain.tables) == set(tables)
+        # Deactivated tables are not handed out or extended again
+        assert manager.tables() == [] and LookupTableManager(chain.rpc.url, SOURCE).tables() == []
+        fresh = [str(table.key) for table in manager.ensure(STATIC_ADDRESSES)]
+        assert fresh and not set(fresh) & set(tables)
+        # Closing has to wait for the cooldown
+        deactivated, closed = manager.release()
+        assert list(map(str, deactivated)) == fresh and closed == []
+        chain.slot += DEACTIVATION_COOLDOWN_SLOTS + 1
+        deactivated, closed = manager.release()
+        assert deactivated == [] and sorted(map(str, closed)) == sorted(tables + fresh)
+        assert chain.tables == {}
+    finally:
+        chain.close()
+
+
+def test_bulk_only_adds_repeated_addresses(monkeypatch):
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    monkeypatch.setattr("api.metaplex_api.LOOKUP_TABLES_ENABLED", True)
+    chain = FakeChain()
+    api = MetaplexAPI(
+        {"PRIVATE_KEY": str(SOURCE), "PUBLIC_KEY": str(SOURCE.pubkey()), "DECRYPTION_KEY": Fernet.generate_key()}
+    )
+    try:
+        collection, single = str(Keypair().pubkey()), str(Keypair().pubkey())
+        items = [(collection, str(Keypair().pubkey())) for _ in range(3)] + [(single, str(Keypair().pubkey()))]
+        response = json.loads(api.bulk_mint(chain.rpc.url, items))
+        assert response["status"] == 200 and all(result["status"] == 200 for result in response["results"])
+        [table] = chain.tables.values()
+        assert sorted(map(str, table)) == sorted(map(str, STATIC_ADDRESSES + [Pubkey.from_string(collection)]))
+    finally:
+        chain.close()
+
+
+def test_pack_with_lookup_tables_uses_fewer_transactions():
+    chain = FakeChain()
+    try:
+        bulk = [BulkItem(str(Keypair().pubkey()), str(Keypair().pubkey()), MINT) for _ in range(40)]
+        bulk += [BulkItem(str(Keypair().pubkey()), str(Keypair().pubkey()), TRANSFER) for _ in range(10)]
+        manager = LookupTableManager(chain.rpc.url, SOURCE)
+        tables = manager.ensure(STATIC_ADDRESSES + [Pubkey.from_string(item.contract) for item in bulk])
+        batches = pack(SOURCE, bulk, lookup_tables=tables)
+        assert [item for _, batch in batches for item in batch] == bulk
+        assert len(batches) < len(pack(SOURCE, bulk))
+        for tx, _ in batches:
+            size = transaction_size(list(tx.instructions), SOURCE.pubkey(), tables)[0]
+            assert size <= PACKET_DATA_SIZE
+    finally:
+        chain.close()
+
+
+def test_execute_sends_v0_transaction(monkeypatch):
+    monkeypatch.setenv("SOLANA_CONFIRMATION", "polling")
+    chain = FakeChain()
+    try:
+        bulk = [BulkItem(str(Keypair().pubkey()), str(Keypair().pubkey()), MINT) for _ in range(3)]
+        manager = LookupTableManager(chain.rpc.url, SOURCE)
+        tables = manager.ensure(STATIC_ADDRESSES + [Pubkey.from_string(item.contract) for item in bulk])
+        sent = len(chain.sent)
+        chain.rpc.methods["sendTransaction"] = lambda params: (
+            chain.sent.append(base64.b64decode(params[0]))
+            or str(VersionedTransaction.from_bytes(base64.b64decode(params[0])).signatures[0])
+        )
+        [(tx, _)] = pack(SOURCE, bulk, lookup_tables=tables)
+        resp = execute(chain.rpc.url, tx, [SOURCE], max_timeout=5, lookup_tables=tables)
+        assert resp is not None
+        raw = chain.sent[sent]
+        versioned = VersionedTransaction.from_bytes(raw)
+        # Version prefix 0x80: a v0 message, with the accounts it could load taken from the tables
+        assert raw[1 + 64] == 0x80
+        assert versioned.message.address_table_lookups
+        assert versioned.verify_with_results() == [True]
+        assert str(versioned.signatures[0]) == str(resp.value)
+        assert len(raw) == transaction_size(list(tx.instructions), SOURCE.pubkey(), tables)[0]
+    finally:
+        chain.close()
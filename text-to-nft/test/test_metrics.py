@@ -0,0 +1,46 @@
+import pytest
+from utils.metrics import MemoryCollector, Metrics
+from utils.pipeline import Pipeline
+import utils.pipeline
+
+
+def test_flush_emits_emf_documents():
+    collector = MemoryCollector()
+    metrics = Metrics(namespace="Test", dimensions={"Service": "svc"}, sink=collector)
+    for _ in range(150):
+        metrics.record("generate", 10)
+    metrics.count("upload_bytes", 100, unit="Bytes")
+    metrics.count("upload_bytes", 50, unit="Bytes")
+    metrics.gauge("queue_depth", 3)
+    metrics.gauge("queue_depth", 1)
+    metrics.set_property("requestId", "abc")
+    metrics.flush()
+
+    first, second = collector.documents
+    (directive,) = first["_aws"]["CloudWatchMetrics"]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["Service"]]
+    assert {"Name": "upload_bytes", "Unit": "Bytes"} in directive["Metrics"]
+    assert first["Service"] == "svc" and first["requestId"] == "abc"
+    assert len(first["generate"]) == 100 and len(second["generate"]) == 50
+    assert collector.total("upload_bytes") == 150
+    assert {"Name": "queue_depth", "Unit": "Count"} in directive["Metrics"]
+    assert collector.values("queue_depth") == [3, 1]
+
+    metrics.flush()
+    assert len(collector.documents) == 2
+
+
+def test_pipeline_times_every_stage(monkeypatch):
+    collector = MemoryCollector()
+    metrics = Metrics(sink=collector)
+    monkeypatch.setattr(utils.pipeline, "metrics", metrics)
+
+    def fail():
+        raise ValueError("boom")
+
+    Pipeline().add("generate", lambda: 1).add("pack", lambda generate: generate, deps=("generate",)).run()
+    with pytest.raises(ValueError):
+        Pipeline().add("upload", fail).run()
+    metrics.flush()
+    assert [len(collector.values(f"stage_{name}")) for name in ("generate", "pack", "upload")] == [1, 1, 1]
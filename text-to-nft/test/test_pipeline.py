@@ -0,0 +1,46 @@
+import threading
+import time
+import pytest
+from utils.pipeline import Pipeline
+
+
+def test_independent_stages_overlap():
+    started = threading.Barrier(2, timeout=5)
+
+    def slow(value):
+        def run():
+            started.wait()
+            time.sleep(0.1)
+            return value
+        return run
+
+    pipeline = Pipeline()
+    pipeline.add("generate", slow("image"))
+    pipeline.add("deploy", slow("contract"))
+    pipeline.add("mint", lambda generate, deploy: (generate, deploy), deps=("generate", "deploy"))
+    start = time.perf_counter()
+    results = pipeline.run()
+    assert results["mint"] == ("image", "contract")
+    assert time.perf_counter() - start < 0.19
+
+
+def test_failure_skips_dependents():
+    calls = []
+
+    def fail():
+        raise ValueError("boom")
+
+    pipeline = Pipeline()
+    pipeline.add("generate", fail)
+    pipeline.add("upload", lambda generate: calls.append(generate), deps=("generate",))
+    with pytest.raises(ValueError):
+        pipeline.run()
+    assert calls == []
+
+
+def test_rejects_bad_graphs():
+    with pytest.raises(Exception, match="unknown stage"):
+        Pipeline().add("upload", lambda pack: None, deps=("pack",)).run()
+    pipeline = Pipeline().add("a", lambda b: None, deps=("b",)).add("b", lambda a: None, deps=("a",))
+    with pytest.raises(Exception, match="Cycle"):
+        pipeline.run()
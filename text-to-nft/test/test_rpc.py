@@ -0,0 +1,28 @@
+from solders.pubkey import Pubkey
+from fake_rpc import FakeRPC
+from utils.rpc import RPCRegistry
+
+
+def test_registry_reuses_connections_and_counts_methods():
+    rpc = FakeRPC(
+        {
+            "getBlockHeight": lambda params: 100,
+            "getBalance": lambda params: {"context": {"slot": 1}, "value": 5},
+        }
+    )
+    registry = RPCRegistry(pool_size=2)
+    try:
+        client = registry.client(rpc.url)
+        assert registry.client(rpc.url) is client
+        # Clients of every commitment send through the endpoint's one provider. Client has no
+        # public way to set it, so this fails if solana-py stops reading _provider.
+        assert client._provider is registry.client(rpc.url, "finalized")._provider is registry.provider(rpc.url)
+        for _ in range(5):
+            assert client.get_block_height().value == 100
+        assert client.get_balance(Pubkey.default()).value == 5
+        assert registry.calls() == {"getBlockHeight": 5, "getBalance": 1}
+        # Every call went over the same keep-alive connection
+        assert rpc.connections == 1
+    finally:
+        registry.close()
+        rpc.close()
@@ -0,0 +1,127 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import storage.backends
+import storage.index
+from storage.backends import IPFSHTTPBackend, LocalFSBackend, NFTStorageBackend, StorageBackend, get_backend
+from storage.car import build_bundle
+from storage.cid import CHUNK_SIZE, compute_cid
+from storage.client import UploadResult
+from storage.index import UploadIndex
+
+
+def test_local_backend_round_trip(tmp_path):
+    backend = LocalFSBackend(str(tmp_path))
+    data = b"x" * (CHUNK_SIZE + 10)
+    result = backend.upload(data)
+    assert result == (compute_cid(data), len(data), 1)
+    assert backend.has(result.cid) and not backend.has(compute_cid(b"other"))
+    assert backend.cat(backend.uri(result.cid)) == data
+
+    bundle = build_bundle([(b"png-0", {"name": "0"}), (b"png-1", {"name": "1"})], gateway=backend.gateway)
+    with bundle.car:
+        assert backend.upload_car(bundle.car).cid == bundle.root_cid
+    assert backend.has(bundle.root_cid) and backend.get_block(compute_cid(b"png-1")) == b"png-1"
+    # Every URI in the bundle resolves against the stored blocks
+    assert backend.cat(bundle.image_uris[1]) == b"png-1"
+    metadata = json.loads(backend.cat(bundle.metadata_uris[1]))
+    assert metadata == {"name": "1", "image": bundle.image_uris[1]}
+    assert bundle.metadata_uris[1] == backend.uri(bundle.root_cid, "1.json")
+    with pytest.raises(Exception, match="not found"):
+        backend.cat(backend.uri(bundle.root_cid, "2.json"))
+
+
+def test_nftstorage_backend_records_pins(monkeypatch):
+    class StubClient:
+        def upload(self, body, content_type):
+            return UploadResult("bafkreia", 4, 1)
+
+        def upload_car(self, car):
+            return UploadResult("bafybeib", 8, 2)
+
+    monkeypatch.setattr(storage.index, "_upload_index", UploadIndex(":memory:"))
+    backend = NFTStorageBackend(StubClient())
+    assert not backend.has("bafkreia")
+    backend.upload(b"data")
+    assert backend.upload_car(io.BytesIO(b"car")).attempts == 2
+    assert backend.has("bafkreia") and backend.has("bafybeib")
+
+
+def test_ipfs_http_backend_uses_kubo_api():
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            calls.append((url.path, parse_qs(url.query), body))
+            if url.path == "/api/v0/add":
+                payload = json.dumps({"Hash": "bafkreia", "Size": "4"})
+            else:
+                payload = json.dumps({"Root": {"Cid": {"/": "bafybeib"}}}) + "\n" + json.dumps({"Stats": {}})
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        backend = IPFSHTTPBackend(f"http://127.0.0.1:{server.server_port}")
+        assert backend.upload(b"data").cid == "bafkreia"
+        assert backend.upload_car(io.BytesIO(b"car-bytes")) == ("bafybeib", 9, 1)
+    finally:
+        server.shutdown()
+        server.server_close()
+    (add_path, add_params, add_body), (import_path, import_params, import_body) = calls
+    # CIDv1 with raw leaves and 256 KiB chunks, so CIDs match the local computation
+    assert add_params == {
+        "cid-version": ["1"],
+        "raw-leaves": ["true"],
+        "chunker": [f"size-{CHUNK_SIZE}"],
+        "pin": ["true"],
+    }
+    assert b"data" in add_body and b"car-bytes" in import_body
+    assert import_path == "/api/v0/dag/import" and import_params == {"pin-roots": ["true"]}
+
+
+def test_get_backend_builds_one_backend(tmp_path, monkeypatch):
+    built = []
+
+    class SlowBackend(LocalFSBackend):
+        def __init__(self):
+            time.sleep(0.05)
+            built.append(self)
+            super().__init__(str(tmp_path))
+
+    monkeypatch.setattr(storage.backends, "_backend", None)
+    monkeypatch.setitem(storage.backends.BACKENDS, "slow", SlowBackend)
+    monkeypatch.setenv("STORAGE_BACKEND", "slow")
+    backends = []
+    threads = [threading.Thread(target=lambda: backends.append(get_backend())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and all(backend is built[0] for backend in backends)
+
+    monkeypatch.setattr(storage.backends, "_backend", None)
+    monkeypatch.setenv("STORAGE_BACKEND", "nope")
+    with pytest.raises(Exception, match="Unknown STORAGE_BACKEND"):
+        get_backend()
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoCar(StorageBackend):
+        def upload(self, body, content_type="application/octet-stream"):
+            return UploadResult("bafkreia", 0, 1)
+
+    with pytest.raises(TypeError):
+        NoCar()
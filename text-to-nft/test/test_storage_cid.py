@@ -0,0 +1,65 @@
+import io
+from storage.car import build_bundle
+from storage.cid import (
+    CHUNK_SIZE,
+    RAW_CODEC,
+    canonical_json,
+    cid_to_str,
+    compute_cid,
+    make_cid,
+    unixfs_file,
+)
+from storage.index import UploadIndex
+
+
+def test_raw_leaf_cids_match_ipfs():
+    assert compute_cid(b"") == "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku"
+    assert compute_cid(b"hello world") == "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+
+
+def test_multi_chunk_file_builds_balanced_dag():
+    data = b"x" * (CHUNK_SIZE * 3 + 5)
+    blocks = []
+    root = unixfs_file(data, emit=lambda cid, block: blocks.append((cid, block)))
+    assert compute_cid(data).startswith("bafybei")
+    assert root.file_size == len(data)
+    # Four raw leaves (two identical) plus one dag-pb root emitted last
+    assert len(blocks) == 5 and blocks[-1][0] == root.cid
+    assert root.tsize == len(blocks[-1][1]) + len(data)
+
+    # Files are rewound after hashing so they can still be uploaded
+    f = io.BytesIO(data)
+    assert compute_cid(f) == compute_cid(data) and f.tell() == 0
+
+
+def test_upload_index_persists(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    index = UploadIndex(path)
+    index.add("bafkreia", 10)
+    index.close()
+    assert "bafkreia" in UploadIndex(path)
+    assert "bafkreib" not in UploadIndex(path)
+
+
+def test_upload_index_sync_imports_listing():
+    class ListingClient:
+        def list(self):
+            yield {"cid": "bafkreia", "size": 10}
+            yield {"cid": "bafkreib"}
+
+    index = UploadIndex(":memory:")
+    index.add("bafkreia", 10)
+    assert index.sync(ListingClient()) == 2
+    assert "bafkreib" in index and len(index) == 2
+
+
+def test_bundle_car_links_metadata_to_image():
+    bundle = build_bundle([(b"png-bytes", {"name": "n"})])
+    car = bundle.car.read()
+    image_cid = cid_to_str(make_cid(RAW_CODEC, b"png-bytes"))
+    assert bundle.image_uris == [f"https://ipfs.io/ipfs/{image_cid}"]
+    assert bundle.metadata_uris == [f"https://ipfs.io/ipfs/{bundle.root_cid}/0.json"]
+    # Header is a varint-prefixed dag-cbor map naming the directory as the only root
+    assert car[1:8] == b"\xa2eroots"
+    metadata = canonical_json({"name": "n", "image": bundle.image_uris[0]})
+    assert metadata in car and b"png-bytes" in car
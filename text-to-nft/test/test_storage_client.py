@@ -0,0 +1,123 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from storage.car import build_bundle, car_roots, read_car_blocks, read_car_header
+from storage.cid import cid_to_str
+from storage.client import NFTStorageClient
+
+
+class FakeNFTStorage:
+    """
+    Local nft.storage: POST /upload answers with the queued `statuses` first (then 200 with the
+    CAR root, or `cid-<size>` for plain files), GET / pages through `uploads`.
+    """
+
+    def __init__(self, statuses: list[int] = (), uploads: list[dict] = ()):
+        self.statuses = list(statuses)
+        self.uploads = list(uploads)
+        self.bodies: list[bytes] = []
+        self.queries: list[dict] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                fake.bodies.append(body)
+                status = fake.statuses.pop(0) if fake.statuses else 200
+                if status == 200 and self.headers["Content-Type"] == "application/car":
+                    cid = cid_to_str(car_roots(read_car_header(io.BytesIO(body)))[0])
+                    self.reply(200, {"ok": True, "value": {"cid": cid}})
+                elif status == 200:
+                    self.reply(200, {"ok": True, "value": {"cid": f"cid-{len(body)}"}})
+                else:
+                    self.reply(status, {"ok": False, "error": {"message": str(status)}})
+
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                fake.queries.append(query)
+                uploads = [u for u in fake.uploads if "before" not in query or u["created"] < query["before"]]
+                self.reply(200, {"ok": True, "value": uploads[: int(query["limit"])]})
+
+            def reply(self, status: int, document: dict) -> None:
+                payload = json.dumps(document).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self, **kwargs) -> NFTStorageClient:
+        return NFTStorageClient("token", api_host=self.url, backoff_base=0.001, chunk_size=7, **kwargs)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_upload_rewinds_body_between_retries():
+    fake = FakeNFTStorage(statuses=[408, 429, 503])
+    try:
+        result = fake.client().upload(b"0123456789" * 10, content_type="image/png")
+        assert result == ("cid-100", 100, 4)
+        # Every attempt streamed the whole body from the start
+        assert fake.bodies == [b"0123456789" * 10] * 4
+    finally:
+        fake.close()
+
+
+def test_upload_gives_up_on_client_errors_and_after_max_retries():
+    fake = FakeNFTStorage(statuses=[400])
+    try:
+        with pytest.raises(Exception, match="Non-200"):
+            fake.client().upload(b"data")
+        assert len(fake.bodies) == 1
+        fake.statuses = [502] * 3
+        with pytest.raises(Exception, match="502"):
+            fake.client(max_retries=2).upload(b"data")
+        assert len(fake.bodies) == 4
+    finally:
+        fake.close()
+
+
+def test_large_car_is_split_into_same_root_pieces():
+    bundle = build_bundle([(bytes([i]) * 5000, {"name": str(i)}) for i in range(6)])
+    car = bundle.car.read()
+    bundle.car.close()
+    fake = FakeNFTStorage(statuses=[200, 503])
+    try:
+        result = fake.client().upload_car(io.BytesIO(car), max_chunk_size=8000)
+        assert result.cid == bundle.root_cid and result.size == len(car)
+        header = read_car_header(io.BytesIO(car))
+        pieces = [fake.bodies[0]] + fake.bodies[2:]
+        # Only the piece that got the 503 was sent again
+        assert fake.bodies[1] == fake.bodies[2] and result.attempts == len(pieces) + 1
+        assert len(pieces) > 1
+        blocks = []
+        for piece in pieces:
+            assert piece.startswith(header) and len(piece) <= 8000
+            blocks += list(read_car_blocks(io.BytesIO(piece)))
+        assert blocks == list(read_car_blocks(io.BytesIO(car)))
+    finally:
+        fake.close()
+
+
+def test_list_pages_backwards():
+    uploads = [{"cid": f"cid{i}", "created": f"2024-01-{i:02d}"} for i in range(25, 0, -1)]
+    fake = FakeNFTStorage(uploads=uploads)
+    try:
+        assert list(fake.client().list(page_size=10)) == uploads
+        assert [q.get("before") for q in fake.queries] == [None, "2024-01-16", "2024-01-06"]
+    finally:
+        fake.close()
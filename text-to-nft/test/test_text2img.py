@@ -0,0 +1,121 @@
+import base64
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import text2img
+from utils.image_cache import ImageCache, LocalDiskStore
+
+
+class FakeStability(BaseHTTPRequestHandler):
+    """Serves `png:<prompt>` as raw image/png, or `png:<prompt>:<i>` JSON artifacts for samples > 1."""
+
+    requests: list[tuple[str, int]] = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = body["text_prompts"][0]["text"]
+        FakeStability.requests.append((self.headers["Accept"], body.get("samples", 1)))
+        if text == "fail":
+            self.send_response(400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers["Accept"] == "image/png":
+            payload, content_type = f"png:{text}".encode(), "image/png"
+        else:
+            artifacts = [
+                {"base64": base64.b64encode(f"png:{text}:{i}".encode()).decode()}
+                for i in range(body.get("samples", 1) + body.get("extra", 0))
+            ]
+            payload, content_type = json.dumps({"artifacts": artifacts}).encode(), "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stability(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStability)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FakeStability.requests = []
+    monkeypatch.setenv("API_HOST", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("LAMBDA_WORK_DIR", str(tmp_path))
+    monkeypatch.setattr(text2img, "get_api_key", lambda name: "test")
+    monkeypatch.setattr(text2img, "image_cache", ImageCache(LocalDiskStore(str(tmp_path))))
+    yield FakeStability.requests
+    server.shutdown()
+    server.server_close()
+
+
+def read_all(images) -> list[bytes]:
+    try:
+        return [image.read() for image in images]
+    finally:
+        for image in images:
+            image.close()
+
+
+def test_samples_are_cached_under_their_own_keys(stability):
+    assert read_all(text2img.text2img_batch("a", samples=3)) == [b"png:a:0", b"png:a:1", b"png:a:2"]
+    keys = [text2img._sample_key("a", None, 3, i) for i in range(3)]
+    assert sorted(key for key, *_ in text2img.image_cache.store.entries()) == sorted(keys)
+    assert read_all(text2img.text2img_batch("a", samples=3)) == [b"png:a:0", b"png:a:1", b"png:a:2"]
+    assert len(stability) == 1
+
+
+def test_evicted_images_are_regenerated(stability):
+    path = text2img.text2img("b")
+    with open(path, "rb") as f:
+        assert f.read() == b"png:b"
+    # Dropped behind the cache's back (another container's LRU, a wiped work dir)
+    os.remove(path)
+    assert text2img.text2img("b") == path
+    with open(path, "rb") as f:
+        assert f.read() == b"png:b"
+
+    read_all(text2img.text2img_batch("c", samples=2))
+    text2img.image_cache.store.delete(text2img._sample_key("c", None, 2, 1))
+    assert read_all(text2img.text2img_batch("c", samples=2)) == [b"png:c:0", b"png:c:1"]
+    assert stability == [("image/png", 1)] * 2 + [("application/json", 2)] * 2
+
+
+def test_buffer_streams_png_into_a_spooled_file(stability, monkeypatch):
+    with text2img.text2img_buffer("d", cache=False) as image:
+        assert image.read() == b"png:d"
+    assert text2img.image_cache.store.entries() == []
+    # Larger than the spool limit: written through to a temporary file
+    monkeypatch.setattr(text2img, "SPOOL_MAX_SIZE", 2)
+    with text2img.text2img_buffer("e") as image:
+        assert image._rolled and image.read() == b"png:e"
+    with text2img.text2img_buffer("e") as image:
+        assert image.read() == b"png:e"
+    assert stability == [("image/png", 1)] * 2
+
+
+def test_batch_keeps_requested_samples_and_closes_on_failure(stability, monkeypatch):
+    # A response with more artifacts than requested is trimmed to `samples`
+    images = text2img.text2img_batch(["f", "g"], samples=2, params={"extra": 1}, cache=False)
+    assert read_all(images) == [b"png:f:0", b"png:f:1", b"png:g:0", b"png:g:1"]
+    # Over MAX_SAMPLES_PER_REQUEST: split across requests
+    monkeypatch.setattr(text2img, "MAX_SAMPLES_PER_REQUEST", 2)
+    assert len(read_all(text2img.text2img_batch("h", samples=3, cache=False))) == 3
+
+    produced = []
+    generate = text2img._generate
+
+    def tracking_generate(*args):
+        images = generate(*args)
+        produced.extend(images)
+        return images
+
+    monkeypatch.setattr(text2img, "_generate", tracking_generate)
+    with pytest.raises(Exception):
+        text2img.text2img_batch(["i", "fail"], samples=2, cache=False)
+    assert produced and all(image.closed for image in produced)
@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import text2img_async
+from text2img_async import AsyncText2Img
+from utils.metrics import MemoryCollector, Metrics
+
+
+class FakeStability(BaseHTTPRequestHandler):
+    # Fail the first request of each prompt with 429 (prompts starting with "drop" by closing
+    # the connection without a response instead), then serve images
+    seen: set[str] = set()
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeStability.requests += 1
+        text = body["text_prompts"][0]["text"]
+        if text not in FakeStability.seen:
+            FakeStability.seen.add(text)
+            if text.startswith("drop"):
+                self.close_connection = True
+                return
+            self.send_response(429)
+            self.send_header("Retry-After", "0.05")
+            self.end_headers()
+            return
+        if self.headers["Accept"] == "image/png":
+            payload, content_type = f"png:{text}".encode(), "image/png"
+        else:
+            artifacts = [
+                {"base64": base64.b64encode(f"png:{text}:{i}".encode()).decode()}
+                for i in range(body["samples"])
+            ]
+            payload, content_type = json.dumps({"artifacts": artifacts}).encode(), "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_client_retries_and_orders_results(monkeypatch):
+    collector = MemoryCollector()
+    monkeypatch.setattr(text2img_async, "metrics", Metrics(sink=collector))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStability)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def run():
+        async with AsyncText2Img(
+            api_host=f"http://127.0.0.1:{server.server_port}",
+            api_key="test",
+            max_concurrency=2,
+            requests_per_second=100,
+        ) as client:
+            results = await client.generate_many(["a", "b", "c"])
+            samples = await client.generate("d", samples=3)
+            return results, samples, client.stats()
+
+    try:
+        results, samples, metrics = asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert results == [[b"png:a"], [b"png:b"], [b"png:c"]]
+    assert samples == [b"png:d:0", b"png:d:1", b"png:d:2"]
+    assert metrics["retries"] == 4
+    assert metrics["completed"] == 4
+    assert (metrics["queue_depth"], metrics["in_flight"]) == (0, 0)
+    text2img_async.metrics.flush()
+    # Three prompts queue behind two slots; the levels end back at zero
+    assert max(collector.values("stability_queue_depth")) == 1
+    assert max(collector.values("stability_in_flight")) == 2
+    assert collector.values("stability_queue_depth")[-1] == collector.values("stability_in_flight")[-1] == 0
+
+
+def test_client_built_outside_the_event_loop():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStability)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Built at import time, like a module-level client, then used from separate asyncio.run() calls
+    client = AsyncText2Img(
+        api_host=f"http://127.0.0.1:{server.server_port}",
+        api_key="test",
+        max_concurrency=1,
+        requests_per_second=100,
+        backoff_base=0.01,
+    )
+    try:
+        first = asyncio.run(client.generate_many(["drop-a", "drop-b", "e"]))
+        second = asyncio.run(client.generate_many(["f", "g"]))
+        asyncio.run(client.aclose())
+    finally:
+        server.shutdown()
+    # Dropped connections are retried like 429s
+    assert first == [[b"png:drop-a"], [b"png:drop-b"], [b"png:e"]]
+    assert second == [[b"png:f"], [b"png:g"]]
+    assert client.stats()["retries"] == 5
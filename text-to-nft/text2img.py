@@ -1,36 +1,178 @@
 import base64
 import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Optional, Union
 import requests
+from requests.adapters import HTTPAdapter
 from get_api_key import get_api_key
+from utils.image_cache import ImageCache, LocalDiskStore, image_cache_key
+from utils.metrics import metrics
 
+ENGINE_ID = "stable-diffusion-xl-1024-v1-0"
+# Largest `samples` value the Stability text-to-image endpoint accepts per request
+MAX_SAMPLES_PER_REQUEST = 10
+# Images larger than this spill from memory to a temporary file
+SPOOL_MAX_SIZE = int(os.getenv("IMAGE_SPOOL_MAX_SIZE", str(16 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def text2img(text: str) -> str:
-    engine_id = "stable-diffusion-xl-1024-v1-0"
+# Built once per process so warm invocations (and concurrent batch records) reuse connections
+session = requests.Session()
+session.mount(
+    "https://", HTTPAdapter(pool_maxsize=int(os.getenv("STABILITY_POOL_SIZE", "10")))
+)
+
+image_cache = ImageCache(
+    LocalDiskStore(os.getenv("LAMBDA_WORK_DIR", "./tmp")),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    max_age=float(os.getenv("IMAGE_CACHE_MAX_AGE", str(7 * 24 * 3600))),
+)
+
+
+def text2img(text: str, params: Optional[dict[str, Any]] = None) -> str:
+    """
+    Generate an image for `text` and return its local path.
+    `params` are extra Stability generation parameters (cfg_scale, seed, steps, ...).
+    Results are cached by a hash of (engine_id, text, params), which is also used as the file name.
+    """
+    work_dir = os.getenv("LAMBDA_WORK_DIR", "./tmp")
+    key = _sample_key(text, params, 1, 0)
+    (image,) = text2img_batch([text], params=params)
+    return _cached_image_path(key, image, work_dir)
+
+
+def text2img_buffer(
+    text: str, params: Optional[dict[str, Any]] = None, cache: bool = True
+) -> BinaryIO:
+    """
+    Generate an image for `text` and return it as a readable binary file positioned at the start.
+    The PNG is requested as raw `image/png` and streamed into a SpooledTemporaryFile,
+    so it stays in memory below SPOOL_MAX_SIZE and no base64 JSON body is ever buffered.
+    The caller owns the returned file and must close it.
+    """
+    (image,) = text2img_batch([text], params=params, cache=cache)
+    return image
+
+
+def text2img_batch(
+    prompts: Union[str, list[str]],
+    samples: int = 1,
+    params: Optional[dict[str, Any]] = None,
+    cache: bool = True,
+) -> list[BinaryIO]:
+    """
+    Generate `samples` images for each prompt and return them in order
+    (all samples of the first prompt, then the second, ...).
+    Each prompt needs ceil(samples / MAX_SAMPLES_PER_REQUEST) requests; prompts already fully cached need none.
+    Every returned file is owned by the caller and must be closed; on failure they are all closed here.
+    """
+    if isinstance(prompts, str):
+        prompts = [prompts]
+    if samples < 1:
+        raise Exception("samples must be at least 1")
+
+    images: list[BinaryIO] = []
+    try:
+        for text in prompts:
+            keys = [_sample_key(text, params, samples, i) for i in range(samples)]
+            cached = [image_cache.open(key) for key in keys] if cache else []
+            if cache and all(image is not None for image in cached):
+                images.extend(cached)
+                continue
+            for image in cached:
+                if image is not None:
+                    image.close()
+
+            # Kept in `images` as they arrive, so a failure later on still closes them
+            first = len(images)
+            remaining = samples
+            while remaining > 0:
+                count = min(remaining, MAX_SAMPLES_PER_REQUEST)
+                artifacts = _generate(session, text, count, params)
+                # The API may return more artifacts than requested; only `count` are kept
+                for extra in artifacts[count:]:
+                    extra.close()
+                images.extend(artifacts[:count])
+                remaining -= count
+            generated = images[first:]
+            if len(generated) < samples:
+                raise Exception(
+                    f"Expected {samples} artifacts for {text!r}, got {len(generated)}"
+                )
+
+            if cache:
+                for key, image in zip(keys, generated):
+                    image_cache.put(key, image)
+                    image.seek(0)
+    except Exception:
+        for image in images:
+            image.close()
+        raise
+    return images
+
+
+def _sample_key(text: str, params: Optional[dict[str, Any]], samples: int, index: int) -> str:
+    # Single-sample requests keep the plain (engine_id, prompt, params) key
+    if samples == 1:
+        return image_cache_key(ENGINE_ID, text, params)
+    return image_cache_key(
+        ENGINE_ID, text, {**(params or {}), "samples": samples, "sample": index}
+    )
+
+
+def _generate(
+    session: requests.Session, text: str, samples: int, params: Optional[dict[str, Any]]
+) -> list[BinaryIO]:
+    engine_id = ENGINE_ID
     api_host = os.getenv("API_HOST", "https://api.stability.ai")
     api_key = get_api_key(
         "text_to_nft/stability_api_key2"
     )  # os.getenv("STABILITY_API_KEY")
-    work_dir = os.getenv("LAMBDA_WORK_DIR", "./tmp")
-
     if api_key is None:
         raise Exception("Missing Stability API key.")
 
-    response = requests.post(
+    # The raw image/png response only carries one image; multiple samples need the JSON artifacts
+    accept = "image/png" if samples == 1 else "application/json"
+    with metrics.timer("stability_request"), session.post(
         f"{api_host}/v1/generation/{engine_id}/text-to-image",
         headers={
             "Content-Type": "application/json",
-            "Accept": "application/json",
+            "Accept": accept,
             "Authorization": f"Bearer {api_key}",
         },
-        json={"text_prompts": [{"text": text}]},
-    )
+        json={**(params or {}), "samples": samples, "text_prompts": [{"text": text}]},
+        stream=samples == 1,
+    ) as response:
+        if response.status_code != 200:
+            metrics.count("stability_errors")
+            raise Exception("Non-200 response: " + str(response.text))
+        metrics.count("images_generated", samples)
+
+        if samples == 1:
+            buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                buffer.write(chunk)
+            buffer.seek(0)
+            return [buffer]
+
+        data = response.json()
+    images: list[BinaryIO] = []
+    for image in data["artifacts"]:
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        buffer.write(base64.b64decode(image["base64"]))
+        buffer.seek(0)
+        images.append(buffer)
+    return images
 
-    if response.status_code != 200:
-        raise Exception("Non-200 response: " + str(response.text))
 
-    data = response.json()
-    generated_image_path = f"{work_dir}/txt2img_{text}.png"
-    for i, image in enumerate(data["artifacts"]):
+def _cached_image_path(key: str, cached: BinaryIO, work_dir: str) -> str:
+    # Disk-backed caches already hold the file; other stores are copied into the work dir
+    with cached:
+        local_path = image_cache.store.local_path(key)
+        if local_path is not None:
+            return local_path
+        os.makedirs(work_dir, exist_ok=True)
+        generated_image_path = f"{work_dir}/txt2img_{key}.png"
         with open(generated_image_path, "wb") as f:
-            f.write(base64.b64decode(image["base64"]))
+            shutil.copyfileobj(cached, f)
     return generated_image_path
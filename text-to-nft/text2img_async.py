@@ -0,0 +1,230 @@
+import asyncio
+import base64
+import os
+import random
+import time
+from typing import Any, Optional
+import httpx
+from get_api_key import get_api_key
+from text2img import ENGINE_ID, MAX_SAMPLES_PER_REQUEST
+from utils.metrics import metrics
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allow `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Created inside the running loop: on Python 3.9 a lock binds to the loop current at
+        # construction, and the bucket may be built before asyncio.run() starts one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for `seconds`, e.g. after a 429 with Retry-After."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class AsyncText2Img:
+    """
+    Asyncio Stability client sharing one pooled HTTP connection.
+    At most `max_concurrency` generations are in flight, requests are paced by a token bucket,
+    and 429/5xx responses and transport errors (including timeouts) are retried with jittered
+    exponential backoff (honoring Retry-After). It may be built outside the event loop it is used in.
+    Queue depth and in-flight requests are sampled into utils.metrics as they change.
+    """
+
+    def __init__(
+        self,
+        api_host: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 4,
+        requests_per_second: float = 2,
+        burst: Optional[float] = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+        timeout: float = 120,
+    ):
+        self.api_host = api_host or os.getenv("API_HOST", "https://api.stability.ai")
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.max_concurrency = max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client = httpx.AsyncClient(
+            base_url=self.api_host,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+        self.queued = 0
+        self.in_flight = 0
+        self.retries = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def __aenter__(self) -> "AsyncText2Img":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Like TokenBucket._get_lock: bound to the loop that uses it, not the one constructing it
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def _publish(self) -> None:
+        metrics.gauge("stability_queue_depth", self.queued)
+        metrics.gauge("stability_in_flight", self.in_flight)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _post(self, text: str, samples: int, params: Optional[dict[str, Any]]) -> list[bytes]:
+        if self.api_key is None:
+            self.api_key = await asyncio.to_thread(
+                get_api_key, "text_to_nft/stability_api_key2"
+            )
+        accept = "image/png" if samples == 1 else "application/json"
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                with metrics.timer("stability_request"):
+                    response = await self._client.post(
+                        f"/v1/generation/{ENGINE_ID}/text-to-image",
+                        headers={
+                            "Content-Type": "application/json",
+                            "Accept": accept,
+                            "Authorization": f"Bearer {self.api_key}",
+                        },
+                        json={**(params or {}), "samples": samples, "text_prompts": [{"text": text}]},
+                    )
+            except httpx.TransportError as e:
+                # Connection failures and timeouts (httpx.TimeoutException is a TransportError)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                reason = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    if samples == 1:
+                        return [response.content]
+                    return [base64.b64decode(a["base64"]) for a in response.json()["artifacts"]]
+                if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    raise Exception("Non-200 response: " + str(response.text))
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    self.bucket.pause(delay)
+                reason = f"Stability returned {response.status_code}"
+            self.retries += 1
+            metrics.count("stability_retries")
+            print(f"{reason}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        raise Exception("Unreachable")
+
+    async def generate(
+        self, text: str, samples: int = 1, params: Optional[dict[str, Any]] = None
+    ) -> list[bytes]:
+        """Generate `samples` PNG images for `text`, split into as few requests as possible."""
+        counts = []
+        remaining = samples
+        while remaining > 0:
+            counts.append(min(remaining, MAX_SAMPLES_PER_REQUEST))
+            remaining -= counts[-1]
+        batches = await asyncio.gather(
+            *(self._scheduled(text, count, params) for count in counts)
+        )
+        return [image for batch in batches for image in batch]
+
+    async def _scheduled(self, text: str, samples: int, params: Optional[dict[str, Any]]) -> list[bytes]:
+        self.queued += 1
+        self._publish()
+        started = False
+        try:
+            async with self._get_semaphore():
+                self.queued -= 1
+                started = True
+                self.in_flight += 1
+                self._publish()
+                try:
+                    images = await self._post(text, samples, params)
+                except Exception:
+                    self.failed += 1
+                    raise
+                finally:
+                    self.in_flight -= 1
+                    self._publish()
+        finally:
+            if not started:
+                self.queued -= 1
+                self._publish()
+        self.completed += 1
+        return images
+
+    async def generate_many(
+        self, prompts: list[str], samples: int = 1, params: Optional[dict[str, Any]] = None
+    ) -> list[list[bytes]]:
+        """Generate images for every prompt concurrently; results follow the order of `prompts`."""
+        return await asyncio.gather(
+            *(self.generate(text, samples, params) for text in prompts)
+        )
@@ -0,0 +1,55 @@
+from typing import BinaryIO, Optional, Union
+from storage.backends import StorageBackend, get_backend
+from storage.car import Bundle, build_bundle
+from upload_json_nftstorage import token_metadata
+
+
+def pack_bundle(
+    image: Union[bytes, BinaryIO],
+    name: str,
+    description: str,
+    symbol: str,
+    backend: Optional[StorageBackend] = None,
+) -> Bundle:
+    """Build the CAR for one image and its metadata JSON locally; every URI is known afterwards."""
+    backend = backend or get_backend()
+    return build_bundle([(image, token_metadata(name, description, symbol))], gateway=backend.gateway)
+
+
+def upload_bundle(bundle: Bundle, backend: Optional[StorageBackend] = None) -> Bundle:
+    """Send a packed bundle in one request and close its CAR file."""
+    backend = backend or get_backend()
+    with bundle.car:
+        if backend.has(bundle.root_cid):
+            print(f"Already pinned, skipping upload: {bundle.root_cid}")
+            return bundle
+        cid = backend.upload_car(bundle.car).cid
+    if cid != bundle.root_cid:
+        raise Exception(f"{backend.name} CID {cid} does not match local root {bundle.root_cid}")
+    print("IPFS CID:", cid)
+    return bundle
+
+
+def upload_collection_nftstorage(
+    items: list[tuple[Union[bytes, BinaryIO], dict]],
+    backend: Optional[StorageBackend] = None,
+) -> Bundle:
+    """
+    Upload images and their metadata JSON as a single CAR in one request.
+    `backend` defaults to the STORAGE_BACKEND one (nft.storage unless configured otherwise).
+    All URIs are computed locally; the returned Bundle's CAR file is already closed.
+    """
+    backend = backend or get_backend()
+    return upload_bundle(build_bundle(items, gateway=backend.gateway), backend)
+
+
+def upload_bundle_nftstorage(
+    image: Union[bytes, BinaryIO],
+    name: str,
+    description: str,
+    symbol: str,
+    backend: Optional[StorageBackend] = None,
+) -> tuple[str, str]:
+    """Upload one image and its metadata JSON together. Returns (image URI, metadata URI)."""
+    bundle = upload_bundle(pack_bundle(image, name, description, symbol, backend), backend)
+    return bundle.image_uris[0], bundle.metadata_uris[0]
@@ -1,48 +1,35 @@
-import requests
-import json
-import os
-from get_api_key import get_api_key
+from typing import Any, Optional
+from storage.cid import canonical_json
+from storage.client import UploadResult, get_client
 
-def upload_json_nftstorage(
-    name: str, description: str, symbol: str, imgURI: str
-) -> None:
-    # Replace with your NFT.Storage bearer token
-    bearer_token = get_api_key(
-        "text_to_nft/nft_storage_api_key"
-    ) # os.getenv("NFT_STORAGE_API_KEY")
-
-    # Replace this with your Python object
-    # imgURI = "https://ipfs.io/ipfs/bafybeigwmnwmevdkox7kzqzpqqszgggbq2s2up3gjwpntxcgyrz64fkp44"
 
-    attributes = {"trait_type": "trait1", "value": "value1"}
+def token_metadata(
+    name: str, description: str, symbol: str, imgURI: Optional[str] = None
+) -> dict[str, Any]:
+    attributes = [{"trait_type": "trait1", "value": "value1"}]
     token_metadata = {
         "name": name,
         "description": description,
         "symbol": symbol,
-        "image": imgURI,
-        "attributes": attributes,  # User supplied
     }
+    if imgURI is not None:
+        token_metadata["image"] = imgURI
+    token_metadata["attributes"] = attributes  # User supplied
+    return token_metadata
 
-    # Convert the Python object to a JSON string
-    json_data = json.dumps(token_metadata)
 
-    # Prepare the HTTP headers with the bearer token and content type
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",
-        "Content-Type": "application/json",
-    }
-
-    # Prepare the URL for the /upload endpoint
-    upload_url = "https://api.nft.storage/upload"
+def upload_json_nftstorage(
+    name: str, description: str, symbol: str, imgURI: str
+) -> UploadResult:
+    # Replace this with your Python object
+    # imgURI = "https://ipfs.io/ipfs/bafybeigwmnwmevdkox7kzqzpqqszgggbq2s2up3gjwpntxcgyrz64fkp44"
 
-    # Send a POST request to the /upload endpoint with the JSON data
-    response = requests.post(upload_url, headers=headers, data=json_data)
+    # Convert the Python object to canonical JSON bytes
+    json_data = canonical_json(token_metadata(name, description, symbol, imgURI))
 
-    # Check the response
-    if response.status_code == 200:
-        print("JSON data uploaded successfully!")
-        print("IPFS CID:", json.loads(response.text)["value"]["cid"])
-        # IPFS CID: bafkreidr5cnmualj2eh7g6bpe2iztglbfvottfceamswqevlye7negmkcq
-    else:
-        print("Error uploading JSON data. Status code:", response.status_code)
-        print("Response:", response.text)
+    # Send it to the /upload endpoint over the shared nft.storage session
+    result = get_client().upload(json_data, content_type="application/json")
+    print("JSON data uploaded successfully!")
+    print("IPFS CID:", result.cid)
+    # IPFS CID: bafkreidr5cnmualj2eh7g6bpe2iztglbfvottfceamswqevlye7negmkcq
+    return result
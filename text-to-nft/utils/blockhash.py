@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+from solana.rpc.api import Client
+from solana.rpc.commitment import Finalized
+from solders.hash import Hash
+from utils.metrics import metrics
+from utils.rpc import get_rpc_client
+
+# Roughly one slot: a fresh blockhash is always at hand without polling much faster than it changes
+BLOCKHASH_REFRESH_INTERVAL = float(os.getenv("BLOCKHASH_REFRESH_INTERVAL", "0.4"))
+# Older than this (e.g. after a Lambda freeze) and get() fetches one itself
+BLOCKHASH_MAX_AGE = float(os.getenv("BLOCKHASH_MAX_AGE", "5"))
+# The refresh thread stops after this long without a get()
+BLOCKHASH_IDLE_TIMEOUT = float(os.getenv("BLOCKHASH_IDLE_TIMEOUT", "30"))
+
+
+class RecentBlockhash(NamedTuple):
+    blockhash: Hash
+    last_valid_block_height: int
+    fetched_at: float
+
+
+class BlockhashProvider:
+    """
+    Keeps the latest finalized blockhash of one RPC endpoint, refreshed from a background
+    thread, so building a transaction doesn't cost a getLatestBlockhash round trip.
+    The thread runs while the provider is in use and is restarted by the next get().
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        interval: float = BLOCKHASH_REFRESH_INTERVAL,
+        max_age: float = BLOCKHASH_MAX_AGE,
+        idle_timeout: float = BLOCKHASH_IDLE_TIMEOUT,
+    ):
+        self.client = client
+        self.interval = interval
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self._current: Optional[RecentBlockhash] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, exclude: Optional[Hash] = None) -> RecentBlockhash:
+        """
+        Current blockhash with its lastValidBlockHeight. Fetched on the spot when there is
+        none yet, when it is older than `max_age`, or when it is `exclude` (one that was rejected).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._last_used = now
+            current = self._current
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if current is None or now - current.fetched_at > self.max_age or current.blockhash == exclude:
+            with self._fetch_lock:
+                # Another caller may have refreshed it while we waited
+                with self._lock:
+                    current = self._current
+                if current is None or now - current.fetched_at > self.max_age or current.blockhash == exclude:
+                    current = self._fetch()
+        else:
+            metrics.count("blockhash_cache_hits")
+        return current
+
+    def _fetch(self) -> RecentBlockhash:
+        with metrics.timer("blockhash_fetch"):
+            latest = self.client.get_latest_blockhash(Finalized).value
+        current = RecentBlockhash(latest.blockhash, latest.last_valid_block_height, time.monotonic())
+        with self._lock:
+            self._current = current
+        return current
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if time.monotonic() - self._last_used > self.idle_timeout:
+                    self._thread = None
+                    return
+            try:
+                with self._fetch_lock:
+                    self._fetch()
+            except Exception as e:
+                print(f"Blockhash refresh failed: {e}")
+                metrics.count("blockhash_refresh_errors")
+
+
+_providers: dict[str, BlockhashProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_blockhash_provider(api_endpoint: str) -> BlockhashProvider:
+    """Process-wide blockhash provider for `api_endpoint`, sharing its pooled RPC client."""
+    with _providers_lock:
+        provider = _providers.get(api_endpoint)
+        if provider is None:
+            provider = _providers[api_endpoint] = BlockhashProvider(get_rpc_client(api_endpoint))
+        return provider
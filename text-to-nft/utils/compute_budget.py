@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Hashable, Optional, Union
+from solana.rpc.api import Client
+from solana.transaction import Transaction
+from solders.address_lookup_table_account import AddressLookupTableAccount
+from solders.compute_budget import ID as COMPUTE_BUDGET_PROGRAM_ID
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.message import MessageV0
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from solders.transaction import VersionedTransaction
+from utils.metrics import metrics
+from solana.rpc.providers.http import HTTPProvider
+from utils.rpc import get_rpc_client, get_rpc_provider, raise_for_error
+
+# Opt-in: simulate each transaction for a compute unit limit and price it from recent fees
+COMPUTE_BUDGET_ENABLED = os.getenv("SOLANA_COMPUTE_BUDGET", "").lower() in ("1", "true", "yes")
+PRIORITY_FEE_PERCENTILE = float(os.getenv("SOLANA_PRIORITY_FEE_PERCENTILE", "75"))
+# micro-lamports per compute unit
+PRIORITY_FEE_CAP = int(os.getenv("SOLANA_PRIORITY_FEE_CAP", "100000"))
+COMPUTE_UNIT_MARGIN = float(os.getenv("SOLANA_COMPUTE_UNIT_MARGIN", "1.1"))
+ESTIMATE_TTL = float(os.getenv("SOLANA_COMPUTE_BUDGET_TTL", "10"))
+MAX_COMPUTE_UNITS = 1_400_000
+# Headroom for the compute budget instructions themselves
+BUDGET_INSTRUCTION_UNITS = 300
+
+
+class GetRecentPrioritizationFees:
+    """Request body for getRecentPrioritizationFees, which solana-py and solders have no method for."""
+
+    def __init__(self, accounts: list[Pubkey]):
+        self.accounts = accounts
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": "getRecentPrioritizationFees",
+                "params": [[str(account) for account in self.accounts]],
+            }
+        )
+
+
+class _Cache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: dict[Hashable, tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.monotonic():
+                return None
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._items) > 1024:
+                self._items = {k: v for k, v in self._items.items() if v[1] >= now}
+            self._items[key] = (value, now + self.ttl)
+
+
+def _instructions(tx: Transaction) -> list[Instruction]:
+    # Drop budget instructions the transaction may already carry; they are replaced
+    return [ix for ix in tx.instructions if ix.program_id != COMPUTE_BUDGET_PROGRAM_ID]
+
+
+def writable_accounts(instructions: list[Instruction], payer: Pubkey) -> list[Pubkey]:
+    accounts = [payer]
+    for ix in instructions:
+        for meta in ix.accounts:
+            if meta.is_writable and meta.pubkey not in accounts:
+                accounts.append(meta.pubkey)
+    return accounts
+
+
+class ComputeBudgetTuner:
+    """
+    Prepends SetComputeUnitLimit (simulated units consumed plus a margin) and
+    SetComputeUnitPrice (a percentile of getRecentPrioritizationFees over the writable
+    accounts, capped) to transactions. Both estimates are cached for `ttl`: units per exact
+    instruction list, prices per writable account set. `provider` is the one `client` sends
+    through, used for the fee request.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        provider: HTTPProvider,
+        percentile: float = PRIORITY_FEE_PERCENTILE,
+        cap: int = PRIORITY_FEE_CAP,
+        margin: float = COMPUTE_UNIT_MARGIN,
+        ttl: float = ESTIMATE_TTL,
+    ):
+        self.client = client
+        self.provider = provider
+        self.percentile = percentile
+        self.cap = cap
+        self.margin = margin
+        self._units = _Cache(ttl)
+        self._prices = _Cache(ttl)
+
+    def units(
+        self,
+        instructions: list[Instruction],
+        payer: Pubkey,
+        blockhash: Hash,
+        lookup_tables: Optional[list[AddressLookupTableAccount]] = None,
+    ) -> Optional[int]:
+        """
+        Compute unit limit for `instructions`, or None if simulation is unavailable. With
+        `lookup_tables` they are simulated as the v0 transaction they will be sent as: packed
+        for v0, they don't fit a legacy one.
+        """
+        # Same data length is not the same work (e.g. a longer name or URI, another amount)
+        key = (payer, tuple((ix.program_id, tuple(ix.accounts), bytes(ix.data)) for ix in instructions))
+        units = self._units.get(key)
+        if units is not None:
+            return units
+        simulated = [set_compute_unit_limit(MAX_COMPUTE_UNITS), *instructions]
+        tx: Union[Transaction, VersionedTransaction]
+        if lookup_tables:
+            message = MessageV0.try_compile(payer, simulated, lookup_tables, blockhash)
+            # Unsigned: simulation runs without signature verification
+            signatures = [Signature.default()] * message.header.num_required_signatures
+            tx = VersionedTransaction.populate(message, signatures)
+        else:
+            tx = Transaction(recent_blockhash=blockhash, fee_payer=payer, instructions=simulated)
+        try:
+            with metrics.timer("simulate_transaction"):
+                result = self.client.simulate_transaction(tx).value
+        except Exception as e:
+            print(f"Simulation unavailable, sending without a compute unit limit: {e}")
+            metrics.count("simulation_errors")
+            return None
+        if result.err is not None:
+            raise Exception(f"Transaction simulation failed: {result.err}")
+        if result.units_consumed is None:
+            return None
+        units = min(MAX_COMPUTE_UNITS, int(result.units_consumed * self.margin) + BUDGET_INSTRUCTION_UNITS)
+        self._units.put(key, units)
+        return units
+
+    def price(self, accounts: list[Pubkey]) -> int:
+        """Compute unit price in micro-lamports; 0 when fees can't be fetched."""
+        key = frozenset(accounts)
+        price = self._prices.get(key)
+        if price is not None:
+            return price
+        body = GetRecentPrioritizationFees(accounts)
+        try:
+            with metrics.timer("prioritization_fees_fetch"):
+                raw = self.provider.make_request_unparsed(body)
+            raise_for_error(body, raw)
+            fees = sorted(entry["prioritizationFee"] for entry in json.loads(raw)["result"])
+        except Exception as e:
+            print(f"Prioritization fees unavailable, sending without a priority fee: {e}")
+            metrics.count("prioritization_fee_errors")
+            return 0
+        price = 0
+        if fees:
+            price = min(self.cap, fees[min(len(fees) - 1, int(len(fees) * self.percentile / 100))])
+        self._prices.put(key, price)
+        return price
+
+    def tune(
+        self,
+        tx: Transaction,
+        payer: Pubkey,
+        blockhash: Hash,
+        lookup_tables: Optional[list[AddressLookupTableAccount]] = None,
+    ) -> Transaction:
+        """
+        A copy of `tx` (unsigned, pinned to `blockhash`) with compute budget instructions first.
+        Pass the `lookup_tables` it will be sent with as a v0 transaction.
+        """
+        instructions = _instructions(tx)
+        budget = []
+        units = self.units(instructions, payer, blockhash, lookup_tables)
+        if units is not None:
+            budget.append(set_compute_unit_limit(units))
+        price = self.price(writable_accounts(instructions, payer))
+        if price:
+            budget.append(set_compute_unit_price(price))
+        return Transaction(recent_blockhash=blockhash, fee_payer=payer, instructions=[*budget, *instructions])
+
+
+_tuners: dict[str, ComputeBudgetTuner] = {}
+_tuners_lock = threading.Lock()
+
+
+def get_tuner(api_endpoint: str) -> ComputeBudgetTuner:
+    """Process-wide tuner for `api_endpoint`, sharing its pooled RPC client."""
+    with _tuners_lock:
+        tuner = _tuners.get(api_endpoint)
+        if tuner is None:
+            tuner = _tuners[api_endpoint] = ComputeBudgetTuner(
+                get_rpc_client(api_endpoint), get_rpc_provider(api_endpoint)
+            )
+        return tuner
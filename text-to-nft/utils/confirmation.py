@@ -0,0 +1,487 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+from solana.rpc.api import Client
+from solders.signature import Signature
+from solders.transaction_status import TransactionConfirmationStatus, TransactionStatus
+from utils.metrics import metrics
+from utils.rpc import endpoint_urls, get_rpc_client
+
+# Adaptive polling: check quickly right after sending, then back off
+POLL_INITIAL_INTERVAL = 0.25
+POLL_MAX_INTERVAL = 2.0
+POLL_BACKOFF = 1.5
+WS_OPEN_TIMEOUT = 5
+# How often a websocket wait checks whether it has been told to stop
+WS_STOP_CHECK_INTERVAL = 0.5
+# After a websocket connection fails, confirmations poll for this long before it is tried again
+WS_RETRY_INTERVAL = float(os.getenv("SOLANA_WS_RETRY_INTERVAL", "30"))
+# getSignatureStatuses accepts at most 256 signatures per call
+MAX_SIGNATURES_PER_REQUEST = 256
+TRACKER_INTERVAL = float(os.getenv("CONFIRMATION_TRACKER_INTERVAL", "0.4"))
+# solana-test-validator serves RPC on 8899 and its pubsub websocket on the next port
+LOCAL_RPC_PORT = 8899
+
+
+class TransactionFailed(Exception):
+    """The transaction landed but its execution failed."""
+
+
+def ws_endpoint(http_endpoint: str) -> str:
+    """
+    Websocket URL of an RPC node: SOLANA_WS_URL if set, otherwise the HTTP URL with a ws(s)
+    scheme. The port is kept, except that 8899 becomes 8900 (solana-test-validator layout).
+    """
+    override = os.getenv("SOLANA_WS_URL")
+    if override:
+        return override
+    # Subscriptions go to the first endpoint of a pool
+    parts = urlsplit(endpoint_urls(http_endpoint)[0])
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    netloc = parts.netloc
+    if parts.port == LOCAL_RPC_PORT:
+        netloc = f"{parts.hostname}:{LOCAL_RPC_PORT + 1}"
+    return urlunsplit((scheme, netloc, parts.path, parts.query, parts.fragment))
+
+
+def status_reached(status: Optional[TransactionStatus], target: int, finalized: bool) -> bool:
+    if status is None:
+        return False
+    if status.err is not None:
+        raise TransactionFailed(f"Transaction failed: {status.err}")
+    is_finalized = status.confirmation_status == TransactionConfirmationStatus.Finalized
+    if finalized:
+        return is_finalized
+    return is_finalized or (status.confirmations is not None and status.confirmations >= target)
+
+
+def poll_confirmation(
+    client: Client,
+    signature: Signature,
+    deadline: float,
+    target: int = 20,
+    finalized: bool = True,
+) -> bool:
+    """Poll getSignatureStatuses with a growing interval until the commitment is reached or `deadline` passes."""
+    interval = POLL_INITIAL_INTERVAL
+    while True:
+        if status_reached(client.get_signature_statuses([signature]).value[0], target, finalized):
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+
+class _Waiter(NamedTuple):
+    future: Future
+    target: int
+    finalized: bool
+    deadline: float
+    stop: Optional[threading.Event]
+
+    def expired(self, now: float) -> bool:
+        return self.deadline <= now or (self.stop is not None and self.stop.is_set())
+
+
+class ConfirmationTracker:
+    """
+    Confirms every in-flight signature for one RPC endpoint from a single background thread.
+    Each tick queries all pending signatures in getSignatureStatuses calls of up to 256, so
+    RPC load depends on the tick rate rather than on how many transactions are waiting.
+    The thread exits when nothing is pending and is restarted by the next track().
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        interval: float = TRACKER_INTERVAL,
+        max_batch: int = MAX_SIGNATURES_PER_REQUEST,
+    ):
+        self.client = client
+        self.interval = interval
+        self.max_batch = max_batch
+        self._waiters: dict[Signature, list[_Waiter]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(
+        self,
+        signature: Signature,
+        target: int = 20,
+        finalized: bool = True,
+        max_timeout: float = 60,
+        callback: Optional[Callable[[Future], None]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Future:
+        """
+        Future resolving to True once `signature` reaches the commitment, False after
+        `max_timeout` seconds (or once `stop` is set), or raising TransactionFailed.
+        `callback` gets the done future.
+        """
+        future: Future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        waiter = _Waiter(future, target, finalized, time.monotonic() + max_timeout, stop)
+        with self._lock:
+            self._waiters.setdefault(signature, []).append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return future
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+                signatures = list(self._waiters)
+            for i in range(0, len(signatures), self.max_batch):
+                self._tick(signatures[i : i + self.max_batch])
+            self._expire()
+            time.sleep(self.interval)
+
+    def _tick(self, signatures: list[Signature]) -> None:
+        try:
+            statuses = self.client.get_signature_statuses(signatures).value
+        except Exception as e:
+            print(f"Signature status query failed: {e}")
+            metrics.count("confirmation_poll_errors")
+            return
+        done: list[tuple[_Waiter, Optional[Exception]]] = []
+        with self._lock:
+            for signature, status in zip(signatures, statuses):
+                waiters = self._waiters.get(signature, [])
+                for waiter in list(waiters):
+                    try:
+                        reached = status_reached(status, waiter.target, waiter.finalized)
+                    except TransactionFailed as e:
+                        reached, error = True, e
+                    else:
+                        error = None
+                    if reached:
+                        waiters.remove(waiter)
+                        done.append((waiter, error))
+                if not waiters:
+                    self._waiters.pop(signature, None)
+        # Resolve outside the lock: done callbacks may track more signatures
+        for waiter, error in done:
+            if error is not None:
+                waiter.future.set_exception(error)
+            else:
+                waiter.future.set_result(True)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired: list[_Waiter] = []
+        with self._lock:
+            for signature in list(self._waiters):
+                waiters = self._waiters[signature]
+                expired += [waiter for waiter in waiters if waiter.expired(now)]
+                waiters[:] = [waiter for waiter in waiters if not waiter.expired(now)]
+                if not waiters:
+                    del self._waiters[signature]
+        for waiter in expired:
+            waiter.future.set_result(False)
+
+
+_trackers: dict[str, ConfirmationTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(api_endpoint: str) -> ConfirmationTracker:
+    """Process-wide tracker for `api_endpoint`, sharing its pooled RPC client."""
+    with _trackers_lock:
+        tracker = _trackers.get(api_endpoint)
+        if tracker is None:
+            tracker = _trackers[api_endpoint] = ConfirmationTracker(get_rpc_client(api_endpoint))
+        return tracker
+
+
+class _Socket:
+    """One websocket connection of a SignatureSubscriber and the subscriptions made over it."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.closed = False
+        # request id -> (signature, waiter) until the node answers with a subscription id
+        self.requests: dict[int, tuple[Signature, _Waiter]] = {}
+        self.subscriptions: dict[int, tuple[Signature, _Waiter]] = {}
+
+    def idle(self) -> bool:
+        return not self.requests and not self.subscriptions
+
+
+class SignatureSubscriber:
+    """
+    Confirms signatures for one RPC endpoint over a single websocket: every signatureSubscribe
+    shares the connection, and one background thread reads all notifications. The connection
+    is opened by the first subscribe() and closed once nothing is pending. If it can't be
+    opened, or drops, the pending futures fail with OSError, and for WS_RETRY_INTERVAL
+    seconds subscribe() fails straight away instead of trying again.
+    """
+
+    def __init__(self, api_endpoint: str):
+        self.api_endpoint = api_endpoint
+        self._socket: Optional[_Socket] = None
+        self._next_id = 0
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self,
+        signature: Signature,
+        deadline: float,
+        target: int = 20,
+        finalized: bool = True,
+        stop: Optional[threading.Event] = None,
+    ) -> Future:
+        """
+        Future resolving to True once `signature` is "finalized" (or "confirmed", without
+        `finalized`), False at `deadline` or soon after `stop` is set. It raises
+        TransactionFailed if the transaction failed and OSError if the websocket is unusable.
+        """
+        future: Future = Future()
+        waiter = _Waiter(future, target, finalized, deadline, stop)
+        with self._lock:
+            try:
+                socket = self._connect()
+            except Exception as e:
+                future.set_exception(OSError(f"Websocket unavailable: {e}"))
+                return future
+            self._next_id += 1
+            request_id = self._next_id
+            socket.requests[request_id] = (signature, waiter)
+        commitment = "finalized" if finalized else "confirmed"
+        request = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": "signatureSubscribe",
+            "params": [str(signature), {"commitment": commitment}],
+        }
+        try:
+            socket.ws.send(json.dumps(request))
+        except Exception as e:
+            self._fail(socket, e)
+        return future
+
+    def _connect(self) -> _Socket:
+        # Called with the lock held; nothing else waits on it while there is no connection
+        if self._socket is not None and not self._socket.closed:
+            return self._socket
+        if self._failed_at is not None and time.monotonic() - self._failed_at < WS_RETRY_INTERVAL:
+            raise OSError("recently failed")
+        from websockets.sync.client import connect
+
+        try:
+            ws = connect(ws_endpoint(self.api_endpoint), open_timeout=WS_OPEN_TIMEOUT)
+        except Exception:
+            self._failed_at = time.monotonic()
+            raise
+        self._failed_at = None
+        self._socket = _Socket(ws)
+        threading.Thread(target=self._run, args=(self._socket,), daemon=True).start()
+        return self._socket
+
+    def _run(self, socket: _Socket) -> None:
+        while True:
+            with self._lock:
+                if socket.idle():
+                    socket.closed = True
+                    break
+            try:
+                message = json.loads(socket.ws.recv(timeout=WS_STOP_CHECK_INTERVAL))
+            except TimeoutError:
+                message = None
+            except Exception as e:
+                self._fail(socket, e)
+                return
+            if message is not None:
+                self._dispatch(socket, message)
+            self._expire(socket)
+        socket.ws.close()
+
+    def _dispatch(self, socket: _Socket, message: dict) -> None:
+        if message.get("method") == "signatureNotification":
+            params = message["params"]
+            with self._lock:
+                entry = socket.subscriptions.pop(params["subscription"], None)
+            if entry is not None:
+                err = params["result"]["value"].get("err")
+                if err is not None:
+                    entry[1].future.set_exception(TransactionFailed(f"Transaction failed: {err}"))
+                else:
+                    entry[1].future.set_result(True)
+            return
+        with self._lock:
+            entry = socket.requests.pop(message.get("id"), None)
+            if entry is not None and "error" not in message:
+                socket.subscriptions[message["result"]] = entry
+        if entry is None:
+            # e.g. the answer to a signatureUnsubscribe
+            return
+        signature, waiter = entry
+        if "error" in message:
+            waiter.future.set_exception(OSError(f"signatureSubscribe rejected: {message['error']}"))
+            return
+        # The transaction may have reached the commitment before the subscription existed.
+        # That check is one status query, batched with the others by the endpoint's tracker.
+        tracker = get_tracker(self.api_endpoint)
+        checked = tracker.track(signature, waiter.target, waiter.finalized, 2 * tracker.interval)
+        checked.add_done_callback(lambda done: self._checked(socket, message["result"], done))
+
+    def _checked(self, socket: _Socket, subscription: int, checked: Future) -> None:
+        if checked.exception() is None and not checked.result():
+            return
+        with self._lock:
+            entry = socket.subscriptions.pop(subscription, None)
+        if entry is None:
+            return
+        self._unsubscribe(socket, subscription)
+        if checked.exception() is not None:
+            entry[1].future.set_exception(checked.exception())
+        else:
+            entry[1].future.set_result(True)
+
+    def _unsubscribe(self, socket: _Socket, subscription: int) -> None:
+        request = {"jsonrpc": "2.0", "id": 0, "method": "signatureUnsubscribe", "params": [subscription]}
+        try:
+            socket.ws.send(json.dumps(request))
+        except Exception:
+            pass
+
+    def _expire(self, socket: _Socket) -> None:
+        now = time.monotonic()
+        expired: list[tuple[Optional[int], _Waiter]] = []
+        with self._lock:
+            for request_id, (_, waiter) in list(socket.requests.items()):
+                if waiter.expired(now):
+                    del socket.requests[request_id]
+                    expired.append((None, waiter))
+            for subscription, (_, waiter) in list(socket.subscriptions.items()):
+                if waiter.expired(now):
+                    del socket.subscriptions[subscription]
+                    expired.append((subscription, waiter))
+        for subscription, waiter in expired:
+            if subscription is not None:
+                self._unsubscribe(socket, subscription)
+            waiter.future.set_result(False)
+
+    def _fail(self, socket: _Socket, error: Exception) -> None:
+        with self._lock:
+            socket.closed = True
+            self._failed_at = time.monotonic()
+            waiters = [waiter for _, waiter in [*socket.requests.values(), *socket.subscriptions.values()]]
+            socket.requests.clear()
+            socket.subscriptions.clear()
+        try:
+            socket.ws.close()
+        except Exception:
+            pass
+        for waiter in waiters:
+            waiter.future.set_exception(OSError(f"Websocket failed: {error}"))
+
+
+_subscribers: dict[str, SignatureSubscriber] = {}
+_subscribers_lock = threading.Lock()
+
+
+def get_subscriber(api_endpoint: str) -> SignatureSubscriber:
+    """Process-wide websocket subscriber for `api_endpoint`."""
+    with _subscribers_lock:
+        subscriber = _subscribers.get(api_endpoint)
+        if subscriber is None:
+            subscriber = _subscribers[api_endpoint] = SignatureSubscriber(api_endpoint)
+        return subscriber
+
+
+def _track(
+    api_endpoint: str,
+    signature: Signature,
+    deadline: float,
+    target: int,
+    finalized: bool,
+    stop: Optional[threading.Event] = None,
+) -> Future:
+    remaining = max(0.0, deadline - time.monotonic())
+    return get_tracker(api_endpoint).track(signature, target, finalized, remaining, stop=stop)
+
+
+def confirm_async(
+    api_endpoint: str,
+    signature: Signature,
+    max_timeout: float = 60,
+    target: int = 20,
+    finalized: bool = True,
+    stop: Optional[threading.Event] = None,
+) -> Future:
+    """
+    Start confirming `signature` and return a Future with confirm_transaction's outcome.
+    Setting `stop` abandons the wait; the Future then resolves to False. Neither mode starts
+    a thread or a connection per signature: websocket waits share the endpoint's
+    SignatureSubscriber, polling ones its ConfirmationTracker.
+    """
+    deadline = time.monotonic() + max_timeout
+    if os.getenv("SOLANA_CONFIRMATION", "websocket") != "websocket":
+        return _track(api_endpoint, signature, deadline, target, finalized, stop)
+
+    future: Future = Future()
+
+    def relay(tracked: Future) -> None:
+        if tracked.exception() is not None:
+            future.set_exception(tracked.exception())
+        else:
+            future.set_result(tracked.result())
+
+    def notified(subscribed: Future) -> None:
+        error = subscribed.exception()
+        if isinstance(error, TransactionFailed):
+            future.set_exception(error)
+        elif error is not None:
+            print(f"Websocket confirmation unavailable ({error}), polling instead")
+            metrics.count("confirmation_ws_fallbacks")
+            _track(api_endpoint, signature, deadline, target, finalized, stop).add_done_callback(relay)
+        elif subscribed.result() and not finalized and target > 1:
+            # "confirmed" was reached; a confirmation count target is only visible through polling
+            _track(api_endpoint, signature, deadline, target, finalized, stop).add_done_callback(relay)
+        else:
+            future.set_result(subscribed.result())
+
+    get_subscriber(api_endpoint).subscribe(signature, deadline, target, finalized, stop).add_done_callback(notified)
+    return future
+
+
+def confirm_transaction(
+    api_endpoint: str,
+    signature: Signature,
+    max_timeout: float = 60,
+    target: int = 20,
+    finalized: bool = True,
+) -> bool:
+    """
+    Wait until `signature` reaches the requested commitment (finalized, or `target`
+    confirmations). Uses a websocket subscription unless SOLANA_CONFIRMATION=polling,
+    and otherwise (or if the websocket is unavailable) waits on the endpoint's shared
+    ConfirmationTracker.
+    Returns False on timeout; raises TransactionFailed if the transaction failed.
+    """
+    start = time.monotonic()
+    confirmed = confirm_async(api_endpoint, signature, max_timeout, target, finalized).result()
+
+    elapsed = time.monotonic() - start
+    if confirmed:
+        print(f"Took {elapsed:.2f} seconds to confirm transaction")
+    else:
+        print(f"Transaction {signature} not confirmed after {elapsed:.2f} seconds")
+        metrics.count("confirmation_timeouts")
+    return confirmed
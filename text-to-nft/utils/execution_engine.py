@@ -1,12 +1,184 @@
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Optional
 from solana.rpc.api import Client
 from solana.rpc.types import TxOpts
 from solana.transaction import Transaction
+from solders.address_lookup_table_account import AddressLookupTableAccount
 from solders.keypair import Keypair
+from solders.message import MessageV0
 from solders.rpc.responses import SendTransactionResp
+from solders.hash import Hash
 from solders.signature import Signature
-from solders.transaction_status import TransactionConfirmationStatus
+from solders.transaction import VersionedTransaction
+from utils.blockhash import get_blockhash_provider
+from utils.compute_budget import COMPUTE_BUDGET_ENABLED, get_tuner
+from utils.confirmation import TransactionFailed, confirm_async, poll_confirmation
+from utils.metrics import metrics
+from utils.rpc import get_rpc_client
+
+
+# Seconds between rebroadcasts of the same signed transaction while it is unconfirmed
+REBROADCAST_INTERVAL = float(os.getenv("SOLANA_REBROADCAST_INTERVAL", "2"))
+# Preflight is skipped and the node must not queue its own retries: we rebroadcast ourselves
+SEND_OPTS = TxOpts(skip_confirmation=True, skip_preflight=True, max_retries=0)
+# Backoff before signing again after an unexpected error (e.g. the blockhash fetch failing)
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 5
+# Transactions execute_many() keeps in flight at once
+MAX_IN_FLIGHT = int(os.getenv("SOLANA_MAX_IN_FLIGHT", "32"))
+
+RETRY = "retry"
+RESIGN = "resign"
+FATAL = "fatal"
+PROCESSED = "processed"
+
+# Substrings of RPC error messages (lowercased, spaces and underscores removed)
+FATAL_ERRORS = (
+    "insufficientfunds",
+    "insufficientlamports",
+    "invalidaccountdata",
+    "accountalreadyinuse",
+    "signatureverification",
+    "signaturefailure",
+    "customprogramerror",
+    "instructionerror",
+    "invalidaccountindex",
+    "programaccountnotfound",
+    "transactionsimulationfailed",
+)
+RESIGN_ERRORS = ("blockhashnotfound",)
+PROCESSED_ERRORS = ("alreadyprocessed",)
+
+
+class SubmissionError(Exception):
+    def __init__(self, kind: str, error: Exception):
+        super().__init__(f"{kind}: {error}")
+        self.kind = kind
+        self.error = error
+
+
+class BlockhashExpired(Exception):
+    """The transaction can no longer land; it has to be signed again with a new blockhash."""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    RETRY: transport/node trouble, send the same bytes again. RESIGN: the blockhash is unusable.
+    FATAL: the transaction itself is wrong and would fail again. PROCESSED: it already landed.
+    """
+    if isinstance(error, TransactionFailed):
+        return FATAL
+    message = str(error).lower().replace(" ", "").replace("_", "")
+    for kind, patterns in (
+        (PROCESSED, PROCESSED_ERRORS),
+        (RESIGN, RESIGN_ERRORS),
+        (FATAL, FATAL_ERRORS),
+    ):
+        if any(pattern in message for pattern in patterns):
+            return kind
+    return RETRY
+
+
+def _broadcast(client: Client, raw: bytes, signature: Signature) -> Optional[SendTransactionResp]:
+    """Send the signed bytes once. Returns None when the send should simply be repeated."""
+    try:
+        with metrics.timer("send_transaction"):
+            return client.send_raw_transaction(raw, opts=SEND_OPTS)
+    except Exception as e:
+        kind = classify_error(e)
+        if kind == PROCESSED:
+            return SendTransactionResp(signature)
+        if kind != RETRY:
+            raise SubmissionError(kind, e)
+        print(f"Send failed, will rebroadcast: {e}")
+        metrics.count("send_retries")
+        return None
+
+
+def _expired(client: Client, signature: Signature, last_valid_block_height: int) -> bool:
+    # Finalized block height past lastValidBlockHeight and no status means it can never land.
+    # When in doubt (e.g. the node is unreachable) keep waiting rather than risk signing twice.
+    try:
+        if client.get_block_height().value <= last_valid_block_height:
+            return False
+        return client.get_signature_statuses([signature]).value[0] is None
+    except Exception as e:
+        print(f"Expiry check failed: {e}")
+        return False
+
+
+def _land(
+    api_endpoint: str,
+    raw: bytes,
+    signature: Signature,
+    last_valid_block_height: int,
+    skip_confirmation: bool,
+    max_timeout: float,
+    target: int,
+    finalized: bool,
+) -> Optional[SendTransactionResp]:
+    """
+    Rebroadcast `raw` every REBROADCAST_INTERVAL until it is confirmed (or just accepted, with
+    skip_confirmation). Raises BlockhashExpired once it can no longer land. Returns the send
+    response, or None if it was never accepted within `max_timeout`.
+    """
+    client = get_rpc_client(api_endpoint)
+    deadline = time.monotonic() + max_timeout
+    sent = _broadcast(client, raw, signature)
+    if skip_confirmation and sent is not None:
+        return sent
+    stop = threading.Event()
+    confirmation = None
+    if not skip_confirmation:
+        confirmation = confirm_async(api_endpoint, signature, max_timeout, target, finalized, stop)
+    try:
+        while time.monotonic() < deadline:
+            if confirmation is None:
+                time.sleep(REBROADCAST_INTERVAL)
+            else:
+                try:
+                    if confirmation.result(timeout=REBROADCAST_INTERVAL):
+                        return sent or SendTransactionResp(signature)
+                    # max_timeout ran out first: returned unconfirmed, as before
+                    return sent
+                except FutureTimeoutError:
+                    pass
+            if _expired(client, signature, last_valid_block_height):
+                raise BlockhashExpired(f"Blockhash expired before {signature} landed")
+            metrics.count("rebroadcasts")
+            try:
+                sent = _broadcast(client, raw, signature) or sent
+            except SubmissionError:
+                # Once a node has accepted it, only confirmation or expiry decide the outcome
+                if sent is None:
+                    raise
+            if skip_confirmation and sent is not None:
+                return sent
+        return sent
+    finally:
+        stop.set()
+
+
+def _sign(
+    tx: Transaction,
+    signers: list[Keypair],
+    blockhash: Hash,
+    lookup_tables: Optional[list[AddressLookupTableAccount]],
+) -> tuple[bytes, Signature]:
+    if not lookup_tables:
+        tx.recent_blockhash = blockhash
+        tx.sign(*signers)
+        return tx.serialize(), tx.signatures[0]
+    payer = tx.fee_payer or signers[0].pubkey()
+    message = MessageV0.try_compile(payer, list(tx.instructions), lookup_tables, blockhash)
+    # One keypair per signer, as legacy signing allows the same one to be passed twice
+    keypairs = list({keypair.pubkey(): keypair for keypair in signers}.values())
+    versioned = VersionedTransaction(message, keypairs)
+    return bytes(versioned), versioned.signatures[0]
 
 
 def execute(
@@ -18,44 +190,97 @@ def execute(
     max_timeout: int = 60,
     target: int = 20,
     finalized: bool = True,
+    lookup_tables: Optional[list[AddressLookupTableAccount]] = None,
 ) -> Optional[SendTransactionResp]:
-    client = Client(api_endpoint)
+    """
+    Sign `tx` with a pinned blockhash and rebroadcast the same bytes until it is confirmed.
+    Each of the `max_retries` attempts resends those bytes; it is only signed again once that
+    blockhash has expired or was rejected, so two versions can never both land. Transient
+    errors are retried, errors the transaction itself causes are not.
+    Blockhashes come from the endpoint's shared BlockhashProvider. With SOLANA_COMPUTE_BUDGET
+    set, each signing also gets a simulated compute unit limit and a priority fee.
+    With `lookup_tables`, `tx` is sent as a v0 transaction loading accounts from them.
+    """
+    blockhashes = get_blockhash_provider(api_endpoint)
+    # A blockhash that expired or was rejected, which must not be handed out again
+    rejected: Optional[Hash] = None
+    # The last signed version while it may still land. The next attempt resends these exact
+    # bytes instead of signing a second version that could land alongside it.
+    pending = None
     for attempt in range(max_retries):
+        latest = None
         try:
-            result = client.send_transaction(
-                tx, *signers, opts=TxOpts(skip_confirmation=False, skip_preflight=True)
-            )
-            signatures = [x for x in tx.signatures]
-            if not skip_confirmation:
-                await_confirmation(client, signatures, max_timeout, target, finalized)
-            return result
+            if pending is None:
+                latest = blockhashes.get(exclude=rejected)
+                if COMPUTE_BUDGET_ENABLED:
+                    payer = tx.fee_payer or signers[0].pubkey()
+                    tx = get_tuner(api_endpoint).tune(tx, payer, latest.blockhash, lookup_tables)
+                raw, signature = _sign(tx, signers, latest.blockhash, lookup_tables)
+                pending = (latest, raw, signature)
+            latest, raw, signature = pending
+            with metrics.timer("confirmation"):
+                result = _land(
+                    api_endpoint,
+                    raw,
+                    signature,
+                    latest.last_valid_block_height,
+                    skip_confirmation,
+                    max_timeout,
+                    target,
+                    finalized,
+                )
+            if result is not None:
+                return result
+            print(f"Failed attempt {attempt}: {signature} was never accepted")
+        except BlockhashExpired as e:
+            print(f"Failed attempt {attempt}: {e}")
+            metrics.count("blockhash_expired")
+            rejected = latest.blockhash
+            pending = None
+        except SubmissionError as e:
+            print(f"Failed attempt {attempt}: {e}")
+            if e.kind == FATAL:
+                break
+            if e.kind == RESIGN:
+                rejected = latest.blockhash
+                pending = None
         except Exception as e:
             print(f"Failed attempt {attempt}: {e}")
-            continue
+            kind = classify_error(e)
+            # Resending would only fail the same way
+            if kind == FATAL:
+                break
+            if kind == RESIGN and latest is not None:
+                rejected = latest.blockhash
+                pending = None
+            time.sleep(min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2**attempt))
+    metrics.count("send_failures")
     return None
 
 
+def execute_many(
+    api_endpoint: str,
+    transactions: list[tuple[Transaction, list[Keypair]]],
+    max_in_flight: int = MAX_IN_FLIGHT,
+    **kwargs,
+) -> list[Optional[SendTransactionResp]]:
+    """
+    execute() each (transaction, signers) pair, at most `max_in_flight` at a time; their
+    confirmations share the endpoint's websocket (or, polling, its ConfirmationTracker).
+    Results are in input order, None for failures.
+    """
+    if not transactions:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(transactions))) as pool:
+        return list(pool.map(lambda job: execute(api_endpoint, job[0], job[1], **kwargs), transactions))
+
+
 def await_confirmation(
     client: Client, signatures: list[Signature], max_timeout: int = 60, target: int = 20, finalized: bool = True
-) -> None:
-    elapsed = 0
-    while elapsed < max_timeout:
-        sleep_time = 1
-        time.sleep(sleep_time)
-        elapsed += sleep_time
-        resp = client.get_signature_statuses(signatures)
-        if resp.value[0] is not None:
-            confirmations = resp.value[0].confirmations
-            is_finalized = (
-                resp.value[0].confirmation_status
-                == TransactionConfirmationStatus.Finalized
-            )
-        else:
-            continue
-        if not finalized:
-            if confirmations is not None and confirmations >= target or is_finalized:
-                print(f"Took {elapsed} seconds to confirm transaction")
-                return
-        elif is_finalized:
-            print(f"Took {elapsed} seconds to confirm transaction")
-            return
+) -> bool:
+    """Poll (with adaptive backoff) until the first signature reaches the requested commitment."""
+    start = time.monotonic()
+    confirmed = poll_confirmation(client, signatures[0], start + max_timeout, target, finalized)
+    if confirmed:
+        print(f"Took {time.monotonic() - start:.2f} seconds to confirm transaction")
+    return confirmed
@@ -0,0 +1,287 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Optional
+from botocore.exceptions import ClientError
+
+
+def image_cache_key(engine_id: str, prompt: str, params: Optional[dict[str, Any]] = None) -> str:
+    """Content address of a generation request: sha256 over the canonical JSON of (engine_id, prompt, params)."""
+    canonical = json.dumps(
+        {"engine_id": engine_id, "prompt": prompt, "params": params or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ImageStore(ABC):
+    """Storage interface for cached images. Keys are hex digests from image_cache_key."""
+
+    @abstractmethod
+    def open(self, key: str) -> Optional[BinaryIO]:
+        ...
+
+    @abstractmethod
+    def write(self, key: str, fileobj: BinaryIO) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def entries(self) -> list[tuple[str, int, float, float]]:
+        """Return (key, size, created_at, last_used) for every stored image."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the image on local disk, if the store keeps it there."""
+        return None
+
+
+class LocalDiskStore(ImageStore):
+    """
+    Images as files in `directory`. The mtime records the last use and a `.created` sidecar
+    next to each image records when it was written.
+    """
+
+    def __init__(self, directory: str, prefix: str = "txt2img_", suffix: str = ".png"):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{self.prefix}{key}{self.suffix}")
+
+    def _created_path(self, key: str) -> str:
+        return f"{self.path(key)}.created"
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        try:
+            f = open(self.path(key), "rb")
+        except FileNotFoundError:
+            return None
+        # Bump the mtime so LRU order survives a cold start
+        os.utime(self.path(key))
+        return f
+
+    def write(self, key: str, fileobj: BinaryIO) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        # Written first, so an image on disk always has its creation time
+        with open(f"{tmp_path}.created", "w") as f:
+            f.write(repr(time.time()))
+        os.replace(f"{tmp_path}.created", self._created_path(key))
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def delete(self, key: str) -> None:
+        for path in (self.path(key), self._created_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _created_at(self, key: str, default: float) -> float:
+        try:
+            with open(self._created_path(key)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return default
+
+    def entries(self) -> list[tuple[str, int, float, float]]:
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(self.prefix) and name.endswith(self.suffix)):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            key = name[len(self.prefix) : len(name) - len(self.suffix)]
+            result.append((key, stat.st_size, self._created_at(key, stat.st_mtime), stat.st_mtime))
+        return result
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+
+class S3ImageStore(ImageStore):
+    """Image store backed by an S3-like client (get_object/put_object/delete_object/list_objects_v2)."""
+
+    def __init__(self, client: Any, bucket: str, prefix: str = "txt2img/"):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}.png"
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise e
+        return response["Body"]
+
+    def write(self, key: str, fileobj: BinaryIO) -> int:
+        start = fileobj.tell()
+        fileobj.seek(0, io.SEEK_END)
+        size = fileobj.tell() - start
+        fileobj.seek(start)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._object_key(key),
+            Body=fileobj,
+            ContentType="image/png",
+        )
+        return size
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def entries(self) -> list[tuple[str, int, float, float]]:
+        result = []
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            for obj in response.get("Contents", []):
+                key = obj["Key"][len(self.prefix) :].removesuffix(".png")
+                # Objects are written once and open() doesn't touch them
+                modified = obj["LastModified"].timestamp()
+                result.append((key, obj["Size"], modified, modified))
+            if not response.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+        return result
+
+
+class LocalS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client used by S3ImageStore."""
+
+    def __init__(self):
+        self.objects: dict[tuple[str, str], tuple[bytes, datetime]] = {}
+
+    def get_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+        data, _ = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs: Any) -> dict[str, Any]:
+        data = Body if isinstance(Body, bytes) else Body.read()
+        self.objects[(Bucket, Key)] = (data, datetime.now(timezone.utc))
+        return {}
+
+    def delete_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", **kwargs: Any) -> dict[str, Any]:
+        contents = [
+            {"Key": key, "Size": len(data), "LastModified": modified}
+            for (bucket, key), (data, modified) in sorted(self.objects.items())
+            if bucket == Bucket and key.startswith(Prefix)
+        ]
+        return {"Contents": contents, "IsTruncated": False}
+
+
+class ImageCache:
+    """
+    LRU cache of generated images on top of an ImageStore.
+    Entries written more than `max_age` seconds ago are dropped, then the least recently used ones until the total size fits `max_bytes`.
+    """
+
+    def __init__(self, store: ImageStore, max_bytes: int = 256 * 1024 * 1024, max_age: float = 7 * 24 * 3600):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index: Optional[OrderedDict[str, tuple[int, float]]] = None
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> OrderedDict[str, tuple[int, float]]:
+        # key -> (size, created_at); ordered from least to most recently used
+        if self._index is None:
+            self._index = OrderedDict(
+                (key, (size, created_at))
+                for key, size, created_at, _ in sorted(self.store.entries(), key=lambda e: e[3])
+            )
+        return self._index
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.max_age
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Return a readable file for a cached image, or None on a miss."""
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is not None and self._expired(entry[1]):
+                self._evict(key)
+                entry = None
+            fileobj = self.store.open(key) if entry is not None else None
+            if fileobj is None:
+                index.pop(key, None)
+                self.misses += 1
+                return None
+            index.move_to_end(key)
+            self.hits += 1
+            return fileobj
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Like open(), but return a local path when the store keeps images on disk."""
+        fileobj = self.open(key)
+        if fileobj is None:
+            return None
+        fileobj.close()
+        return self.store.local_path(key)
+
+    def put(self, key: str, fileobj: BinaryIO) -> None:
+        with self._lock:
+            index = self._load_index()
+            size = self.store.write(key, fileobj)
+            index[key] = (size, time.time())
+            index.move_to_end(key)
+            self._enforce_limits()
+
+    def _evict(self, key: str) -> None:
+        self.store.delete(key)
+        self._load_index().pop(key, None)
+        self.evictions += 1
+
+    def _enforce_limits(self) -> None:
+        index = self._load_index()
+        for key, (_, created_at) in list(index.items()):
+            if self._expired(created_at):
+                self._evict(key)
+        total = sum(size for size, _ in index.values())
+        while total > self.max_bytes and len(index) > 1:
+            key, (size, _) = next(iter(index.items()))
+            self._evict(key)
+            total -= size
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            index = self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(index),
+                "bytes": sum(size for size, _ in index.values()),
+            }
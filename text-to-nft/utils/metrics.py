@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+NAMESPACE = "TextToNFT"
+# CloudWatch EMF limits per log line
+MAX_METRICS_PER_DOCUMENT = 100
+MAX_VALUES_PER_METRIC = 100
+
+Sink = Callable[[dict[str, Any]], None]
+
+
+def stdout_sink(document: dict[str, Any]) -> None:
+    # Lambda ships stdout to CloudWatch Logs, which extracts EMF documents into metrics
+    print(json.dumps(document, separators=(",", ":")))
+
+
+class MemoryCollector:
+    """Sink that keeps every emitted document, for tests and local runs."""
+
+    def __init__(self):
+        self.documents: list[dict[str, Any]] = []
+
+    def __call__(self, document: dict[str, Any]) -> None:
+        self.documents.append(document)
+
+    def values(self, name: str) -> list[float]:
+        values: list[float] = []
+        for document in self.documents:
+            if name in document:
+                values.extend(document[name])
+        return values
+
+    def total(self, name: str) -> float:
+        return sum(self.values(name))
+
+
+class Metrics:
+    """
+    Buffers timers, gauges and counters and writes them as CloudWatch Embedded Metric Format
+    documents on flush(). Timers and gauges keep every sample (so CloudWatch can compute p99
+    and maximums); counters are summed per flush. Safe to use from several threads.
+    """
+
+    def __init__(
+        self,
+        namespace: str = NAMESPACE,
+        dimensions: Optional[dict[str, str]] = None,
+        sink: Sink = stdout_sink,
+    ):
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._timers: dict[str, list[float]] = {}
+        self._counters: dict[str, tuple[float, str]] = {}
+        self._gauges: dict[str, tuple[list[float], str]] = {}
+        self._properties: dict[str, Any] = {}
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Record the wall time of the block in milliseconds, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name: str, milliseconds: float) -> None:
+        with self._lock:
+            self._timers.setdefault(name, []).append(milliseconds)
+
+    def count(self, name: str, value: float = 1, unit: str = "Count") -> None:
+        with self._lock:
+            total, _ = self._counters.get(name, (0, unit))
+            self._counters[name] = (total + value, unit)
+
+    def gauge(self, name: str, value: float, unit: str = "Count") -> None:
+        """Sample a level, e.g. a queue depth, each time it changes."""
+        with self._lock:
+            values, _ = self._gauges.setdefault(name, ([], unit))
+            values.append(value)
+
+    def set_property(self, key: str, value: Any) -> None:
+        """Attach searchable context (e.g. a request id) to the next flushed documents."""
+        with self._lock:
+            self._properties[key] = value
+
+    def flush(self) -> None:
+        with self._lock:
+            series = [(name, "Milliseconds", values) for name, values in self._timers.items()]
+            series += [(name, unit, values) for name, (values, unit) in self._gauges.items()]
+            series += [(name, unit, [total]) for name, (total, unit) in self._counters.items()]
+            properties = self._properties
+            self._timers = {}
+            self._gauges = {}
+            self._counters = {}
+            self._properties = {}
+
+        # Split into documents holding at most 100 metrics with at most 100 values each
+        chunks = [
+            (name, unit, values[i : i + MAX_VALUES_PER_METRIC])
+            for name, unit, values in series
+            for i in range(0, len(values), MAX_VALUES_PER_METRIC)
+        ]
+        while chunks:
+            document_chunks: list[tuple[str, str, list[float]]] = []
+            names: set[str] = set()
+            rest = []
+            for chunk in chunks:
+                if chunk[0] in names or len(document_chunks) == MAX_METRICS_PER_DOCUMENT:
+                    rest.append(chunk)
+                else:
+                    names.add(chunk[0])
+                    document_chunks.append(chunk)
+            chunks = rest
+            self.sink(self._document(document_chunks, properties))
+
+    def _document(
+        self, chunks: list[tuple[str, str, list[float]]], properties: dict[str, Any]
+    ) -> dict[str, Any]:
+        document: dict[str, Any] = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [sorted(self.dimensions)],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit, _ in chunks],
+                    }
+                ],
+            },
+            **properties,
+            **self.dimensions,
+        }
+        for name, _, values in chunks:
+            document[name] = values
+        return document
+
+
+# Process-wide registry; handlers flush it at the end of every invocation
+metrics = Metrics(
+    namespace=os.getenv("METRICS_NAMESPACE", NAMESPACE),
+    dimensions={"Service": os.getenv("METRICS_SERVICE", "text-to-nft")},
+)
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+from utils.metrics import metrics
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable[..., Any]
+    deps: tuple[str, ...]
+
+
+class Pipeline:
+    """
+    Runs a graph of blocking stages on a thread pool. Each stage starts as soon as all of its
+    dependencies have finished and is called with their results as keyword arguments.
+    The first failing stage cancels everything not yet started and its exception is re-raised.
+    `limits` maps stage names to semaphores shared between pipelines, bounding how many
+    instances of that stage run at once across the whole process.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        limits: Optional[dict[str, threading.Semaphore]] = None,
+    ):
+        self.max_workers = max_workers
+        self.limits = limits or {}
+        self.stages: dict[str, Stage] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: tuple[str, ...] = ()) -> "Pipeline":
+        if name in self.stages:
+            raise Exception(f"Duplicate stage: {name}")
+        self.stages[name] = Stage(name, fn, tuple(deps))
+        return self
+
+    def _check(self) -> None:
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise Exception(f"Stage {stage.name} depends on unknown stage {dep}")
+        # Kahn's algorithm: every stage must be reachable without a cycle
+        remaining = {name: set(stage.deps) for name, stage in self.stages.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise Exception(f"Cycle between stages: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _call(self, stage: Stage, kwargs: dict[str, Any]) -> Any:
+        limit = self.limits.get(stage.name)
+        if limit is None:
+            with metrics.timer(f"stage_{stage.name}"):
+                return stage.fn(**kwargs)
+        # Time spent queued behind the limit is reported separately from the stage itself
+        with metrics.timer(f"stage_{stage.name}_wait"):
+            limit.acquire()
+        try:
+            with metrics.timer(f"stage_{stage.name}"):
+                return stage.fn(**kwargs)
+        finally:
+            limit.release()
+
+    def _needed(self, completed: dict[str, Any]) -> set[str]:
+        # Stages nothing depends on are the outputs; walk back from them, stopping at completed ones
+        dependents = {dep for stage in self.stages.values() for dep in stage.deps}
+        stack = [name for name in self.stages if name not in dependents]
+        needed: set[str] = set()
+        while stack:
+            name = stack.pop()
+            if name in needed or name in completed:
+                continue
+            needed.add(name)
+            stack.extend(self.stages[name].deps)
+        return needed
+
+    def run(
+        self,
+        completed: Optional[dict[str, Any]] = None,
+        on_result: Optional[Callable[[str, Any], None]] = None,
+    ) -> dict[str, Any]:
+        """
+        Run every stage and return {stage name: result}.
+        Stages in `completed` are not run again and their recorded results are used instead;
+        stages only needed to produce those are skipped (and missing from the results).
+        `on_result(name, result)` is called from the calling thread as each stage finishes.
+        """
+        self._check()
+        results: dict[str, Any] = dict(completed or {})
+        running: dict[Future, str] = {}
+        pending = {name: self.stages[name] for name in self._needed(results)}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while pending or running:
+                    for name, stage in list(pending.items()):
+                        if all(dep in results for dep in stage.deps):
+                            kwargs = {dep: results[dep] for dep in stage.deps}
+                            running[executor.submit(self._call, stage, kwargs)] = name
+                            del pending[name]
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        results[name] = future.result()
+                        if on_result is not None:
+                            on_result(name, results[name])
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                # Stages already running can't be stopped; still report what they produce
+                if on_result is not None:
+                    for future, name in running.items():
+                        if not future.cancelled() and future.exception() is None:
+                            on_result(name, future.result())
+                raise
+        return results
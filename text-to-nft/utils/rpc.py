@@ -0,0 +1,385 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional, Tuple, Type
+import httpx
+from solana.exceptions import SolanaRpcException, handle_exceptions
+from solana.rpc.api import Client
+from solana.rpc.commitment import Commitment
+from solana.rpc.providers.core import T, _after_request_unparsed, _parse_raw
+from solana.rpc.providers.http import HTTPProvider
+from solders.rpc.requests import Body
+from utils.metrics import metrics
+
+
+# Latency/error smoothing and the error rate at which an endpoint is taken out of rotation
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 100
+UNHEALTHY_ERROR_RATE = 0.5
+UNHEALTHY_COOLDOWN = 10
+# A hedged read goes to a second endpoint once the first is slower than this percentile of its latency
+HEDGE_PERCENTILE = float(os.getenv("SOLANA_RPC_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 10
+HEDGE_DEFAULT_DELAY = float(os.getenv("SOLANA_RPC_HEDGE_DELAY", "0.5"))
+HEDGE_MIN_DELAY = 0.05
+# sendTransaction goes to this many endpoints at once
+SEND_FANOUT = int(os.getenv("SOLANA_RPC_SEND_FANOUT", "3"))
+# Idempotent reads worth duplicating when the first endpoint is slow
+HEDGED_METHODS = frozenset(
+    {
+        "getAccountInfo",
+        "getMultipleAccounts",
+        "getSignatureStatuses",
+        "getBalance",
+        "getBlockHeight",
+        "getLatestBlockhash",
+        "getMinimumBalanceForRentExemption",
+        "getRecentPrioritizationFees",
+        "getTransaction",
+    }
+)
+
+
+def endpoint_urls(api_endpoint: str) -> list[str]:
+    """An `api_endpoint` may list several RPC URLs separated by commas."""
+    return [url.strip() for url in api_endpoint.split(",") if url.strip()]
+
+
+def rpc_method(body: Body) -> str:
+    # solders request classes are named after the method: GetLatestBlockhash -> getLatestBlockhash
+    name = type(body).__name__
+    return name[0].lower() + name[1:]
+
+
+class RPCError(Exception):
+    """A JSON-RPC error response, raised before solders tries to parse it."""
+
+    def __init__(self, method: str, code: int, message: str, data: Any = None):
+        super().__init__(f"{method} failed ({code}): {message}" + (f" {data}" if data else ""))
+        self.method = method
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def raise_for_error(body: Body, raw: str) -> None:
+    # solders panics on error codes it doesn't model, so errors are surfaced here instead
+    if '"error"' not in raw:
+        return
+    response = json.loads(raw)
+    error = response.get("error") if isinstance(response, dict) else None
+    if error:
+        raise RPCError(rpc_method(body), error.get("code"), error.get("message", ""), error.get("data"))
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider that sends every request through a shared httpx.Client, so calls reuse
+    keep-alive connections instead of opening one per request like the module-level httpx.post.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        http: httpx.Client,
+        on_call: Optional[Callable[[str], None]] = None,
+        extra_headers: Optional[dict[str, str]] = None,
+    ):
+        # Timeouts are configured on the shared httpx.Client
+        super().__init__(endpoint, extra_headers=extra_headers)
+        self.http = http
+        self.on_call = on_call
+
+    def _record(self, *bodies: Body) -> None:
+        if self.on_call is not None:
+            for body in bodies:
+                self.on_call(rpc_method(body))
+
+    @handle_exceptions(SolanaRpcException, httpx.HTTPError)
+    def make_request(self, body: Body, parser: Type[T]) -> T:
+        raw = self.make_request_unparsed(body)
+        raise_for_error(body, raw)
+        return _parse_raw(raw, parser=parser)
+
+    def make_request_unparsed(self, body: Body) -> str:
+        self._record(body)
+        return _after_request_unparsed(self.http.post(**self._before_request(body=body)))
+
+    def make_batch_request_unparsed(self, reqs: Tuple[Body, ...]) -> str:
+        self._record(*reqs)
+        return _after_request_unparsed(self.http.post(**self._before_batch_request(reqs)))
+
+    def is_connected(self) -> bool:
+        try:
+            response = self.http.get(self.health_uri)
+            response.raise_for_status()
+        except (IOError, httpx.HTTPError) as err:
+            self.logger.error("Health check failed with error: %s", str(err))
+            return False
+        return response.status_code == httpx.codes.OK
+
+
+class EndpointStats:
+    """EWMA latency and error rate of one endpoint, plus recent latencies for percentiles."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=LATENCY_WINDOW)
+        self.failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * (0 if ok else 1)
+            if ok:
+                self.samples.append(seconds)
+                self.latency = seconds if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * seconds
+            else:
+                self.failed_at = time.monotonic()
+
+    def healthy(self) -> bool:
+        # An unhealthy endpoint gets traffic again after a cooldown, to find out whether it recovered
+        return self.error_rate < UNHEALTHY_ERROR_RATE or time.monotonic() - self.failed_at > UNHEALTHY_COOLDOWN
+
+    def score(self) -> float:
+        # Unmeasured endpoints score low so each gets tried early; errors cost up to a second
+        return (self.latency or 0.0) * (1 + self.error_rate) + self.error_rate
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rpc")
+        return _executor
+
+
+class EndpointPool(HTTPProvider):
+    """
+    Provider spreading requests over several RPC endpoints. Reads go to the fastest healthy
+    endpoint and fail over to the next one; HEDGED_METHODS are also sent to the runner-up when
+    the first answer is slower than its HEDGE_PERCENTILE latency. sendTransaction is fanned
+    out to SEND_FANOUT endpoints and the first acceptance wins.
+    """
+
+    def __init__(self, providers: list[PooledHTTPProvider], send_fanout: int = SEND_FANOUT):
+        super().__init__(providers[0].endpoint_uri)
+        self.providers = providers
+        self.stats = {provider.endpoint_uri: EndpointStats(provider.endpoint_uri) for provider in providers}
+        self.send_fanout = send_fanout
+
+    def ranked(self) -> list[PooledHTTPProvider]:
+        """Healthy endpoints fastest first, then unhealthy ones as a last resort."""
+        return sorted(
+            self.providers,
+            key=lambda provider: (
+                not self.stats[provider.endpoint_uri].healthy(),
+                self.stats[provider.endpoint_uri].score(),
+            ),
+        )
+
+    def _timed(self, provider: PooledHTTPProvider, call: Callable[[], Any]) -> Any:
+        stats = self.stats[provider.endpoint_uri]
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            stats.record(time.perf_counter() - start, ok=False)
+            raise
+        stats.record(time.perf_counter() - start, ok=True)
+        return result
+
+    def _failover(self, call: Callable[[PooledHTTPProvider], Any]) -> Any:
+        errors: list[Exception] = []
+        for provider in self.ranked():
+            try:
+                return self._timed(provider, lambda: call(provider))
+            except Exception as e:
+                errors.append(e)
+                metrics.count("rpc_failovers")
+        raise errors[0]
+
+    def _hedge_delay(self, provider: PooledHTTPProvider) -> float:
+        threshold = self.stats[provider.endpoint_uri].percentile(HEDGE_PERCENTILE)
+        return max(HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY if threshold is None else threshold)
+
+    def _hedged(self, body: Body, parser: Type[T]) -> T:
+        ranked = self.ranked()
+        executor = _get_executor()
+
+        def submit(provider: PooledHTTPProvider) -> Future:
+            return executor.submit(self._timed, provider, lambda: provider.make_request(body, parser))
+
+        pending = {submit(ranked[0])}
+        remaining = ranked[1:]
+        delay = self._hedge_delay(ranked[0])
+        errors: list[Exception] = []
+        while pending:
+            done, pending = wait(pending, timeout=delay if remaining else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+            if not remaining:
+                continue
+            if not done:
+                metrics.count("rpc_hedges")
+                pending.add(submit(remaining.pop(0)))
+            elif not pending:
+                metrics.count("rpc_failovers")
+                pending.add(submit(remaining.pop(0)))
+        raise errors[0]
+
+    def _fan_out(self, body: Body, parser: Type[T]) -> T:
+        executor = _get_executor()
+        futures = [
+            executor.submit(self._timed, provider, lambda provider=provider: provider.make_request(body, parser))
+            for provider in self.ranked()[: self.send_fanout]
+        ]
+        # Report the best-ranked endpoint's error if none accepted it
+        errors: dict[Future, Exception] = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors[future] = future.exception()
+        raise next(errors[future] for future in futures)
+
+    def make_request(self, body: Body, parser: Type[T]) -> T:
+        method = rpc_method(body)
+        if len(self.providers) > 1:
+            if method in ("sendRawTransaction", "sendLegacyTransaction", "sendTransaction"):
+                return self._fan_out(body, parser)
+            if method in HEDGED_METHODS:
+                return self._hedged(body, parser)
+        return self._failover(lambda provider: provider.make_request(body, parser))
+
+    def make_request_unparsed(self, body: Body) -> str:
+        return self._failover(lambda provider: provider.make_request_unparsed(body))
+
+    def make_batch_request_unparsed(self, reqs: Tuple[Body, ...]) -> str:
+        return self._failover(lambda provider: provider.make_batch_request_unparsed(reqs))
+
+    def is_connected(self) -> bool:
+        return any(provider.is_connected() for provider in self.providers)
+
+
+class RPCRegistry:
+    """
+    Process-wide Solana clients, one per (endpoint, commitment), all sharing one pooled
+    httpx.Client. Counts calls per RPC method so chatty paths show up in metrics.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: float = 10,
+        connect_timeout: float = 5,
+        keepalive_expiry: float = 30,
+    ):
+        self.http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+        self._clients: dict[tuple[str, Optional[Commitment]], Client] = {}
+        self._providers: dict[str, PooledHTTPProvider] = {}
+        self._pools: dict[str, EndpointPool] = {}
+        self._calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _on_call(self, method: str) -> None:
+        with self._lock:
+            self._calls[method] += 1
+        metrics.count("rpc_calls")
+        metrics.count(f"rpc_{method}")
+
+    def client(self, endpoint: str, commitment: Optional[Commitment] = None) -> Client:
+        """Client for `endpoint`; a comma-separated list of URLs gets an EndpointPool."""
+        key = (endpoint, commitment)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = Client(endpoint_urls(endpoint)[0], commitment)
+                # solana-py has no way to pass a provider in; the registry tests check it is used
+                client._provider = self._provider(endpoint)
+                self._clients[key] = client
+            return client
+
+    def provider(self, endpoint: str) -> HTTPProvider:
+        """
+        The provider every client of `endpoint` sends through, for RPC methods solana-py has
+        no Client method for: make_request_unparsed() with a body that has to_json().
+        """
+        with self._lock:
+            return self._provider(endpoint)
+
+    def _provider(self, endpoint: str) -> HTTPProvider:
+        urls = endpoint_urls(endpoint)
+        if len(urls) > 1:
+            return self._pool(endpoint, urls)
+        provider = self._providers.get(endpoint)
+        if provider is None:
+            provider = self._providers[endpoint] = PooledHTTPProvider(urls[0], self.http, self._on_call)
+        return provider
+
+    def _pool(self, endpoint: str, urls: list[str]) -> EndpointPool:
+        # Clients of every commitment share one pool, so they share its latency stats
+        pool = self._pools.get(endpoint)
+        if pool is None:
+            pool = self._pools[endpoint] = EndpointPool(
+                [PooledHTTPProvider(url, self.http, self._on_call) for url in urls]
+            )
+        return pool
+
+    def calls(self) -> dict[str, int]:
+        """RPC calls made so far, per method."""
+        with self._lock:
+            return dict(self._calls)
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._clients.clear()
+            self._providers.clear()
+            self._pools.clear()
+        self.http.close()
+
+
+rpc_registry = RPCRegistry(
+    pool_size=int(os.getenv("SOLANA_RPC_POOL_SIZE", "10")),
+    timeout=float(os.getenv("SOLANA_RPC_TIMEOUT", "10")),
+    connect_timeout=float(os.getenv("SOLANA_RPC_CONNECT_TIMEOUT", "5")),
+)
+
+
+def get_rpc_client(endpoint: str, commitment: Optional[Commitment] = None) -> Client:
+    return rpc_registry.client(endpoint, commitment)
+
+
+def get_rpc_provider(endpoint: str) -> HTTPProvider:
+    return rpc_registry.provider(endpoint)